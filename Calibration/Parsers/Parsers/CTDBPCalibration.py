@@ -4,11 +4,9 @@ import datetime
 import re
 import xml.etree.ElementTree as et
 import pandas as pd
-import string
 from zipfile import ZipFile
 import csv
-import PyPDF2
-from nltk.tokenize import word_tokenize
+from PDFExtractor import PDFExtractor
 
 
 class CTDBPCalibration():
@@ -21,6 +19,7 @@ class CTDBPCalibration():
         self.coefficients = {}
         self.date = {}
         self.source = ''
+        self.pdf_extractor = PDFExtractor()
 
         self.coefficient_name_map = {
             'TA0': 'CC_a0',
@@ -127,7 +126,8 @@ class CTDBPCalibration():
 
     def load_pdf(self, filepath):
         """
-        Open and load a pdf into a parseable dictionary.
+        Open and load a pdf into a parseable dictionary. The extracted text is
+        cached on disk by file hash, so repeat loads do not re-decode the pdf.
 
         Args:
             filepath: full directory path with filename
@@ -135,26 +135,7 @@ class CTDBPCalibration():
         Returns:
             text: a dictionary with page numbers as keys and the pdf text as items
         """
-
-        # Open and read the pdf file
-        pdfFileObj = open(filepath, 'rb')
-        # Create a reader to be parsed
-        pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
-        # Now, enumerate through the pdf and decode the text
-        num_pages = pdfReader.numPages
-        count = 0
-        text = {}
-
-        while count < num_pages:
-            pageObj = pdfReader.getPage(count)
-            count = count + 1
-            text.update({count: pageObj.extractText()})
-
-        # Run a check that text was actually extracted
-        if len(text) == 0:
-            raise(IOError(f'No text was parsed from the pdf file {filepath}'))
-        else:
-            return text
+        return self.pdf_extractor.load_pages(filepath)
 
     def read_pdf(self, filepath):
         """
@@ -175,121 +156,44 @@ class CTDBPCalibration():
         """
         text = self.load_pdf(filepath)
 
-        for page_num in text.keys():
-            # Search for the temperature calibration data
-            if 'SBE 37 TEMPERATURE CALIBRATION DATA' in text[page_num]:
-                tokens = word_tokenize(text[page_num])
-                data = [word.lower() for word in tokens if not word in string.punctuation]
-                # Now, find and record the calibration date
-                if 'calibration' and 'date' in data:
-                    cal_ind = data.index('calibration')
-                    date_ind = data.index('date')
-                    # Run check they are in order
-                    if date_ind == cal_ind+1:
-                        date = pd.to_datetime(data[date_ind+1]).strftime('%Y%m%d')
-                        self.date.update({'TCAL': date})
-                    else:
-                        raise Exception(f"Can't locate temp calibration date.")
-                else:
-                    raise Exception(f"Can't locate temp calibration date.")
-
-                # Check for the serial number
-                if 'serial' and 'number' in data and len(self.serial) == 0:
-                    ser_ind = data.index('serial')
-                    num_ind = data.index('number')
-                    if num_ind == ser_ind+1:
-                        self.serial = data[num_ind+1]
-                    else:
-                        pass
-
-                # Now, get the calibration coefficients
-                for key in self.mo_coefficient_name_map.keys():
-                    if key in data:
-                        ind = data.index(key)
-                        self.coefficients.update({self.mo_coefficient_name_map[key]: data[ind+1]})
-                    else:
-                        pass
-
-            # Search for the conductivity calibration data
-            elif 'SBE 37 CONDUCTIVITY CALIBRATION DATA' in text[page_num]:
-                # tokenize the text data and extract only key words
-                tokens = word_tokenize(text[page_num])
-                data = [word.lower() for word in tokens if not word in string.punctuation]
-
-                # Now, find and record the calibration date
-                if 'calibration' and 'date' in data:
-                    cal_ind = data.index('calibration')
-                    date_ind = data.index('date')
-                    # Run check they are in order
-                    if date_ind == cal_ind+1:
-                        date = pd.to_datetime(data[date_ind+1]).strftime('%Y%m%d')
-                        self.date.update({'CCAL': date})
-                    else:
-                        raise Exception(f"Can't locate conductivity calibration date.")
-                else:
-                    raise Exception(f"Can't locate conductivity calibration date.")
-
-                # Check for the serial number
-                if 'serial' and 'number' in data and len(self.serial) == 0:
-                    ser_ind = data.index('serial')
-                    num_ind = data.index('number')
-                    if num_ind == ser_ind+1:
-                        self.serial = data[num_ind+1]
-                    else:
-                        pass
+        signatures = {
+            'SBE 37 TEMPERATURE CALIBRATION DATA': ('TCAL', 'temp'),
+            'SBE 37 CONDUCTIVITY CALIBRATION DATA': ('CCAL', 'conductivity'),
+            'SBE 37 PRESSURE CALIBRATION DATA': ('PCAL', 'pressure'),
+        }
+        pages = self.pdf_extractor.find_pages(text, signatures.keys())
+        cal_pages = set()
 
-                # Now, get the calibration coefficients
-                for key in self.mo_coefficient_name_map.keys():
-                    if key in data:
-                        ind = data.index(key)
-                        self.coefficients.update({self.mo_coefficient_name_map[key]: data[ind+1]})
-                    else:
-                        pass
-
-            elif 'SBE 37 PRESSURE CALIBRATION DATA' in text[page_num]:
-                # tokenize the text data and extract only key words
-                tokens = word_tokenize(text[page_num])
-                data = [word.lower() for word in tokens if not word in string.punctuation]
+        for signature, (date_key, sensor) in signatures.items():
+            for page_num in pages[signature]:
+                if page_num in cal_pages:
+                    continue
+                cal_pages.add(page_num)
+                page = text[page_num]
 
                 # Now, find and record the calibration date
-                if 'calibration' and 'date' in data:
-                    cal_ind = data.index('calibration')
-                    date_ind = data.index('date')
-                    # Run check they are in order
-                    if date_ind == cal_ind+1:
-                        date = pd.to_datetime(data[date_ind+1]).strftime('%Y%m%d')
-                        self.date.update({'PCAL': date})
-                    else:
-                        raise Exception(f"Can't locate pressure calibration date.")
-                else:
-                    raise Exception(f"Can't locate pressure calibration date.")
+                date = self.pdf_extractor.parse_date(page)
+                if date is None:
+                    raise Exception(f"Can't locate {sensor} calibration date.")
+                self.date.update({date_key: pd.to_datetime(date).strftime('%Y%m%d')})
 
                 # Check for the serial number
-                if 'serial' and 'number' in data and len(self.serial) == 0:
-                    ser_ind = data.index('serial')
-                    num_ind = data.index('number')
-                    if num_ind == ser_ind+1:
-                        self.serial = data[num_ind+1]
-                    else:
-                        pass
+                serial = self.pdf_extractor.parse_serial(page)
+                if serial is not None and len(self.serial) == 0:
+                    self.serial = serial.lower()
 
                 # Now, get the calibration coefficients
-                for key in self.mo_coefficient_name_map.keys():
-                    if key in data:
-                        ind = data.index(key)
-                        self.coefficients.update({self.mo_coefficient_name_map[key]: data[ind+1]})
-                    else:
-                        pass
-
-            # Now check for other important information
-            else:
-                tokens = word_tokenize(text[page_num])
-                data = [word.lower() for word in tokens if not word in string.punctuation]
+                values = self.pdf_extractor.parse_values(page, self.mo_coefficient_name_map.keys())
+                for key, value in values.items():
+                    self.coefficients.update({self.mo_coefficient_name_map[key]: value})
 
-                # Now, find the sensor rating
-                if 'sensor' and 'rating' in data:
-                    ind = data.index('rating')
-                    self.coefficients.update({self.mo_coefficient_name_map['prange']: data[ind+1]})
+        # Now check for other important information, such as the sensor rating
+        for page_num in text.keys():
+            if page_num in cal_pages:
+                continue
+            rating = self.pdf_extractor.parse_rating(text[page_num])
+            if rating is not None:
+                self.coefficients.update({self.mo_coefficient_name_map['prange']: rating})
 
     def read_cal(self, data):
         """
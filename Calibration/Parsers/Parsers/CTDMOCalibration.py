@@ -1,7 +1,7 @@
 import re
 import pandas as pd
 import numpy as np
-import textract
+from PDFExtractor import PDFExtractor
 
 
 class CTDMOCalibration():
@@ -13,6 +13,7 @@ class CTDMOCalibration():
         self.ctd_type = uid
         self.coefficients = {}
         self.date = {}
+        self.pdf_extractor = PDFExtractor()
 
         # Name mapping for the MO-type CTDs (when reading from pdfs)
         self.mo_coefficient_name_map = {
@@ -90,17 +91,19 @@ class CTDMOCalibration():
                 coefficient names as keys and values as items
         """
 
-        text = textract.process(filepath, encoding='utf-8')
-        text = text.decode('utf-8')
+        text = self.pdf_extractor.load_pages(filepath, method='textract')
 
-        if 'PRESSURE CALIBRATION DATA' in text:
-            self.mo_parse_p(filepath)
+        signatures = ['PRESSURE CALIBRATION DATA', 'TEMPERATURE CALIBRATION DATA',
+                      'CONDUCTIVITY CALIBRATION DATA']
+        pages = self.pdf_extractor.find_pages(text, signatures)
 
-        elif 'TEMPERATURE CALIBRATION DATA' or 'CONDUCTIVITY CALIBRATION DATA' in text:
-            self.mo_parse_ts(text)
+        if len(pages['PRESSURE CALIBRATION DATA']) > 0:
+            self.mo_parse_p(filepath)
 
         else:
-            pass
+            for page_num in sorted(set(pages['TEMPERATURE CALIBRATION DATA'] +
+                                       pages['CONDUCTIVITY CALIBRATION DATA'])):
+                self.mo_parse_ts(text[page_num])
 
     def mo_parse_ts(self, text):
         """
@@ -162,9 +165,7 @@ class CTDMOCalibration():
         """
 
         # Now, can reprocess using tesseract-ocr rather than pdftotext
-        ptext = textract.process(filepath, method='tesseract', encoding='utf-8')
-        ptext = ptext.replace(b'\xe2\x80\x94', b'-')
-        ptext = ptext.decode('utf-8')
+        ptext = self.pdf_extractor.load_pages(filepath, method='tesseract')[1]
         keys = list(self.mo_coefficient_name_map.keys())
 
         # Get the calibration date:
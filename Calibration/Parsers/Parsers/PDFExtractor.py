@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+import os
+import re
+import json
+import hashlib
+import PyPDF2
+
+
+class PDFExtractor():
+    """
+    Class which extracts, caches, and parses the text of vendor calibration
+    pdfs. The extracted text of each pdf is cached on disk by the hash of the
+    pdf file, so a given pdf only has to be decoded once no matter how many
+    times it is parsed.
+    """
+
+    # Regex patterns for the header information on the vendor calibration sheets
+    date_pattern = re.compile(r'CALIBRATION\s+DATE\s*:?\s*([0-9A-Za-z\-/]+)', re.IGNORECASE)
+    serial_pattern = re.compile(r'SERIAL\s+NUMBER\s*:?\s*([0-9A-Za-z\-]+)', re.IGNORECASE)
+    rating_pattern = re.compile(r'SENSOR\s+RATING\s*:?\s*([0-9.]+)', re.IGNORECASE)
+
+    # Regex for a numeric value (e.g. 1450, -1.234e-04, 2.5E+000)
+    number = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = '/'.join((os.getcwd(), 'temp', 'pdf_text'))
+        self.cache_dir = cache_dir
+        self._patterns = {}
+
+    @staticmethod
+    def file_hash(filepath):
+        """
+        Return the sha256 hash of the contents of a file.
+
+        Args:
+            filepath: full directory path with filename
+
+        Returns:
+            digest: hex digest of the file contents
+        """
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def cache_path(self, filepath, method):
+        """Return the path of the cached text for a pdf file and extraction method"""
+        return '/'.join((self.cache_dir, f'{self.file_hash(filepath)}_{method}.json'))
+
+    def extract_pypdf2(self, filepath):
+        """
+        Extract the text of each page of a pdf with PyPDF2.
+
+        Args:
+            filepath: full directory path with filename
+
+        Returns:
+            text: a dictionary with page numbers as keys and the pdf text as items
+        """
+        text = {}
+        with open(filepath, 'rb') as pdfFileObj:
+            pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
+            for count in range(pdfReader.numPages):
+                text.update({count+1: pdfReader.getPage(count).extractText()})
+        return text
+
+    def extract_textract(self, filepath, method=None):
+        """
+        Extract the text of a pdf with textract. The full document is returned
+        as a single page since textract does not split the text by page.
+
+        Args:
+            filepath: full directory path with filename
+            method: the textract extraction method (e.g. 'tesseract'). Defaults
+                to None, which uses the textract default (pdftotext)
+
+        Returns:
+            text: a dictionary with the document text stored under page 1
+        """
+        import textract
+
+        if method is None:
+            text = textract.process(filepath, encoding='utf-8')
+        else:
+            text = textract.process(filepath, method=method, encoding='utf-8')
+        text = text.replace(b'\xe2\x80\x94', b'-').decode('utf-8')
+        return {1: text}
+
+    def load_pages(self, filepath, method='pypdf2'):
+        """
+        Load the text of a pdf, using the on-disk cache when the same file (by
+        content hash) has already been extracted with the same method.
+
+        Args:
+            filepath: full directory path with filename
+            method: which extractor to use; one of 'pypdf2', 'textract', or
+                'tesseract'
+
+        Raises:
+            IOError: if no text could be extracted from the pdf
+
+        Returns:
+            text: a dictionary with page numbers as keys and the pdf text as items
+        """
+        cache_file = self.cache_path(filepath, method)
+        if os.path.exists(cache_file):
+            with open(cache_file) as file:
+                return {int(page): text for page, text in json.load(file).items()}
+
+        if method == 'pypdf2':
+            text = self.extract_pypdf2(filepath)
+        elif method == 'textract':
+            text = self.extract_textract(filepath)
+        elif method == 'tesseract':
+            text = self.extract_textract(filepath, method='tesseract')
+        else:
+            raise ValueError(f'Unknown pdf extraction method {method}')
+
+        if len(text) == 0 or not any(text.values()):
+            raise(IOError(f'No text was parsed from the pdf file {filepath}'))
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        with open(cache_file, 'w') as file:
+            json.dump(text, file)
+
+        return text
+
+    def find_pages(self, text, signatures):
+        """
+        Locate the pages which contain each of the given keyword signatures.
+
+        Args:
+            text: dictionary of page numbers and page text from load_pages
+            signatures: list of keyword strings (e.g. 'TEMPERATURE CALIBRATION DATA')
+
+        Returns:
+            pages: a dictionary with the signatures as keys and a list of the
+                page numbers which contain the signature as items
+        """
+        pages = {signature: [] for signature in signatures}
+        for page_num, page in text.items():
+            for signature in signatures:
+                if signature in page:
+                    pages[signature].append(page_num)
+        return pages
+
+    def key_pattern(self, keys):
+        """Return the compiled key/value regex for a set of coefficient names"""
+        keys = tuple(sorted(set(keys), key=len, reverse=True))
+        if keys not in self._patterns:
+            names = '|'.join(re.escape(key) for key in keys)
+            self._patterns[keys] = re.compile(
+                r'(?<![A-Za-z0-9])(' + names + r')\s*[=:]?\s*(' + self.number + r')(?![0-9A-Za-z])',
+                re.IGNORECASE)
+        return self._patterns[keys]
+
+    def parse_values(self, text, keys):
+        """
+        Parse the coefficient values following each of the keys in a block of
+        text. Only the first occurrence of each key is kept.
+
+        Args:
+            text: the text to parse
+            keys: the (case-insensitive) coefficient names to search for
+
+        Returns:
+            values: a dictionary with the lowercase key names as keys and the
+                parsed values as items
+        """
+        values = {}
+        for match in self.key_pattern(keys).finditer(text):
+            key = match.group(1).lower()
+            if key not in values:
+                values.update({key: match.group(2)})
+        return values
+
+    def parse_date(self, text):
+        """Return the calibration date string from the text, or None if not found"""
+        match = self.date_pattern.search(text)
+        return match.group(1) if match is not None else None
+
+    def parse_serial(self, text):
+        """Return the serial number string from the text, or None if not found"""
+        match = self.serial_pattern.search(text)
+        return match.group(1) if match is not None else None
+
+    def parse_rating(self, text):
+        """Return the pressure sensor rating from the text, or None if not found"""
+        match = self.rating_pattern.search(text)
+        return match.group(1) if match is not None else None
@@ -406,25 +406,6 @@ def get_data_availability(erd, days):
 # ## UFrame Data Availability
 
 import yaml
-import datetime
-
-# +
-# Specify some functions to convert timestamps
-ntp_epoch = datetime.datetime(1900, 1, 1)
-unix_epoch = datetime.datetime(1970, 1, 1)
-ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-def ntp_seconds_to_datetime(ntp_seconds):
-    return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microsecond=0)
-  
-def convert_time(ms):
-    if ms is None:
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
-
-
-# -
 
 # Function to make an API request and print the results
 def get_and_print_api(url):
@@ -1,28 +1,16 @@
-import datetime
 import os
+import sys
 import re
 import requests
 import numpy as np
 import pandas as pd
 import xarray as xr
 
-
-def ntp_seconds_to_datetime(ntp_seconds):
-    # Set some constants needed for time conversion
-    ntp_epoch = datetime.datetime(1900, 1, 1)
-    unix_epoch = datetime.datetime(1970, 1, 1)
-    ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-    # Convert the datetime
-    dt = datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microseconds=0)
-    return dt
-
-
-def convert_time(ms):
-    if ms is None:
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
+# The OOI time conversions are shared across the repository
+ROOT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+if ROOT_DIRECTORY not in sys.path:
+    sys.path.append(ROOT_DIRECTORY)
+from ooi_time import ms_to_datetime64
 
 
 def get_and_print_api(url, username, token):
@@ -454,22 +442,6 @@ class OOINet():
         return data
     
     
-    def _ntp_seconds_to_datetime(self, ntp_seconds):
-        """Convert OOINet timestamps to unix-convertable timestamps."""
-        # Specify some constant needed for timestamp conversions
-        ntp_epoch = datetime.datetime(1900, 1, 1)
-        unix_epoch = datetime.datetime(1970, 1, 1)
-        ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-        
-        return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta)
-    
-    
-    def _convert_time(self, ms):
-        if ms is None:
-            return None
-        else:
-            return datetime.datetime.utcfromtimestamp(ms/1000)
-    
     def get_metadata(self, refdes):
         """
         Get the OOI Metadata for a specific instrument specified by its associated
@@ -547,6 +519,7 @@ class OOINet():
 
         # Now, iterate over the deployment list and get the associated data for
         # each individual deployment
+        rows = []
         while len(deployments) > 0:
             # Get a single deployment
             deployment = deployments.pop()
@@ -559,9 +532,9 @@ class OOINet():
             location = deployment.get("location")
             depth, lat, lon = location["depth"], location["latitude"], location["longitude"]
 
-            # Start and end times of the deployments
-            startTime = self._convert_time(deployment.get("eventStartTime"))
-            stopTime = self._convert_time(deployment.get("eventStopTime"))
+            # Start and end times of the deployments, in milliseconds
+            startTime = deployment.get("eventStartTime")
+            stopTime = deployment.get("eventStopTime")
 
             # Cruise IDs of the deployment and recover cruises
             deployCruiseInfo = deployment.get("deployCruiseInfo")
@@ -576,15 +549,14 @@ class OOINet():
             else:
                 recoverID = None
 
-            # Put the data into a pandas dataframe
-            data = np.array([[refdes, deploymentNumber, sensorUID, lat, lon, depth, startTime, stopTime, deployID, recoverID]])
-            columns = ["refdes","deploymentNumber","sensorUID","latitude","longitude","depth","deployStart","deployEnd","deployCruise","recoverCruise"]
-            df = pd.DataFrame(data=data, columns=columns)
-            
-            # Add the reference desi
+            rows.append((refdes, deploymentNumber, sensorUID, lat, lon, depth, startTime, stopTime, deployID, recoverID))
 
-            # 
-            results = results.append(df)
+        # Put the data into a pandas dataframe, converting the deployment times at once
+        columns = ["refdes","deploymentNumber","sensorUID","latitude","longitude","depth","deployStart","deployEnd","deployCruise","recoverCruise"]
+        df = pd.DataFrame(data=rows, columns=columns)
+        df["deployStart"] = ms_to_datetime64(df["deployStart"])
+        df["deployEnd"] = ms_to_datetime64(df["deployEnd"])
+        results = results.append(df)
 
         return results
     
@@ -1,4 +1,3 @@
-import datetime
 import os
 import re
 import requests
@@ -7,24 +6,6 @@ import pandas as pd
 import xarray as xr
 
 
-def ntp_seconds_to_datetime(ntp_seconds):
-    # Set some constants needed for time conversion
-    ntp_epoch = datetime.datetime(1900, 1, 1)
-    unix_epoch = datetime.datetime(1970, 1, 1)
-    ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-    # Convert the datetime
-    dt = datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microseconds=0)
-    return dt
-
-
-def convert_time(ms):
-    if ms is None:
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
-
-
 def get_and_print_api(url, username, token):
     # Request the api output
     r = requests.get(url, auth=(username, token))
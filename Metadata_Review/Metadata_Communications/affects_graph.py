@@ -0,0 +1,331 @@
+import os
+import re
+import ast
+import hashlib
+from collections import namedtuple
+from numbers import Number
+import numpy as np
+import pandas as pd
+
+
+AffectedParameter = namedtuple('AffectedParameter', ['id', 'name'])
+
+
+def preload_version(csv_dir, files=('ParameterDefs.csv', 'ParameterDictionary.csv')):
+    """
+    Identify a version of the preload-database by the contents of the
+    csvs which define the parameters and streams.
+
+    Args:
+        csv_dir - path to the csv directory of the preload-database
+        files - the preload csvs which the affects graph is built from
+    Returns:
+        version - a short sha256 hash of the csv contents
+    """
+    sha = hashlib.sha256()
+    for file in files:
+        with open(os.path.join(csv_dir, file), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()[:16]
+
+
+def parse_function_map(pmap):
+    """
+    Return the parameter ids and data product identifiers which are the
+    inputs of a parameter function map.
+
+    Args:
+        pmap - the parameter function map, either a dictionary or its string
+            representation from ParameterDefs.csv
+    Returns:
+        pdids - list of the integer ids of the input parameters
+        dpis - list of the data product identifiers of the input parameters
+    """
+    if isinstance(pmap, str):
+        pmap = ast.literal_eval(pmap)
+    pdids, dpis = [], []
+    for values in pmap.values():
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            if isinstance(value, Number) or not isinstance(value, str):
+                continue
+            if value.startswith('CC'):
+                continue
+            if value.startswith('dpi_'):
+                dpis.append(value.split('dpi_')[-1])
+            if 'PD' in value:
+                pdids.append(int(value.split('PD')[-1]))
+    return pdids, dpis
+
+
+def _pack_rows(rows, ncols):
+    """Pack a list of column indices for each row into a bitset array"""
+    bits = np.zeros((len(rows), ncols), dtype=bool)
+    for i, cols in enumerate(rows):
+        bits[i, cols] = True
+    return np.packbits(bits, axis=1)
+
+
+class AffectsGraph():
+    """
+    The graph of which preload parameters are affected by which others,
+    e.g. a CTD conductivity feeding the salinity and density of every
+    downstream instrument. The graph is built once into integer CSR adjacency
+    arrays, and the transitive downstream closure of every parameter, along
+    with the streams which contain any parameter of the closure, is stored as
+    a packed bitset row. Answering which parameters and streams are affected
+    by a parameter is then a row lookup rather than a graph traversal.
+
+    Args:
+        pdids - array of the integer parameter ids
+        names - array of the parameter names
+        streams - array of the stream names
+        indptr, indices - CSR adjacency of the parameters directly affected
+            by each parameter, as indices into pdids
+        stream_indptr, stream_indices - CSR of the streams which contain each
+            parameter, as indices into streams
+        closure - packed bitsets of the parameters affected by each parameter
+        stream_closure - packed bitsets of the streams affected by each parameter
+    """
+
+    def __init__(self, pdids, names, streams, indptr, indices, stream_indptr, stream_indices,
+                 closure=None, stream_closure=None):
+        self.pdids = np.asarray(pdids, dtype=np.int64)
+        self.names = np.asarray(names, dtype=str)
+        self.streams = np.asarray(streams, dtype=str)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.stream_indptr = np.asarray(stream_indptr, dtype=np.int64)
+        self.stream_indices = np.asarray(stream_indices, dtype=np.int64)
+        self.index = dict(zip(self.pdids.tolist(), range(len(self.pdids))))
+        self.stream_index = dict(zip(self.streams.tolist(), range(len(self.streams))))
+        if closure is None or stream_closure is None:
+            closure, stream_closure = self._transitive_closure()
+        self.closure = closure
+        self.stream_closure = stream_closure
+
+    @classmethod
+    def from_records(cls, parameters, stream_parameters):
+        """
+        Build the graph from the parameter definitions.
+
+        Args:
+            parameters - a DataFrame with an integer 'id', 'name', 'function_map'
+                (None for parameters which aren't functions), and
+                'dataproductidentifier' for each parameter
+            stream_parameters - a dictionary of stream name to the list of
+                integer ids of the parameters in the stream
+        Returns:
+            AffectsGraph
+        """
+        parameters = parameters.drop_duplicates(subset='id').sort_values(by='id')
+        pdids = parameters['id'].values.astype(np.int64)
+        index = dict(zip(pdids.tolist(), range(len(pdids))))
+
+        dpi_map = {}
+        for pdid, dpi in zip(pdids, parameters['dataproductidentifier']):
+            if isinstance(dpi, str) and dpi:
+                dpi_map.setdefault(dpi, []).append(index[pdid])
+
+        # Edges run from each input parameter to the function parameter it affects
+        sources, targets = [], []
+        for pdid, pmap in zip(pdids, parameters['function_map']):
+            if pmap is None or (not isinstance(pmap, (str, dict))) or len(pmap) == 0:
+                continue
+            inputs, dpis = parse_function_map(pmap)
+            inputs = [index[i] for i in inputs if i in index]
+            for dpi in dpis:
+                inputs.extend(dpi_map.get(dpi, []))
+            sources.extend(inputs)
+            targets.extend([index[pdid]]*len(inputs))
+        edges = np.unique(np.array([sources, targets], dtype=np.int64).reshape(2, -1), axis=1)
+        counts = np.bincount(edges[0], minlength=len(pdids))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+
+        streams = sorted(stream_parameters)
+        stream_of = [[] for _ in pdids]
+        for s, stream in enumerate(streams):
+            for pdid in stream_parameters[stream]:
+                if pdid in index:
+                    stream_of[index[pdid]].append(s)
+        stream_counts = [len(set(x)) for x in stream_of]
+        stream_indptr = np.concatenate(([0], np.cumsum(stream_counts)))
+        stream_indices = np.array([s for x in stream_of for s in sorted(set(x))], dtype=np.int64)
+
+        return cls(pdids, parameters['name'].values, streams, indptr, edges[1],
+                   stream_indptr, stream_indices)
+
+    @classmethod
+    def from_csv(cls, csv_dir):
+        """
+        Build the graph from the ParameterDefs.csv and ParameterDictionary.csv
+        of the preload-database, without a live database.
+
+        Args:
+            csv_dir - path to the csv directory of the preload-database
+        Returns:
+            AffectsGraph
+        """
+        defs = pd.read_csv(os.path.join(csv_dir, 'ParameterDefs.csv'), dtype=str)
+        defs = defs[defs['id'].str.match(r'^PD\d+$', na=False)]
+        is_function = defs['parametertype'].str.strip().str.lower() == 'function'
+        parameters = pd.DataFrame({
+            'id': defs['id'].str[2:].astype(np.int64),
+            'name': defs['name'],
+            'function_map': defs['parameterfunctionmap'].where(is_function & defs['parameterfunctionmap'].notna(), None),
+            'dataproductidentifier': defs['dataproductidentifier'],
+        })
+
+        dictionary = pd.read_csv(os.path.join(csv_dir, 'ParameterDictionary.csv'), dtype=str)
+        dictionary = dictionary.dropna(subset=['name', 'parameterids'])
+        stream_parameters = {}
+        for stream, pdids in zip(dictionary['name'], dictionary['parameterids']):
+            stream_parameters[stream] = [int(x) for x in re.findall(r'PD(\d+)', pdids)]
+        return cls.from_records(parameters, stream_parameters)
+
+    @classmethod
+    def from_database(cls, parameter_query, stream_query):
+        """
+        Build the graph from the preload-database models.
+
+        Args:
+            parameter_query - the Parameter query, e.g. Parameter.query
+            stream_query - the Stream query, e.g. Stream.query
+        Returns:
+            AffectsGraph
+        """
+        parameters = pd.DataFrame([{
+            'id': p.id,
+            'name': p.name,
+            'function_map': p.parameter_function_map if p.is_function else None,
+            'dataproductidentifier': p.data_product_identifier
+        } for p in parameter_query])
+        stream_parameters = {s.name: [p.id for p in s.parameters] for s in stream_query}
+        return cls.from_records(parameters, stream_parameters)
+
+    def _transitive_closure(self):
+        """
+        Calculate the packed bitsets of the parameters and streams downstream
+        of every parameter, visiting the parameters in reverse topological
+        order so each closure is the union of its children's closures.
+        """
+        n = len(self.pdids)
+        closure = _pack_rows([[i] for i in range(n)], n)
+        own_streams = [self.stream_indices[self.stream_indptr[i]:self.stream_indptr[i+1]] for i in range(n)]
+        stream_closure = _pack_rows(own_streams, len(self.streams))
+
+        # Kahn's algorithm for a topological order of the parameters
+        indegree = np.bincount(self.indices, minlength=n)
+        order = []
+        ready = list(np.flatnonzero(indegree == 0))
+        while ready:
+            i = ready.pop()
+            order.append(i)
+            for j in self.indices[self.indptr[i]:self.indptr[i+1]]:
+                indegree[j] -= 1
+                if indegree[j] == 0:
+                    ready.append(j)
+
+        # Parameters in a dependency cycle are never ready, so are visited last,
+        # and the passes are repeated until the closures stop changing
+        order.extend(np.flatnonzero(indegree > 0))
+        changed = True
+        while changed:
+            changed = False
+            for i in reversed(order):
+                children = self.indices[self.indptr[i]:self.indptr[i+1]]
+                if len(children) == 0:
+                    continue
+                row = closure[i] | np.bitwise_or.reduce(closure[children], axis=0)
+                srow = stream_closure[i] | np.bitwise_or.reduce(stream_closure[children], axis=0)
+                if (row != closure[i]).any() or (srow != stream_closure[i]).any():
+                    closure[i], stream_closure[i] = row, srow
+                    changed = True
+
+        return closure, stream_closure
+
+    def affected_parameters(self, pdid):
+        """Return the ids of the parameters affected by a parameter, including itself"""
+        row = np.unpackbits(self.closure[self.index[pdid]], count=len(self.pdids))
+        return self.pdids[row.astype(bool)]
+
+    def affected_streams(self, pdid):
+        """Return the names of the streams affected by a parameter"""
+        row = np.unpackbits(self.stream_closure[self.index[pdid]], count=len(self.streams))
+        return self.streams[row.astype(bool)]
+
+    def parameter_affects(self, pdid):
+        """
+        Return the map of stream name to the set of affected parameters in the
+        stream, the same as the preload-database parameter_affects.
+
+        Args:
+            pdid - the integer id of the parameter
+        Returns:
+            streams - dictionary of stream name to a set of AffectedParameter
+        """
+        row = np.unpackbits(self.closure[self.index[pdid]], count=len(self.pdids)).astype(bool)
+        streams = {}
+        for i in np.flatnonzero(row):
+            param = AffectedParameter(int(self.pdids[i]), str(self.names[i]))
+            for s in self.stream_indices[self.stream_indptr[i]:self.stream_indptr[i+1]]:
+                streams.setdefault(str(self.streams[s]), set()).add(param)
+        return streams
+
+    def save(self, filename):
+        """Save the graph and its closure to a npz file"""
+        np.savez_compressed(filename, pdids=self.pdids, names=self.names, streams=self.streams,
+                            indptr=self.indptr, indices=self.indices,
+                            stream_indptr=self.stream_indptr, stream_indices=self.stream_indices,
+                            closure=self.closure, stream_closure=self.stream_closure)
+
+    @classmethod
+    def load(cls, filename):
+        """Load a graph saved with save"""
+        with np.load(filename, allow_pickle=False) as data:
+            return cls(**{key: data[key] for key in data.files})
+
+
+def load_affects_graph(csv_dir=None, parameter_query=None, stream_query=None, version=None,
+                       cache_dir=None):
+    """
+    Load the affects graph of a version of the preload-database, building
+    and caching it if it hasn't been built before.
+
+    Args:
+        csv_dir - path to the csv directory of the preload-database. Used to
+            build the graph, and to identify its version if not given
+        parameter_query, stream_query - the Parameter and Stream queries of
+            the preload-database, used to build the graph when no csv_dir is given
+        version - the preload-database version (e.g. the git commit) the
+            graph is cached under. Defaults to the hash of the csvs
+        cache_dir - directory to cache the graph. Defaults to temp/affects_graph
+            in the current working directory
+    Returns:
+        AffectsGraph
+    """
+    if version is None and csv_dir is not None:
+        version = preload_version(csv_dir)
+    if cache_dir is None:
+        cache_dir = '/'.join((os.getcwd(), 'temp', 'affects_graph'))
+
+    cache_file = None
+    if version is not None:
+        cache_file = '/'.join((cache_dir, f'affects_graph_{version}.npz'))
+        if os.path.exists(cache_file):
+            return AffectsGraph.load(cache_file)
+
+    if csv_dir is not None:
+        graph = AffectsGraph.from_csv(csv_dir)
+    elif parameter_query is not None and stream_query is not None:
+        graph = AffectsGraph.from_database(parameter_query, stream_query)
+    else:
+        raise ValueError('Either the preload csv_dir or the parameter and stream queries are required')
+
+    if cache_file is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        graph.save(cache_file)
+    return graph
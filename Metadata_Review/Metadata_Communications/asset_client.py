@@ -0,0 +1,188 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class AssetClient():
+    """
+    Client for the OOINet asset management deployment and calibration
+    records of many instruments. The full deployment and calibration history
+    of each UID is requested once, concurrently through a pooled session, and
+    cached in memory and on disk. The calibration in effect at the start of
+    each deployment is then resolved locally with an interval lookup rather
+    than with a request for each deployment.
+
+    Args:
+        base_url - the OOINet m2m api url, e.g. https://ooinet.oceanobservatories.org/api/m2m
+        username - the OOINet api username
+        token - the OOINet api token
+        cache_dir - directory to cache the asset records. Defaults to
+            temp/asset_client in the current working directory
+        max_age - the maximum age of the cached records in seconds before they
+            are requested again. Defaults to None, which uses the cached records
+            regardless of age
+        max_workers - the number of concurrent requests
+        timeout - the timeout of each request in seconds, so that a stalled
+            connection doesn't hang a worker. Defaults to 30
+    """
+
+    def __init__(self, base_url, username, token, cache_dir=None, max_age=None, max_workers=8, timeout=30):
+        self.base_url = base_url
+        if cache_dir is None:
+            cache_dir = '/'.join((os.getcwd(), 'temp', 'asset_client'))
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.auth = (username, token)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._records = {}
+        self._errors = {}
+
+    def _url(self, kind, uid):
+        if kind == 'deployments':
+            return '/'.join((self.base_url, '12587', 'asset', 'deployments', uid + '?editphase=ALL'))
+        else:
+            return '/'.join((self.base_url, '12587', 'asset', 'cal?uid=' + uid))
+
+    def _get(self, kind, uid, refresh=False):
+        """Return the deployment or calibration records of a uid, from the cache unless refreshing"""
+        key = (kind, uid)
+        if key in self._records and not refresh:
+            return self._records[key]
+        if key in self._errors and not refresh:
+            raise self._errors[key]
+
+        cache_file = '/'.join((self.cache_dir, kind, uid + '.json'))
+        if os.path.exists(cache_file) and not refresh:
+            age = time.time() - os.stat(cache_file).st_mtime
+            if self.max_age is None or age <= self.max_age:
+                with open(cache_file) as file:
+                    self._records[key] = json.load(file)
+                return self._records[key]
+
+        try:
+            r = self.session.get(self._url(kind, uid), timeout=self.timeout)
+            r.raise_for_status()
+            data = r.json()
+        except Exception as e:
+            self._errors[key] = e
+            raise
+
+        if not os.path.exists(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, 'w') as file:
+            json.dump(data, file)
+        self._records[key] = data
+        self._errors.pop(key, None)
+        return data
+
+    def fetch(self, uids, refresh=False):
+        """
+        Request the deployment and calibration records of many uids concurrently.
+        Errors are kept and raised when the records of the uid are accessed,
+        until the records are requested again by a later fetch or refresh.
+
+        Args:
+            uids - list of the instrument uids
+            refresh - if True, request the records even if they are cached
+        """
+        def get(key):
+            try:
+                self._get(*key, refresh=refresh)
+            except Exception:
+                pass
+        keys = [(kind, uid) for uid in uids for kind in ('deployments', 'calibrations')]
+        # Retry the records which failed on an earlier fetch
+        for key in keys:
+            self._errors.pop(key, None)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(get, keys))
+
+    def refresh(self, uids):
+        """
+        Request the deployment and calibration records of many uids again,
+        replacing the records cached in memory and on disk. Records which
+        fail to refresh keep their cached values, if any.
+
+        Args:
+            uids - list of the instrument uids
+        """
+        self.fetch(uids, refresh=True)
+
+    def deployments(self, uid):
+        """
+        Return the deployment data of an instrument uid.
+
+        Args:
+            uid - the instrument uid
+        Returns:
+            df - DataFrame of the deployments, sorted by deployment number, or
+                None if the uid has no deployments
+        """
+        data = self._get('deployments', uid)
+        if len(data) == 0:
+            return None
+        df = pd.DataFrame(data)
+        df.sort_values(by='deploymentNumber', inplace=True)
+        df.reset_index(drop=True, inplace=True)
+        return df
+
+    def calibrations(self, uid):
+        """
+        Return the calibration history of an instrument uid.
+
+        Args:
+            uid - the instrument uid
+        Returns:
+            calData - the calibration json, with the description, serialNumber,
+                and calibration coefficients of the instrument
+        """
+        return self._get('calibrations', uid)
+
+    def cal_at_deployment(self, uid, deployData, window=8.64E7):
+        """
+        Add the calibration in effect at the start of each deployment to the
+        deployment data, i.e. the last calibration starting at or before the
+        deployment start. A calibration starting shortly after the deployment
+        start is only used for a deployment without any earlier calibration.
+
+        Args:
+            uid - the instrument uid
+            deployData - DataFrame of the deployments of the uid
+            window - the time after the deployment start, in milliseconds, in
+                which a calibration is used for a deployment without an earlier
+                calibration. Defaults to one day
+        Returns:
+            deployData - the deployment data with the dataSource,
+                lastModifiedTimestamp, instrument, and serialNumber of the
+                calibration of each deployment
+        """
+        calData = self.calibrations(uid)
+        events = sorted(calData['calibration'][0]['calData'], key=lambda x: x['eventStartTime'])
+        eventStart = np.array([x['eventStartTime'] for x in events], dtype=np.float64)
+
+        # The calibration in effect is the last one starting at or before the deployment
+        startTime = deployData['startTime'].values.astype(np.float64)
+        index = np.searchsorted(eventStart, startTime, side='right') - 1
+        if len(events) > 0:
+            # Otherwise, the first calibration if it starts within the window
+            index[(index < 0) & (eventStart[0] <= startTime + window)] = 0
+        if np.any(index < 0):
+            raise ValueError('No calibration for deployment of ' + uid)
+
+        deployData['dataSource'] = [events[i]['dataSource'] for i in index]
+        deployData['lastModifiedTimestamp'] = [events[i]['lastModifiedTimestamp'] for i in index]
+        deployData['instrument'] = calData['description']
+        deployData['serialNumber'] = calData['serialNumber']
+        return deployData
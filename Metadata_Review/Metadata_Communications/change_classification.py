@@ -0,0 +1,152 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+
+# The array names of the platform codes, in the order they are matched
+ARRAY_NAMES = {
+    'GA': 'Global Argentine Basin',
+    'GI': 'Global Irminger Sea',
+    'GP': 'Global Station Papa',
+    'GS': 'Global Southern Ocean',
+    'CP': 'Coastal Pioneer',
+}
+
+GITHUB_CALIBRATION_URL = 'https://github.com/ooi-integration/asset-management/blob/master/calibration'
+
+ERROR_COLUMNS = ['Wrong Date', 'Wrong cal', 'Is missing', 'Is duplicate', 'Is good']
+
+
+def _lower(values):
+    """Return the lowercase of the string values, and NA for any non-string values"""
+    values = pd.Series(values)
+    return values.where(values.map(type) == str).astype('string').str.lower()
+
+
+def wrong_cal_date(values):
+    """
+    Identify the calibration csvs with the wrong calibration date from the
+    'Filename correct' column: any string containing "no".
+    """
+    return _lower(values).str.contains('no', regex=False).fillna(False).astype(bool)
+
+
+def wrong_cal_coef(values):
+    """
+    Identify the calibration csvs with the wrong calibration coefficients from
+    the 'Cal coeff match' column: any string not containing "yes".
+    """
+    lower = _lower(values)
+    return (lower.notna() & ~lower.str.contains('yes', regex=False).fillna(False)).astype(bool)
+
+
+def is_missing(values):
+    """Identify the missing calibration csvs from the 'Duplicate' column ("new")"""
+    return (_lower(values) == 'new').fillna(False).astype(bool)
+
+
+def is_duplicate(values):
+    """Identify the duplicate calibration csvs from the 'Duplicate' column ("yes")"""
+    return (_lower(values) == 'yes').fillna(False).astype(bool)
+
+
+def classify_errors(metadata_review):
+    """
+    Add the error classification columns to the metadata review tracking
+    spreadsheet.
+
+    Args:
+        metadata_review - DataFrame of the metadata review, with the 'Filename
+            correct', 'Cal coeff match', and 'Duplicate' columns
+    Returns:
+        metadata_review - the metadata review with the 'Wrong Date', 'Wrong cal',
+            'Is missing', 'Is duplicate', and 'Is good' columns
+    """
+    metadata_review['Wrong Date'] = wrong_cal_date(metadata_review['Filename correct']).values
+    metadata_review['Wrong cal'] = wrong_cal_coef(metadata_review['Cal coeff match']).values
+    metadata_review['Is missing'] = is_missing(metadata_review['Duplicate']).values
+    metadata_review['Is duplicate'] = is_duplicate(metadata_review['Duplicate']).values
+    metadata_review['Is good'] = ~metadata_review[ERROR_COLUMNS[:-1]].any(axis=1)
+    return metadata_review
+
+
+def reformat_calDate(values):
+    """Parse the integer (YYYYMMDD) calibration dates into timestamps"""
+    values = pd.Series(values, dtype=object)
+    ints = (values.map(type) == int).values
+    values[ints] = list(pd.to_datetime(values[ints].astype(str)))
+    return values
+
+
+def print_calDate(values):
+    """Print the calibration dates as YYYYMMDD, with None for missing or unknown ('U') dates"""
+    values = pd.Series(values, dtype=object)
+    types = values.map(type)
+    dates = types.isin([pd.Timestamp, datetime.datetime, datetime.date]).values
+    result = pd.Series(None, index=values.index, dtype=object)
+    result[dates] = pd.to_datetime(values[dates]).dt.strftime('%Y%m%d').values
+    return result
+
+
+def new_csv_filename(metadata_review):
+    """
+    Generate the new calibration csv names from the original csv names with
+    the updated calibration dates.
+
+    Args:
+        metadata_review - DataFrame of the metadata review, with the 'Original
+            Calibration CSV', 'UID', 'Cal Date', and error classification columns
+    Returns:
+        new_csv - Series of the new calibration csv names, NaN for duplicates
+    """
+    og_csv = metadata_review['Original Calibration CSV'].astype(str)
+    og_csv = og_csv.where(og_csv.str.endswith('.csv'), og_csv + '.csv')
+    calDate = metadata_review['Cal Date']
+    renamed = metadata_review['UID'] + '__' + calDate.fillna('') + '.csv'
+
+    rename = (metadata_review['Wrong Date'] | metadata_review['Is missing']) & calDate.notna()
+    check = rename & (renamed == og_csv) & ~metadata_review['Is missing'] & ~metadata_review['Is duplicate']
+    for csv in og_csv[check]:
+        print("Check calibration date for {} for errors.".format(csv))
+
+    new_csv = np.select([metadata_review['Is duplicate'].values, rename.values],
+                        [np.nan, renamed.values], default=og_csv.values)
+    return pd.Series(new_csv, index=metadata_review.index)
+
+
+def generate_arrayName(platforms):
+    """Return the array name of each platform code, or NaN if not a CGSN array"""
+    platforms = pd.Series(platforms).astype(str)
+    conditions = [platforms.str.contains(code, regex=False).values for code in ARRAY_NAMES]
+    return pd.Series(np.select(conditions, list(ARRAY_NAMES.values()), default=None),
+                     index=platforms.index).fillna(np.nan)
+
+
+def generate_gitHub_url(files):
+    """Return the asset management github url of each calibration csv"""
+    files = pd.Series(files)
+    return GITHUB_CALIBRATION_URL + '/' + files.str.split('-').str[1] + '/' + files
+
+
+def classify_changeType(df):
+    """
+    Classify the change type of each calibration csv from the error classification.
+
+    Args:
+        df - DataFrame with the 'Wrong Date', 'Wrong cal', 'Is missing',
+            'Is duplicate', and 'Is good' columns
+    Returns:
+        changeType - Series of the change types
+    """
+    flags = {col: df[col].eq(True).values for col in ERROR_COLUMNS}
+    modified = np.select(
+        [flags['Wrong Date'] & flags['Wrong cal'], flags['Wrong Date'], flags['Wrong cal']],
+        ['File renamed with correct date Calibration coefficients were modified',
+         'File renamed with correct date',
+         'Calibration coefficients were modified'],
+        default='')
+    changeType = np.select(
+        [flags['Is good'], flags['Is missing'], flags['Is duplicate']],
+        ['No errors found', 'Missing file added', 'File deleted'],
+        default=modified)
+    return pd.Series(changeType, index=df.index, dtype=object)
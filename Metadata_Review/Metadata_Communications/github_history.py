@@ -0,0 +1,155 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+from patch_diff import is_data_affecting
+
+
+FILE_FIELDS = ['filename', 'previous_filename', 'status', 'blob_url', 'sha', 'patch']
+
+
+def classify_file(file):
+    """
+    Classify the change made to an asset management file by a pull request.
+
+    Args:
+        file - dictionary of the pull request file, with the filename, status,
+            and patch
+    Returns:
+        changeType - the change type for the Metadata Communications
+            spreadsheet, or None if the file change isn't reported
+    """
+    if file['status'] == 'modified':
+        changeType = 'Calibration coefficients were modified '
+    elif file['status'] == 'added':
+        changeType = 'Missing file added '
+    elif file['status'] == 'renamed':
+        changeType = 'File renamed with correct date '
+        # First, check if it was only a rename
+        if file['patch'] is None:
+            pass
+        elif file['filename'].endswith('.ext'):
+            changeType = changeType + 'Calibration coefficients were modified '
+        elif is_data_affecting(file['patch']):
+            # The file itself was also modified, beyond the notes field
+            changeType = changeType + 'Calibration coefficients were modified '
+    else:
+        changeType = None
+    return changeType
+
+
+class GitHubHistory():
+    """
+    Harvester of the change history of the asset management repository from
+    its merged pull requests. The file lists and patches of the pull requests
+    are fetched through a thread pool and cached on disk by pull request
+    number and head sha, and an index of the merged pull requests is kept so
+    that incremental runs only fetch the pull requests merged since the last run.
+
+    Args:
+        repo - the PyGithub Repository, e.g. g.get_repo("ooi-integration/asset-management")
+        cache_dir - directory to cache the pull requests. Defaults to
+            temp/github/<owner>__<repo> in the current working directory
+        max_workers - the number of threads to fetch the pull requests with
+    """
+
+    def __init__(self, repo, cache_dir=None, max_workers=8):
+        self.repo = repo
+        if cache_dir is None:
+            cache_dir = '/'.join((os.getcwd(), 'temp', 'github', repo.full_name.replace('/', '__')))
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.index_file = '/'.join((cache_dir, 'pulls.json'))
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as file:
+                self.pulls = {int(k): v for k, v in json.load(file).items()}
+        else:
+            self.pulls = {}
+
+    def _cache_file(self, record):
+        return '/'.join((self.cache_dir, 'pr_{}_{}.json'.format(record['number'], record['head_sha'])))
+
+    def _fetch_files(self, record, pr=None):
+        """Return the files of a pull request, fetching and caching them if not cached"""
+        cache_file = self._cache_file(record)
+        if os.path.exists(cache_file):
+            with open(cache_file) as file:
+                return json.load(file)
+        if pr is None:
+            pr = self.repo.get_pull(record['number'])
+        files = [{field: getattr(f, field, None) for field in FILE_FIELDS} for f in pr.get_files()]
+        with open(cache_file, 'w') as file:
+            json.dump(files, file)
+        return files
+
+    def harvest(self, base='master', incremental=True):
+        """
+        Find the merged pull requests and fetch their files.
+
+        Args:
+            base - the base branch of the pull requests. Defaults to 'master'
+            incremental - if True, only list the pull requests updated since the
+                last merged pull request of the previous run. Otherwise, list
+                all of the pull requests
+        Returns:
+            pulls - dictionary of pull request number to its number, merged_at,
+                and head_sha
+        """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        since = None
+        if incremental and self.pulls:
+            since = pd.to_datetime(max(p['merged_at'] for p in self.pulls.values()))
+
+        # A pull request merged since the last run was updated since then too, so
+        # the listing in order of last update can stop at the first older one
+        new = {}
+        for pr in self.repo.get_pulls(state='closed', sort='updated', direction='desc', base=base):
+            if since is not None and pd.to_datetime(pr.updated_at) < since:
+                break
+            if pr.merged_at is None:
+                continue
+            record = {
+                'number': pr.number,
+                'merged_at': pd.to_datetime(pr.merged_at).isoformat(),
+                'head_sha': pr.head.sha
+            }
+            new[pr.number] = (record, pr)
+
+        missing = [(record, pr) for record, pr in new.values() if not os.path.exists(self._cache_file(record))]
+        missing += [(record, None) for number, record in self.pulls.items()
+                    if number not in new and not os.path.exists(self._cache_file(record))]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda x: self._fetch_files(*x), missing))
+
+        self.pulls.update({number: record for number, (record, pr) in new.items()})
+        with open(self.index_file, 'w') as file:
+            json.dump(self.pulls, file)
+        return self.pulls
+
+    def change_table(self, include='CGINS'):
+        """
+        Build the change table of the asset management history from the
+        harvested pull requests.
+
+        Args:
+            include - only include the files with this string in their path.
+                Defaults to 'CGINS'
+        Returns:
+            gitHub_df - DataFrame with the 'file', 'URL', 'changeType', and
+                'gitHub changeDate' of each reported file change
+        """
+        rows = []
+        for number in sorted(self.pulls):
+            record = self.pulls[number]
+            changeDate = pd.to_datetime(record['merged_at']).strftime('%Y-%m-%d')
+            for file in self._fetch_files(record):
+                if include is not None and include not in file['filename']:
+                    continue
+                changeType = classify_file(file)
+                if changeType is None:
+                    continue
+                rows.append((file['filename'].split('/')[-1], file['blob_url'], changeType, changeDate))
+        return pd.DataFrame(rows, columns=['file', 'URL', 'changeType', 'gitHub changeDate'])
@@ -0,0 +1,143 @@
+import csv
+import pandas as pd
+
+
+COLUMNS = ['serial', 'name', 'value', 'notes']
+
+
+def parse_patch(patch):
+    """
+    Parse the unified diff of a calibration csv into the rows of the old
+    and new versions of the file, in one pass over the patch. Only the rows
+    in the hunks of the patch are returned.
+
+    Args:
+        patch - the unified diff text of the calibration csv, e.g. the patch
+            of a PyGithub File
+    Returns:
+        old_rows, new_rows - dictionaries of coefficient name to the row
+            dictionary with the serial, name, value, and notes
+    """
+    old_lines, new_lines = [], []
+    for line in patch.splitlines():
+        if line.startswith('@@') or line.startswith('\\'):
+            # Hunk metadata and "\ No newline at end of file" markers
+            continue
+        if line.startswith('+'):
+            new_lines.append(line[1:])
+        elif line.startswith('-'):
+            old_lines.append(line[1:])
+        else:
+            line = line[1:] if line.startswith(' ') else line
+            old_lines.append(line)
+            new_lines.append(line)
+    return _rows(old_lines), _rows(new_lines)
+
+
+def _rows(lines):
+    """Parse csv lines into a dictionary of coefficient name to row, skipping the header"""
+    rows = {}
+    for values in csv.reader(lines):
+        if len(values) < 2 or values[0].strip() == 'serial':
+            continue
+        values = values + ['']*(len(COLUMNS) - len(values))
+        row = dict(zip(COLUMNS, values[:len(COLUMNS)]))
+        rows[row['name'].strip()] = row
+    return rows
+
+
+def _same_value(a, b):
+    """Compare two coefficient values, ignoring whitespace and numeric formatting"""
+    a, b = ''.join(a.split()), ''.join(b.split())
+    if a == b:
+        return True
+    try:
+        return float(a) == float(b)
+    except ValueError:
+        return False
+
+
+def diff_patch(patch):
+    """
+    Compare the changed rows of a calibration csv patch.
+
+    Args:
+        patch - the unified diff text of the calibration csv
+    Returns:
+        changes - DataFrame of the changed coefficients, with the 'name',
+            'old_name' (for renamed coefficients), 'change' ('notes', 'value',
+            'serial', 'rename', 'added', or 'removed'), and the old and new
+            'value' and 'notes'
+    """
+    old_rows, new_rows = parse_patch(patch)
+    changes = []
+    for name in old_rows:
+        if name not in new_rows:
+            continue
+        old, new = old_rows[name], new_rows[name]
+        if not _same_value(old['value'], new['value']):
+            change = 'value'
+        elif old['serial'].strip() != new['serial'].strip():
+            change = 'serial'
+        elif old['notes'] != new['notes']:
+            change = 'notes'
+        else:
+            continue
+        changes.append((name, name, change, old['value'], new['value'], old['notes'], new['notes']))
+
+    # Coefficients which only appear on one side were either renamed, if a
+    # removed coefficient has the same value as an added one, or added/removed
+    removed = [name for name in old_rows if name not in new_rows]
+    added = [name for name in new_rows if name not in old_rows]
+    for name in added:
+        new = new_rows[name]
+        match = next((x for x in removed if _same_value(old_rows[x]['value'], new['value'])), None)
+        if match is not None:
+            removed.remove(match)
+            old = old_rows[match]
+            changes.append((name, match, 'rename', old['value'], new['value'], old['notes'], new['notes']))
+        else:
+            changes.append((name, None, 'added', None, new['value'], None, new['notes']))
+    for name in removed:
+        old = old_rows[name]
+        changes.append((name, name, 'removed', old['value'], None, old['notes'], None))
+
+    return pd.DataFrame(changes, columns=['name', 'old_name', 'change', 'old_value', 'new_value',
+                                          'old_notes', 'new_notes'])
+
+
+def classify_patch(patch):
+    """
+    Classify the change made by a calibration csv patch.
+
+    Args:
+        patch - the unified diff text of the calibration csv
+    Returns:
+        classification - 'value change' if any coefficient value or serial
+            number changed or a coefficient was added or removed, 'rename' if
+            coefficients were only renamed, 'notes-only' if only the notes
+            changed, or 'no change'
+    """
+    changes = set(diff_patch(patch)['change'])
+    if changes & {'value', 'serial', 'added', 'removed'}:
+        return 'value change'
+    elif 'rename' in changes:
+        return 'rename'
+    elif 'notes' in changes:
+        return 'notes-only'
+    else:
+        return 'no change'
+
+
+def is_data_affecting(file):
+    """
+    This function tests a file patch diff for if the change
+    is only in the notes column which is not data affecting
+
+    Args:
+        file - a PyGithub File, or the patch text of the file
+    Returns:
+        True if the patch changes any coefficient values or names
+    """
+    patch = file if isinstance(file, str) else file.patch
+    return classify_patch(patch) in ('value change', 'rename')
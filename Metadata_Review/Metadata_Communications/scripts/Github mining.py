@@ -15,7 +15,7 @@
 
 # # GitHub Miner
 
-import os, shutil, sys, time, re, requests, csv, datetime, pytz
+import os, shutil, sys, time, re, requests, csv, pytz
 import pandas as pd
 import numpy as np
 import netCDF4 as nc
@@ -24,6 +24,17 @@ import warnings
 import yaml
 import csv
 from github import Github
+
+# Import the Metadata Communications tools
+sys.path.append('../')
+from github_history import GitHubHistory
+from asset_client import AssetClient
+from change_classification import generate_arrayName
+
+# Import the shared OOI time conversions
+sys.path.append('../../../')
+from ooi_time import ms_to_datetime64
+
 warnings.filterwarnings("ignore")
 
 # Import the github user info
@@ -50,115 +61,14 @@ ooi_token = ooi_userinfo['apikey']
 # **====================================================================================================================**
 # ## Pull Request Approach
 
-# Get a particular pull request #
-pr = repo.get_pull(703)
-
-
-def is_data_affecting(file):
-    """
-    This function tests a file patch diff for if the change
-    is only in the notes column which is not data affecting
-    """
-    for line in file.patch.splitlines():
-        line = line.strip()
-        if line.startswith('@@'):
-            # This is the metadata about the patch changes
-            metadata = line
-        elif line.startswith('serial'):
-            # This is the title line
-            columns = line.split(',')
-            new_file = pd.DataFrame(columns=columns)
-            old_file = pd.DataFrame(columns=columns)
-        elif line.startswith('+'):
-            line = line.replace('+','',1)
-            line = [x for x in csv.reader([line])][0]
-            new_file = new_file.append({
-                'serial':line[0],
-                'name':line[1],
-                'value':line[2],
-                'notes':line[3],
-            }, ignore_index = True)
-        elif line.startswith('-'):
-            line = line.replace('-','',1)
-            # This is the old file data
-            line = [x for x in csv.reader([line])][0]
-            old_file = old_file.append({
-                'serial':line[0],
-                'name':line[1],
-                'value':line[2],
-                'notes':line[3],
-            }, ignore_index = True)
-        else:
-            # Append the line to both the new and old files
-            line = [x for x in csv.reader([line])][0]
-            new_file = new_file.append({
-                'serial':line[0],
-                'name':line[1],
-                'value':line[2],
-                'notes':line[3],
-            }, ignore_index = True)
-            old_file = old_file.append({
-                'serial':line[0],
-                'name':line[1],
-                'value':line[2],
-                'notes':line[3],
-            }, ignore_index = True)
-
-    # Now, test that the dataframes are similar
-    test = new_file == old_file
-
-    # Determine if only the notes have changed
-    for col in test.columns:
-        result = all(test[col])
-        if result == False and col != 'notes':
-            data_affecting = True
-            break
-        else:
-            data_affecting = False
-    
-    return data_affecting
-
-
-gitHub_df = pd.DataFrame(columns=['file','URL','changeType', 'gitHub changeDate'])
-for file in list(pr.get_files()):
-    if 'CGINS' not in file.filename:
-        continue
-    # Get useful metadata
-    URL = file.blob_url
-    changeDate = pd.to_datetime(pr.merged_at).strftime('%Y-%m-%d')
-    filename = file.filename.split('/')[-1]
-    # Now test the type of change
-    if file.status == 'modified':
-        changeType = 'Calibration coefficients were modified '
-    elif file.status == 'added':
-        changeType = 'Missing file added '
-    elif file.status == 'renamed':
-        changeType = 'File renamed with correct date '
-        # First, chec if it was only a rename
-        if file.patch == None:
-            # Then its just a rename
-            pass
-        elif file.filename.endswith('.ext'):
-            changeType = changeType + 'Calibration coefficients were modified '
-        else:
-            # Otherwise, the file itself was also modified
-            # Need to check if the modification was data affecting
-            data_affecting = is_data_affecting(file)
-            if data_affecting:
-                changeType = changeType + 'Calibration coefficients were modified '
-            else:
-                # Then the modification was an addition to only notes field
-                pass
-    else:
-        continue
-    # Now, append the data to a dataframe
-    gitHub_df = gitHub_df.append({
-        'file':filename,
-        'URL':URL,
-        'changeType':changeType,
-        'gitHub changeDate':changeDate
-    }, ignore_index = True)
+# Harvest the merged pull requests of the asset management repository. The pull request
+# files are cached by pull request number and head sha, so only the pull requests merged
+# since the last run are fetched
+history = GitHubHistory(repo, max_workers=8)
+history.harvest(base='master', incremental=True)
 
+gitHub_df = history.change_table(include='CGINS')
+gitHub_df
 
 np.unique(gitHub_df['changeType'])
 
@@ -176,82 +86,28 @@ gitHub_df['UID'] = gitHub_df['file'].apply(lambda x: x.split('__')[0])
 gitHub_df
 
 
+# The deployment and calibration records of each UID are requested once, concurrently,
+# and cached, and the calibration of each deployment is found locally
+asset_client = AssetClient(base_url, ooi_user, ooi_token)
+
+
 def get_deployData(uid, username, token):
     """
     Query and return the deployment data from OOINet
     for a particular instrument uid
     """
-    url = '/'.join((base_url,'12587','asset','deployments',uid+'?editphase=ALL'))
-    data = requests.get(url, auth=(username, token)).json()
-    if len(data) == 0:
-        return None
-    else:
-        df = pd.DataFrame(data)
-        df.sort_values(by='deploymentNumber', inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        return df
+    return asset_client.deployments(uid)
 
 
 def get_calData(uid, deployData, username, token):
     """
     This function takes in the instrument uid and a dataframe of the
-    deployment information for the uid, and loops through all of the
-    instrument deployments to return the calibration data for the
-    instrument for each individual deployment.
+    deployment information for the uid, and returns the calibration data
+    for the instrument in effect for each individual deployment.
     """
-    
-    startTime = deployData['startTime']
-    dt = 8.64E7 # microseconds in a day
-    
-    # Initialize tuples for non-mutable storage of data
-    dataSource = ()
-    lastModifiedTimestamp = ()
-    instrument = ()
-    serialNumber = ()
-    
-    # Loop over the deployment startTime and get the data
-    for t in startTime:
-        T1 = convert_ooi_time(t).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        T2 = convert_ooi_time(t+dt).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        # Generate the url and get the calibration data for a single deployment by querying a single day
-        url = '/'.join((base_url,'12587','asset','cal?uid='+uid+'&beginDT={}&endDT={}'.format(T1,T2)))
-        calData = requests.get(url, auth=(username, token)).json()
-        # Fill out the data tuples
-        instrument = instrument + (calData['description'],)
-        serialNumber = serialNumber + (calData['serialNumber'],)
-        dataSource = dataSource + (calData['calibration'][0]['calData'][0]['dataSource'],)
-        lastModifiedTimestamp = lastModifiedTimestamp + (calData['calibration'][0]['calData'][0]['lastModifiedTimestamp'],)
-        
-    # Now, put the data tuples into the deploy data dataframe
-    deployData['dataSource'] = dataSource
-    deployData['lastModifiedTimestamp'] = lastModifiedTimestamp
-    deployData['instrument'] = instrument
-    deployData['serialNumber'] = serialNumber
-    
-    # Return the expanded deployment data
-    return deployData
+    return asset_client.cal_at_deployment(uid, deployData)
 
 
-# +
-# Specify some functions to convert timestamps
-ntp_epoch = datetime.datetime(1900, 1, 1)
-unix_epoch = datetime.datetime(1970, 1, 1)
-ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-def ntp_seconds_to_datetime(ntp_seconds):
-    return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microsecond=0)
-  
-def convert_ooi_time(ms):
-    if ms is None:
-        return None
-    elif np.isnan(ms):
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
-
-
-# -
-
 # Establish the order of columns for the Metadata Communications Spreadsheet
 cols = ('Array','Platform','Node','Instrument','RefDes','Asset ID','Serial Number','deployment','gitHub changeDate',
         'file','URL','changeType','dateRangeStart','dateRangeEnd','annotation')
@@ -277,6 +133,7 @@ name_map = {
 
 metadata_communications = pd.DataFrame(columns=cols)
 missing_files = []
+asset_client.fetch(gitHub_df['UID'].unique())
 for i in range(len(gitHub_df)):
     
     # Get the gitHub info for a specific file
@@ -329,23 +186,7 @@ missing_files
 metadata = metadata_communications
 
 
-def generate_arrayName(x):
-    if 'GA' in x:
-        arrayName = 'Global Argentine Basin'
-    elif 'GI' in x:
-        arrayName = 'Global Irminger Sea'
-    elif 'GP' in x:
-        arrayName = 'Global Station Papa'
-    elif 'GS' in x:
-        arrayName = 'Global Southern Ocean'
-    elif 'CP' in x:
-        arrayName = 'Coastal Pioneer'
-    else:
-        arrayName = np.nan
-    return arrayName
-
-
-metadata_communications['Array'] = metadata_communications['Platform'].apply(generate_arrayName)
+metadata_communications['Array'] = generate_arrayName(metadata_communications['Platform'])
 
 metadata_communications
 
@@ -423,130 +264,22 @@ sys.path.append('/home/andrew/Documents/OOI-CGSN/Ocean Observatories Initiative/
 
 # +
 import yaml
-from ooi_data.postgres.model import *
-
 from tools.m2m import MachineToMachine
-from database import create_engine_from_url, create_scoped_session
-
-# +
-engine = create_engine_from_url(None)
-session = create_scoped_session(engine)
-
-MetadataBase.query = session.query_property()
 
+# The affects graph of the preload parameters is built from the preload-database csvs
+# and cached for each version of the preload-database
+from affects_graph import load_affects_graph
+from toc_index import load_toc, TOCIndex
 
+preload_csv = '/home/andrew/Documents/OOI-CGSN/Ocean Observatories Initiative/preload-database/csv/'
 # -
 
-def build_dpi_map():
-    """
-    Build a map from a specific data product identifier to a set of parameters which fulfill it
-    :return:
-    """
-    dpi_map = {}
-    for p in Parameter.query:
-        if p.data_product_identifier:
-            dpi_map.setdefault(p.data_product_identifier, set()).add(p)
-    return dpi_map
-
-
-def build_affects_map():
-    """
-    Build a map from parameter to the set of parameters *directly* affected by it
-    :return:
-    """
-    dpi_map = build_dpi_map()
-    affects_map = {}
-    for p in Parameter.query:
-        if p.is_function:
-            pmap = p.parameter_function_map
-            for key in pmap:
-                values = pmap[key]
-                if not isinstance(values, list):
-                    values = [values]
-                for value in values:
-                    if isinstance(value, Number):
-                        continue
-                    if value.startswith('CC'):
-                        continue
-                    if value.startswith('dpi_'):
-                        value = value.split('dpi_')[-1]
-                        for param in dpi_map.get(value, []):
-                            affects_map.setdefault(param, set()).add(p)
-
-                    if 'PD' in value:
-                        pdid = int(value.split('PD')[-1])
-                        param = Parameter.query.get(pdid)
-                        affects_map.setdefault(param, set()).add(p)
-    return affects_map
-
-
-def parameter_affects(pdid, affects_map):
-    """
-    Given a specific parameter and a map of parameter to the set of its directly affected parameters,
-    traverse the given graph to determine all possible affected parameters for the given parameter.
-    Return the map of stream_name to affected parameters.
-    :param pdid:
-    :param affects_map:
-    :return:
-    """
-    p = Parameter.query.get(pdid)
-
-    affected = {p}
-    to_visit = affects_map[p]
-
-    while to_visit:
-        p = to_visit.pop()
-        affected.add(p)
-        for param in affects_map.get(p, []):
-            if param in affected:
-                continue
-            affected.add(param)
-            to_visit.add(param)
-
-    streams = {}
-    for p in affected:
-        for stream in p.streams:
-            streams.setdefault(stream.name, set()).add(p)
-
-    return streams
-
-
-def find_affected(affected_streams, subsite, node, toc):
-    """
-    Given a map of affected streams for a parameter, traverse the TOC and identify all instrument streams
-    with the same subsite and node which are affected. For each affected stream, print the affected parameters.
-    :param affected_streams:
-    :param subsite:
-    :param node:
-    :param toc:
-    :return:
-    """
-
-    out = []
-    for each in toc['instruments']:
-        if each['platform_code'] == subsite and each['mooring_code'] == node:
-            for stream in each['streams']:
-                name = stream['stream']
-                for parameter in affected_streams.get(name, []):
-                    print('{refdes} {stream} {pid} {pname}'.format(
-                    refdes=each['reference_designator'],
-                    stream=stream['stream'],
-                    pid=parameter.id,
-                    pname=parameter.name)
-                         )
-                        
-                    out.append(' '.join((each['reference_designator'], 
-                               stream['stream'], 
-                               str(parameter.id), 
-                               parameter.name))
-                              )
-    return out
-
 
 config = yaml.load(open('m2m_config.yml'))
 m2m = MachineToMachine(config['url'], config['apiname'], config['apikey'])
-toc = m2m.toc()
-affects_map = build_affects_map()
+toc = load_toc(m2m.toc, max_age=86400)
+toc_index = TOCIndex(toc)
+affects_graph = load_affects_graph(preload_csv)
 
 # Now, we need to go over the available arrays and nodes for CTDs to check what downstream sensors changes to the CTD calibration files may have:
 
@@ -558,76 +291,30 @@ ctd = ctd[error_filter]
 ctd
 
 # +
-# Get the downstream_metadata info 
+# Find the instrument streams on the same Platform and Node as each CTD change which
+# are affected by the CTD conductivity, temperature, and pressure
+pid = [193, 194, 195]
+affected = toc_index.find_affected(ctd, affects_graph, pid)
+
+# Only need the unique downstream refdes of each change, excluding the upstream CTD itself
+upstream = ctd['RefDes'].values[affected['change']]
+affected = affected[affected['refdes'].values != upstream].drop_duplicates(subset=['change', 'refdes'])
+
+# For each unique refdes, put into a dataframe the important information from the upstream change
+columns = ['Array', 'Platform', 'Node', 'deployment', 'gitHub changeDate', 'file', 'URL',
+           'changeType', 'dateRangeStart', 'dateRangeEnd']
+downstream = ctd[columns].iloc[affected['change']].reset_index(drop=True)
+downstream['RefDes'] = affected['refdes'].values
+downstream['Upstream'] = ctd['RefDes'].values[affected['change']]
+downstream[['Instrument', 'Asset ID', 'OOI changeDate']] = None
+
 downstream_metadata = pd.DataFrame(columns=metadata_communications.columns)
 downstream_metadata['Upstream'] = ''
-
-# Now, iterate over all of the Platform and Node combinations to query the affected downstream instruments
-pid = [193, 194, 195]
-for row in ctd.values:
-
-    # Get the row values
-    array = row[0]
-    platform = row[1] 
-    node = row[2]
-    up_instrument = row[3]
-    up_refdes = row[4]
-    up_asset_id = row[5]
-    up_serial_num = row[6]
-    deployment = row[7]
-    gitHub_changeDate = row[8] 
-    up_csv = row[9]
-    up_url = row[10]
-    up_changeType = row[11]
-    up_startTime = row[12]
-    up_endTime = row[13]
-    
-    print('\n')
-    print('===========================================')
-    print(' '.join((up_refdes, platform, node, str(deployment), str(up_startTime), str(up_endTime), '\n')))
-    
-    # Next step is to get the affected_sensors 
-    affected_sensors = []
-    for p in pid:
-        # Query the m2m api and get the instrument and parameter maps
-        config = yaml.load(open('m2m_config.yml'))
-        m2m = MachineToMachine(config['url'], config['apiname'], config['apikey'])
-        toc = m2m.toc()
-        affects_map = build_affects_map()
-        affected_streams = parameter_affects(p, affects_map)
-        affected_sensors.append(find_affected(affected_streams, platform, node, toc))
-        
-    # Now, I need to filter out and only get the unique refdes of the affected_streams
-    downstream_refdes = []
-    for sensor in affected_sensors:
-        for inst in sensor:
-            refdes, stream, p_id, pname = inst.split()
-            print(' '.join((refdes, stream, p_id, pname, '\n')))
-            if refdes not in downstream_refdes and refdes != up_refdes:
-                downstream_refdes.append(refdes)
-            
-    # For each unique refdes, I now need to put into a dataframe the important information that I need
-    for refdes in downstream_refdes:
-        downstream_metadata = downstream_metadata.append({
-            'Array':array,
-            'Platform':platform,
-            'Node':node,
-            'Instrument':None,
-            'RefDes':refdes,
-            'Asset ID':None,
-            'deployment':deployment,
-            'gitHub changeDate':gitHub_changeDate,
-            'OOI changeDate':None,
-            'file':up_csv,
-            'URL':up_url,
-            'changeType':up_changeType,
-            'dateRangeStart':up_startTime,
-            'dateRangeEnd':up_endTime,
-            'Upstream':up_refdes            
-        }, ignore_index=True)
-    
+downstream_metadata = pd.concat([downstream_metadata, downstream], ignore_index=True, sort=False)
 # -
 
+affected
+
 # Drop the CTD's from the downstream list
 ctd_filter = downstream_metadata['RefDes'].apply(lambda x: False if 'CTD' in x else True)
 downstream_metadata = downstream_metadata[ctd_filter]
@@ -704,9 +391,9 @@ for name in cols:
 
 metadata
 
-metadata['dateRangeStart'] = metadata['dateRangeStart'].apply(convert_ooi_time)
+metadata['dateRangeStart'] = ms_to_datetime64(metadata['dateRangeStart'])
 
-metadata['dateRangeEnd'] = metadata['dateRangeEnd'].apply(convert_ooi_time)
+metadata['dateRangeEnd'] = ms_to_datetime64(metadata['dateRangeEnd'])
 
 metadata
 
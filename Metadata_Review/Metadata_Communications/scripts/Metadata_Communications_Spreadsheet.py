@@ -88,7 +88,7 @@
 #     
 #
 
-import os, shutil, sys, time, re, requests, csv, datetime, pytz
+import os, shutil, sys, time, re, requests, csv, pytz
 import pandas as pd
 import numpy as np
 import netCDF4 as nc
@@ -97,6 +97,16 @@ import warnings
 import yaml
 warnings.filterwarnings("ignore")
 
+# Import the Metadata Communications tools
+sys.path.append('../')
+from asset_client import AssetClient
+from change_classification import (reformat_calDate, classify_errors, print_calDate, new_csv_filename,
+                                   generate_arrayName, generate_gitHub_url, classify_changeType)
+
+# Import the shared OOI time conversions
+sys.path.append('../../../')
+from ooi_time import ms_to_datetime64
+
 # Load OOINet credentials:
 
 os.listdir('../../')
@@ -111,26 +121,6 @@ base_url = 'https://ooinet.oceanobservatories.org/api/m2m'
 sensor_url = '12576/sensor/inv'
 asset_url = '12587/asset'
 
-# +
-# Specify some functions to convert timestamps
-ntp_epoch = datetime.datetime(1900, 1, 1)
-unix_epoch = datetime.datetime(1970, 1, 1)
-ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-def ntp_seconds_to_datetime(ntp_seconds):
-    return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microsecond=0)
-  
-def convert_ooi_time(ms):
-    if ms is None:
-        return None
-    elif np.isnan(ms):
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
-
-
-# -
-
 # **====================================================================================================================**
 # ### Metadata Review Tracking Spreadsheet
 # Load and process the metadata review tracking spreadsheet used by CGSN (CGSN Metadata Review.xlsx), which contains the following sheets:
@@ -168,14 +158,7 @@ print(metadata_review.columns.values)
 metadata_review['S/N'] = metadata_review['S/N'].apply(lambda x: str(int(x)) if type(x) == float else x)
 
 
-def reformat_calDate(x):
-    if type(x) is int:
-        return pd.to_datetime(str(x))
-    else:
-        return x
-
-
-metadata_review['Cal Date'] = metadata_review['Cal Date'].apply(reformat_calDate)
+metadata_review['Cal Date'] = reformat_calDate(metadata_review['Cal Date'])
 
 
 def generate_uid(inst, sn, whoi_inst=True):
@@ -217,68 +200,8 @@ def generate_uid(inst, sn, whoi_inst=True):
 metadata_review['UID'] = metadata_review.apply(lambda x: generate_uid(x['CLASS-SERIES'], x['S/N']), axis=1)
 
 
-def wrong_cal_date(x):
-    if type(x) == str:
-        if 'no' in x.lower():
-            return True
-        else:
-            return False
-    else:
-        return False
-
-
-metadata_review['Wrong Date'] = metadata_review['Filename correct'].apply(wrong_cal_date)
-
-
-def wrong_cal_coef(x):
-    if type(x) == str:
-        if 'yes' in x.lower():
-            return False
-        else:
-            return True
-    elif np.isnan(x):
-        return False
-    else:
-        return False
-
-
-metadata_review['Wrong cal'] = metadata_review['Cal coeff match'].apply(wrong_cal_coef)
-
-
-def is_missing(x):
-    if type(x) is str:
-        if x.lower() == 'new':
-            return True
-        else:
-            return False
-    else:
-        return False
-
-
-metadata_review['Is missing'] = metadata_review['Duplicate'].apply(is_missing)
-
-
-def is_duplicate(x):
-    if type(x) is str:
-        if x.lower() == 'yes':
-            return True
-        else:
-            return False
-    else:
-        return False        
-
-
-metadata_review['Is duplicate'] = metadata_review['Duplicate'].apply(is_duplicate)
-
-
-def is_good(x):
-    if any(x) == True:
-        return False
-    else:
-        return True
-
-
-metadata_review['Is good'] = metadata_review[['Wrong Date', 'Wrong cal', 'Is missing', 'Is duplicate']].apply(is_good, axis=1)
+# Classify the errors found in the review of each calibration csv
+metadata_review = classify_errors(metadata_review)
 
 # Visually confirm that the classification is correct:
 
@@ -287,46 +210,11 @@ metadata_review[['Wrong Date','Wrong cal','Is missing','Is duplicate','Is good']
 
 # Generate the new csv filenames from the instrument class-series, serial number, and the correct/corrected calibration date:
 
-def print_calDate(x):
-    if type(x) == float or type(x) == pd._libs.tslibs.nattype.NaTType:
-        return None
-    elif x == 'U':
-        return None
-    else:
-        return x.strftime('%Y%m%d')
-
-
 metadata_review[metadata_review['Cal Date'].apply(type) == str]
 
-metadata_review['Cal Date'] = metadata_review['Cal Date'].apply(print_calDate)
-
-
-def new_csv_filename(x):
-    """
-    Function to generate the new calibration csv name from
-    the original csv name with the updated calibration date
-    """
-    
-    og_csv = x['Original Calibration CSV']
-    
-    if not og_csv.endswith('.csv') and og_csv != None:
-        og_csv = og_csv + '.csv'
-        x['Original Calibration CSV'] = og_csv
-        
-    if x['Is duplicate']:
-        return np.nan
-    elif x['Cal Date'] == None:
-        return og_csv
-    elif x['Wrong Date'] or x['Is missing']:
-        new_csv = x['UID'] + '__' + x['Cal Date'] + '.csv'
-        if new_csv == x['Original Calibration CSV'] and not x['Is missing']:
-            print("Check calibration date for {} for errors.".format(x['Original Calibration CSV']))
-        return new_csv
-    else:
-        return x['Original Calibration CSV']
+metadata_review['Cal Date'] = print_calDate(metadata_review['Cal Date'])
 
-
-metadata_review['New Calibration CSV'] = metadata_review.apply(new_csv_filename, axis=1)
+metadata_review['New Calibration CSV'] = new_csv_filename(metadata_review)
 
 # **====================================================================================================================**
 # ## Metadata Communications Spreadsheet
@@ -355,57 +243,29 @@ metadata_review['New Calibration CSV'] = metadata_review.apply(new_csv_filename,
 metadata_review['CLASS-SERIES'] = metadata_review['CLASS-SERIES'].apply(lambda x: x.replace('-',''))
 
 
+# The deployment and calibration records of each UID are requested once, concurrently,
+# and cached, and the calibration of each deployment is found locally
+asset_client = AssetClient(base_url, username, token)
+
+
 def get_deployData(uid):
     """
     Query and return the deployment data from OOINet
     for a particular instrument uid
     """
-    url = '/'.join((base_url,'12587','asset','deployments',uid+'?editphase=ALL'))
-    data = requests.get(url, auth=(username, token)).json()
-    df = pd.DataFrame(data)
-    df.sort_values(by='deploymentNumber', inplace=True)
-    df.reset_index(drop=True, inplace=True)
+    df = asset_client.deployments(uid)
+    if df is None:
+        raise ValueError('No deployments for ' + uid)
     return df
 
 
 def get_calData(uid, deployData):
     """
     This function takes in the instrument uid and a dataframe of the
-    deployment information for the uid, and loops through all of the
-    instrument deployments to return the calibration data for the
-    instrument for each individual deployment.
+    deployment information for the uid, and returns the calibration data
+    for the instrument in effect for each individual deployment.
     """
-    
-    startTime = deployData['startTime']
-    dt = 8.64E7 # microseconds in a day
-    
-    # Initialize tuples for non-mutable storage of data
-    dataSource = ()
-    lastModifiedTimestamp = ()
-    instrument = ()
-    serialNumber = ()
-    
-    # Loop over the deployment startTime and get the data
-    for t in startTime:
-        T1 = convert_ooi_time(t).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        T2 = convert_ooi_time(t+dt).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-        # Generate the url and get the calibration data for a single deployment by querying a single day
-        url = '/'.join((base_url,'12587','asset','cal?uid='+uid+'&beginDT={}&endDT={}'.format(T1,T2)))
-        calData = requests.get(url, auth=(username, token)).json()
-        # Fill out the data tuples
-        instrument = instrument + (calData['description'],)
-        serialNumber = serialNumber + (calData['serialNumber'],)
-        dataSource = dataSource + (calData['calibration'][0]['calData'][0]['dataSource'],)
-        lastModifiedTimestamp = lastModifiedTimestamp + (calData['calibration'][0]['calData'][0]['lastModifiedTimestamp'],)
-        
-    # Now, put the data tuples into the deploy data dataframe
-    deployData['dataSource'] = dataSource
-    deployData['lastModifiedTimestamp'] = lastModifiedTimestamp
-    deployData['instrument'] = instrument
-    deployData['serialNumber'] = serialNumber
-    
-    # Return the expanded deployment data
-    return deployData
+    return asset_client.cal_at_deployment(uid, deployData)
 
 
 def reformat_dataSource(x):
@@ -442,54 +302,13 @@ name_map = {
 }
 
 
-def generate_arrayName(x):
-    if 'GA' in x:
-        arrayName = 'Global Argentine Basin'
-    elif 'GI' in x:
-        arrayName = 'Global Irminger Sea'
-    elif 'GP' in x:
-        arrayName = 'Global Station Papa'
-    elif 'GS' in x:
-        arrayName = 'Global Southern Ocean'
-    elif 'CP' in x:
-        arrayName = 'Coastal Pioneer'
-    else:
-        arrayName = np.nan
-    return arrayName
-
-
-def generate_gitHub_url(x):
-    base_url = 'https://github.com/ooi-integration/asset-management/blob/master/calibration'
-    inst = x.split('-')[1]
-    full_url = '/'.join((base_url,inst,x))
-    return full_url
-
-
-def classify_changeType(x):
-    statement = ''
-    if x['Is good'] == True:
-        return 'No errors found'
-    elif x['Is missing'] == True:
-        return 'Missing file added'
-    elif x['Is duplicate'] == True:
-        return 'File deleted'
-    else:
-        if len(statement) > 0:
-            statement = statement + '; '
-        if x['Wrong Date'] == True:
-            statement = statement + ' File renamed with correct date'
-        if x['Wrong cal'] == True:
-            statement = statement + ' Calibration coefficients were modified'
-        return statement.strip()
-
-
 def reformat_comdf(comdf):
-    comdf['Array'] = comdf['Platform'].apply(generate_arrayName)
-    comdf['OOI changeDate'] = comdf['OOI changeDate'].apply(convert_ooi_time)
-    comdf['dateRangeStart'] = comdf['dateRangeStart'].apply(convert_ooi_time)
-    comdf['dateRangeEnd'] = comdf['dateRangeEnd'].apply(convert_ooi_time)
-    comdf['URL'] = comdf['file'].apply(generate_gitHub_url)
-    comdf['changeType'] = comdf[['Wrong Date','Wrong cal','Is missing','Is duplicate','Is good']].apply(classify_changeType, axis=1)
+    comdf['Array'] = generate_arrayName(comdf['Platform'])
+    comdf['OOI changeDate'] = ms_to_datetime64(comdf['OOI changeDate'])
+    comdf['dateRangeStart'] = ms_to_datetime64(comdf['dateRangeStart'])
+    comdf['dateRangeEnd'] = ms_to_datetime64(comdf['dateRangeEnd'])
+    comdf['URL'] = generate_gitHub_url(comdf['file'])
+    comdf['changeType'] = classify_changeType(comdf)
     comdf.drop(columns=['Wrong Date','Wrong cal','Is missing','Is duplicate','Is good'], inplace=True)
     return comdf
 
@@ -515,6 +334,7 @@ for instrument in np.unique(metadata_review['CLASS-SERIES']):
     
     # Now, iterate through all of the unique UIDs for a particular instrument class
     uids = np.unique(metadata_review[metadata_review['CLASS-SERIES'] == instrument]['UID'])
+    asset_client.fetch(uids)
     for uid in uids:
         # Step 1: Get the deployment data
         try:
@@ -615,6 +435,7 @@ error_df = pd.DataFrame(columns=['uid','step'])
 error_df
 
 uids = np.unique(metadata_review[metadata_review['CLASS-SERIES'] == instrument]['UID'])
+asset_client.fetch(uids)
 for uid in uids:
     # Step 1: Get the deployment data
     try:
@@ -775,7 +596,7 @@ for i in range(len(metadata_communications)):
     gitHub_changeDate = metadata_communications['gitHub changeDate'].iloc[i]
     dateRangeStart = metadata_communications['dateRangeStart'].iloc[i]
     dateRangeEnd = metadata_communications['dateRangeEnd'].iloc[i]
-    if type(dateRangeEnd) == float:
+    if pd.isnull(dateRangeEnd):
         dateRangeEnd = 'now'
     URL = metadata_communications['URL'].iloc[i]
     
@@ -838,131 +659,22 @@ sys.path.append('/home/andrew/Documents/OOI-CGSN/Ocean Observatories Initiative/
 
 # +
 import yaml
-from ooi_data.postgres.model import *
-
 from tools.m2m import MachineToMachine
-from database import create_engine_from_url, create_scoped_session
-
-# +
-engine = create_engine_from_url(None)
-session = create_scoped_session(engine)
-
-MetadataBase.query = session.query_property()
 
+# The affects graph of the preload parameters is built from the preload-database csvs
+# and cached for each version of the preload-database
+from affects_graph import load_affects_graph
+from toc_index import load_toc, TOCIndex
 
+preload_csv = '/home/andrew/Documents/OOI-CGSN/Ocean Observatories Initiative/preload-database/csv/'
 # -
 
-def build_dpi_map():
-    """
-    Build a map from a specific data product identifier to a set of parameters which fulfill it
-    :return:
-    """
-    dpi_map = {}
-    for p in Parameter.query:
-        if p.data_product_identifier:
-            dpi_map.setdefault(p.data_product_identifier, set()).add(p)
-    return dpi_map
-
-
-def build_affects_map():
-    """
-    Build a map from parameter to the set of parameters *directly* affected by it
-    :return:
-    """
-    dpi_map = build_dpi_map()
-    affects_map = {}
-    for p in Parameter.query:
-        if p.is_function:
-            pmap = p.parameter_function_map
-            for key in pmap:
-                values = pmap[key]
-                if not isinstance(values, list):
-                    values = [values]
-                for value in values:
-                    if isinstance(value, Number):
-                        continue
-                    if value.startswith('CC'):
-                        continue
-                    if value.startswith('dpi_'):
-                        value = value.split('dpi_')[-1]
-                        for param in dpi_map.get(value, []):
-                            affects_map.setdefault(param, set()).add(p)
-
-                    if 'PD' in value:
-                        pdid = int(value.split('PD')[-1])
-                        param = Parameter.query.get(pdid)
-                        affects_map.setdefault(param, set()).add(p)
-    return affects_map
-
-
-def parameter_affects(pdid, affects_map):
-    """
-    Given a specific parameter and a map of parameter to the set of its directly affected parameters,
-    traverse the given graph to determine all possible affected parameters for the given parameter.
-    Return the map of stream_name to affected parameters.
-    :param pdid:
-    :param affects_map:
-    :return:
-    """
-    p = Parameter.query.get(pdid)
-
-    affected = {p}
-    to_visit = affects_map[p]
-
-    while to_visit:
-        p = to_visit.pop()
-        affected.add(p)
-        for param in affects_map.get(p, []):
-            if param in affected:
-                continue
-            affected.add(param)
-            to_visit.add(param)
-
-    streams = {}
-    for p in affected:
-        for stream in p.streams:
-            streams.setdefault(stream.name, set()).add(p)
-
-    return streams
-
-
-
-def find_affected(affected_streams, subsite, node, toc):
-    """
-    Given a map of affected streams for a parameter, traverse the TOC and identify all instrument streams
-    with the same subsite and node which are affected. For each affected stream, print the affected parameters.
-    :param affected_streams:
-    :param subsite:
-    :param node:
-    :param toc:
-    :return:
-    """
-
-    out = []
-    for each in toc['instruments']:
-        if each['platform_code'] == subsite and each['mooring_code'] == node:
-            for stream in each['streams']:
-                name = stream['stream']
-                for parameter in affected_streams.get(name, []):
-                    print('{refdes} {stream} {pid} {pname}'.format(
-                    refdes=each['reference_designator'],
-                    stream=stream['stream'],
-                    pid=parameter.id,
-                    pname=parameter.name)
-                         )
-                        
-                    out.append(' '.join((each['reference_designator'], 
-                               stream['stream'], 
-                               str(parameter.id), 
-                               parameter.name))
-                              )
-    return out
-
 
 config = yaml.load(open('m2m_config.yml'))
 m2m = MachineToMachine(config['url'], config['apiname'], config['apikey'])
-toc = m2m.toc()
-affects_map = build_affects_map()
+toc = load_toc(m2m.toc, max_age=86400)
+toc_index = TOCIndex(toc)
+affects_graph = load_affects_graph(preload_csv)
 
 # Now, we need to go over the available arrays and nodes for CTDs to check what downstream sensors changes to the CTD calibration files may have:
 
@@ -974,76 +686,30 @@ ctd = ctd[error_filter]
 ctd
 
 # +
-# Get the downstream_metadata info 
+# Find the instrument streams on the same Platform and Node as each CTD change which
+# are affected by the CTD conductivity, temperature, and pressure
+pid = [193, 194, 195]
+affected = toc_index.find_affected(ctd, affects_graph, pid)
+
+# Only need the unique downstream refdes of each change, excluding the upstream CTD itself
+upstream = ctd['RefDes'].values[affected['change']]
+affected = affected[affected['refdes'].values != upstream].drop_duplicates(subset=['change', 'refdes'])
+
+# For each unique refdes, put into a dataframe the important information from the upstream change
+columns = ['Array', 'Platform', 'Node', 'deployment', 'gitHub changeDate', 'file', 'URL',
+           'changeType', 'dateRangeStart', 'dateRangeEnd']
+downstream = ctd[columns].iloc[affected['change']].reset_index(drop=True)
+downstream['RefDes'] = affected['refdes'].values
+downstream['Upstream'] = ctd['RefDes'].values[affected['change']]
+downstream[['Instrument', 'Asset ID', 'OOI changeDate']] = None
+
 downstream_metadata = pd.DataFrame(columns=metadata_communications.columns)
 downstream_metadata['Upstream'] = ''
-
-# Now, iterate over all of the Platform and Node combinations to query the affected downstream instruments
-pid = [193, 194, 195]
-for row in ctd.values:
-
-    # Get the row values
-    array = row[0]
-    platform = row[1] 
-    node = row[2]
-    up_instrument = row[3]
-    up_refdes = row[4]
-    up_asset_id = row[5]
-    up_serial_num = row[6]
-    deployment = row[7]
-    gitHub_changeDate = row[8] 
-    up_csv = row[10]
-    up_url = row[11]
-    up_changeType = row[12]
-    up_startTime = row[13]
-    up_endTime = row[14]
-    
-    print('\n')
-    print('===========================================')
-    print(' '.join((up_refdes, platform, node, str(deployment), str(up_startTime), str(up_endTime), '\n')))
-    
-    # Next step is to get the affected_sensors 
-    affected_sensors = []
-    for p in pid:
-        # Query the m2m api and get the instrument and parameter maps
-        config = yaml.load(open('m2m_config.yml'))
-        m2m = MachineToMachine(config['url'], config['apiname'], config['apikey'])
-        toc = m2m.toc()
-        affects_map = build_affects_map()
-        affected_streams = parameter_affects(p, affects_map)
-        affected_sensors.append(find_affected(affected_streams, platform, node, toc))
-        
-    # Now, I need to filter out and only get the unique refdes of the affected_streams
-    downstream_refdes = []
-    for sensor in affected_sensors:
-        for inst in sensor:
-            refdes, stream, p_id, pname = inst.split()
-            print(' '.join((refdes, stream, p_id, pname, '\n')))
-            if refdes not in downstream_refdes and refdes != up_refdes:
-                downstream_refdes.append(refdes)
-            
-    # For each unique refdes, I now need to put into a dataframe the important information that I need
-    for refdes in downstream_refdes:
-        downstream_metadata = downstream_metadata.append({
-            'Array':array,
-            'Platform':platform,
-            'Node':node,
-            'Instrument':None,
-            'RefDes':refdes,
-            'Asset ID':None,
-            'deployment':deployment,
-            'gitHub changeDate':gitHub_changeDate,
-            'OOI changeDate':None,
-            'file':up_csv,
-            'URL':up_url,
-            'changeType':up_changeType,
-            'dateRangeStart':up_startTime,
-            'dateRangeEnd':up_endTime,
-            'Upstream':up_refdes            
-        }, ignore_index=True)
-    
+downstream_metadata = pd.concat([downstream_metadata, downstream], ignore_index=True, sort=False)
 # -
 
+affected
+
 # Drop the CTD's from the downstream list
 ctd_filter = downstream_metadata['RefDes'].apply(lambda x: False if 'CTD' in x else True)
 downstream_metadata = downstream_metadata[ctd_filter]
@@ -1096,7 +762,7 @@ for i in range(len(downstream_metadata)):
     gitHub_changeDate = downstream_metadata['gitHub changeDate'].iloc[i]
     dateRangeStart = downstream_metadata['dateRangeStart'].iloc[i]
     dateRangeEnd = downstream_metadata['dateRangeEnd'].iloc[i]
-    if type(dateRangeEnd) == float:
+    if pd.isnull(dateRangeEnd):
         dateRangeEnd = 'now'
     URL = downstream_metadata['URL'].iloc[i]
 
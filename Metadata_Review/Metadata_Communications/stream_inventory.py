@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+
+PARAMETER_FIELDS = {
+    'name': 'Parameter Name',
+    'unitofmeasure': 'Units',
+    'dataproductidentifier': 'Data Product Identifier',
+    'datalevel': 'Level'
+}
+
+
+def is_cgsn(refdes):
+    """
+    Identify the WHOI (CGSN) responsible sites or reference designators, i.e.
+    everything except the Endurance and Regional Cabled arrays and the gliders.
+
+    Args:
+        refdes - Series or list of the sites or reference designators
+    Returns:
+        mask - boolean Series, True for the CGSN sites or reference designators
+    """
+    refdes = pd.Series(refdes).astype(str)
+    return ~refdes.str.startswith(('CE', 'RS', 'SS')) & ~refdes.str.endswith('MOAS')
+
+
+def walk_inventory(data_url, username, token, sites=None, sensor=None, max_workers=8):
+    """
+    Walk the OOINet sensor inventory down to the streams of each instrument.
+    Each level of the inventory (nodes, sensors, methods, streams) is
+    requested concurrently through a pooled session, rather than one
+    request at a time.
+
+    Args:
+        data_url - the sensor inventory url, e.g. https://ooinet.oceanobservatories.org/api/m2m/12576/sensor/inv
+        username - the OOINet api username
+        token - the OOINet api token
+        sites - list of the sites to walk. Defaults to None, which walks all
+            of the CGSN sites
+        sensor - only walk the sensors with this string in their name,
+            e.g. 'CTDBP'. Defaults to None, which walks all of the sensors
+        max_workers - the number of concurrent requests
+    Returns:
+        df - DataFrame with the 'RefDes', 'Method', and 'Stream' of every
+            stream of the instruments
+    """
+    session = requests.Session()
+    session.auth = (username, token)
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    def get_api(path):
+        r = session.get('/'.join((data_url,) + path))
+        r.raise_for_status()
+        return [path + (x,) for x in r.json()]
+
+    def expand(paths, executor):
+        return [x for children in executor.map(get_api, paths) for x in children]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if sites is None:
+            sites = pd.Series([x[0] for x in get_api(())])
+            sites = list(sites[is_cgsn(sites)])
+        nodes = expand([(site,) for site in sites], executor)
+        sensors = expand(nodes, executor)
+        if sensor is not None:
+            sensors = [x for x in sensors if sensor in x[2]]
+        methods = expand(sensors, executor)
+        streams = expand(methods, executor)
+
+    df = pd.DataFrame(streams, columns=['site', 'node', 'sensor', 'Method', 'Stream'])
+    df.insert(0, 'RefDes', df['site'] + '-' + df['node'] + '-' + df['sensor'])
+    return df.drop(columns=['site', 'node', 'sensor'])
+
+
+def stream_parameters(df, toc):
+    """
+    Expand the streams into one row for each stream parameter.
+
+    Args:
+        df - DataFrame with the 'Stream' of each instrument
+        toc - the table of contents dictionary from m2m.toc() or load_toc
+    Returns:
+        df - DataFrame with a row for the 'pdId' of each parameter of the streams
+    """
+    pdIds = pd.Series(toc['parameters_by_stream'], name='pdId')
+    df = df.join(pdIds, on='Stream').explode('pdId').dropna(subset=['pdId'])
+    return df.reset_index(drop=True)
+
+
+def add_parameter_defs(df, param_defs):
+    """
+    Add the parameter name, units, data product identifier, and level from
+    the preload database parameter definitions to each stream parameter.
+
+    Args:
+        df - DataFrame with the 'pdId' of each stream parameter
+        param_defs - DataFrame of the preload-database ParameterDefs.csv
+    Returns:
+        df - the DataFrame with the 'Parameter Name', 'Units', 'Data Product
+            Identifier', and 'Level' of each parameter
+    """
+    defs = param_defs.drop_duplicates(subset='id').set_index('id')
+    defs = defs[list(PARAMETER_FIELDS)].rename(columns=PARAMETER_FIELDS)
+    return df.join(defs, on='pdId')
+
+
+def add_gross_range(df, lookup_table):
+    """
+    Add the gross range values of each stream parameter from the qc-lookup
+    global range table.
+
+    Args:
+        df - DataFrame with the 'RefDes' and 'Parameter Name' of each stream
+            parameter
+        lookup_table - DataFrame of the qc-lookup data_qc_global_range_values.csv
+    Returns:
+        df - the DataFrame with the 'Gross Range Values' (min, max) of each
+            parameter, (None, None) if not in the lookup table
+    """
+    table = lookup_table.drop_duplicates(subset=['ReferenceDesignator', 'ParameterID_R'])
+    table = table.set_index(['ReferenceDesignator', 'ParameterID_R'])[['GlobalRangeMin', 'GlobalRangeMax']]
+    values = df.join(table, on=['RefDes', 'Parameter Name'])
+    values = values[['GlobalRangeMin', 'GlobalRangeMax']].astype(object)
+    values = values.where(values.notna(), None)
+    df['Gross Range Values'] = list(zip(values['GlobalRangeMin'], values['GlobalRangeMax']))
+    return df
+
+
+def drop_support_parameters(df):
+    """
+    Drop the time, ingestion, and serial number parameters, which don't have
+    gross ranges.
+
+    Args:
+        df - DataFrame with the 'Parameter Name' of each stream parameter
+    Returns:
+        df - the DataFrame without the support parameters
+    """
+    names = df['Parameter Name'].astype(str)
+    mask = names.str.contains('time', regex=False) | names.str.contains('ingestion', regex=False) \
+        | (names == 'serial_number')
+    return df[~mask]
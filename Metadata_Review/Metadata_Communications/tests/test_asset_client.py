@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+from asset_client import AssetClient
+
+
+DAY = 86400000
+UID = "CGINS-CTDBPC-50001"
+
+
+@pytest.fixture
+def client(tmp_path):
+    client = AssetClient("http://localhost/api/m2m", "username", "token", cache_dir=str(tmp_path))
+    # Calibrations starting on day 10, day 100, and day 200
+    client._records[("calibrations", UID)] = {
+        "description": "CTD Pumped",
+        "serialNumber": "16-50001",
+        "calibration": [{"calData": [
+            {"eventStartTime": start * DAY, "dataSource": f"{UID}__{start}.csv", "lastModifiedTimestamp": start}
+            for start in (100, 10, 200)
+        ]}]
+    }
+    return client
+
+
+def test_cal_at_deployment_uses_the_calibration_in_effect(client):
+    # Deployments on day 100 (same time as a calibration), between calibrations
+    # (day 150), and half a day before the next calibration (day 199.5)
+    deployData = pd.DataFrame({"startTime": [100 * DAY, 150 * DAY, 199.5 * DAY]})
+    deployData = client.cal_at_deployment(UID, deployData)
+    assert list(deployData["dataSource"]) == [f"{UID}__100.csv", f"{UID}__100.csv", f"{UID}__100.csv"]
+    assert list(deployData["serialNumber"]) == ["16-50001"] * 3
+
+
+def test_cal_at_deployment_without_an_earlier_calibration(client):
+    # Only a calibration starting within the window of the deployment start is used
+    deployData = client.cal_at_deployment(UID, pd.DataFrame({"startTime": [9.5 * DAY]}))
+    assert list(deployData["dataSource"]) == [f"{UID}__10.csv"]
+
+    with pytest.raises(ValueError):
+        client.cal_at_deployment(UID, pd.DataFrame({"startTime": [8 * DAY]}))
+
+
+class AssetHandler(BaseHTTPRequestHandler):
+    """Asset management api which fails, stalls, or serves the records, as set on the server"""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.mode == "stall":
+            time.sleep(1)
+        if self.server.mode == "fail":
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps([{"deploymentNumber": self.server.deployment}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AssetHandler)
+    server.requests = []
+    server.mode = "ok"
+    server.deployment = 1
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = "http://127.0.0.1:{}/api/m2m".format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stalled_request_times_out(server, tmp_path):
+    server.mode = "stall"
+    client = AssetClient(server.url, "username", "token", cache_dir=str(tmp_path), timeout=0.2)
+    start = time.time()
+    client.fetch([UID])
+    assert time.time() - start < 1
+    with pytest.raises(requests.exceptions.Timeout):
+        client.deployments(UID)
+
+
+def test_failed_records_are_retried(server, tmp_path):
+    server.mode = "fail"
+    client = AssetClient(server.url, "username", "token", cache_dir=str(tmp_path))
+    client.fetch([UID])
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.deployments(UID)
+    # The error is kept until the records are requested again
+    n = len(server.requests)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.deployments(UID)
+    assert len(server.requests) == n
+
+    server.mode = "ok"
+    client.fetch([UID])
+    assert client.deployments(UID)["deploymentNumber"].tolist() == [1]
+
+
+def test_refresh_replaces_the_cached_records(server, tmp_path):
+    client = AssetClient(server.url, "username", "token", cache_dir=str(tmp_path))
+    client.fetch([UID])
+    server.deployment = 2
+    client.fetch([UID])
+    assert client.deployments(UID)["deploymentNumber"].tolist() == [1]
+
+    client.refresh([UID])
+    assert client.deployments(UID)["deploymentNumber"].tolist() == [2]
+    assert AssetClient(server.url, "username", "token", cache_dir=str(tmp_path)).deployments(UID)[
+        "deploymentNumber"].tolist() == [2]
+
+    # A failed refresh keeps the cached records
+    server.mode = "fail"
+    client.refresh([UID])
+    assert client.deployments(UID)["deploymentNumber"].tolist() == [2]
@@ -0,0 +1,125 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from github_history import GitHubHistory
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_pull(record):
+    """Build a stand-in PyGithub PullRequest from a recorded pull request"""
+    files = []
+    for f in record["files"]:
+        f = dict(f)
+        if f["patch"] is not None:
+            with open(os.path.join(FIXTURES, "patches", f["patch"])) as file:
+                f["patch"] = file.read()
+        files.append(f)
+    return FakePull(record, files)
+
+
+class FakePull():
+    """Stand-in for a PyGithub PullRequest, counting the requests for its files"""
+
+    def __init__(self, record, files):
+        self.number = record["number"]
+        self.updated_at = pd.to_datetime(record["updated_at"]).to_pydatetime()
+        self.merged_at = None if record["merged_at"] is None else pd.to_datetime(record["merged_at"]).to_pydatetime()
+        self.head = SimpleNamespace(sha=record["head_sha"])
+        self.files = files
+        self.file_requests = 0
+
+    def get_files(self):
+        self.file_requests += 1
+        return [SimpleNamespace(**f) for f in self.files]
+
+
+class FakeRepo():
+    """Stand-in for a PyGithub Repository, serving the recorded pull requests"""
+
+    full_name = "ooi-integration/asset-management"
+
+    def __init__(self, pulls):
+        self.pulls = {pr.number: pr for pr in pulls}
+        self.listed = []
+
+    def get_pulls(self, state, sort, direction, base):
+        assert (state, sort, direction) == ("closed", "updated", "desc")
+        for pr in sorted(self.pulls.values(), key=lambda x: x.updated_at, reverse=True):
+            self.listed.append(pr.number)
+            yield pr
+
+    def get_pull(self, number):
+        return self.pulls[number]
+
+    def file_requests(self):
+        return {number: pr.file_requests for number, pr in self.pulls.items() if pr.file_requests > 0}
+
+
+@pytest.fixture
+def repo():
+    with open(os.path.join(FIXTURES, "github", "pulls.json")) as file:
+        return FakeRepo([load_pull(record) for record in json.load(file)])
+
+
+@pytest.fixture
+def new_pull():
+    with open(os.path.join(FIXTURES, "github", "new_pull.json")) as file:
+        return load_pull(json.load(file))
+
+
+def test_harvest_fetches_the_merged_pull_requests(repo, tmp_path):
+    history = GitHubHistory(repo, cache_dir=str(tmp_path))
+    pulls = history.harvest()
+
+    assert sorted(pulls) == [101, 103]
+    assert pulls[103] == {"number": 103, "merged_at": "2020-03-15T15:45:00", "head_sha": "0a9b8c"}
+    assert repo.file_requests() == {101: 1, 103: 1}
+    with open(history.index_file) as file:
+        assert sorted(json.load(file)) == ["101", "103"]
+
+
+def test_harvest_incremental(repo, new_pull, tmp_path):
+    GitHubHistory(repo, cache_dir=str(tmp_path)).harvest()
+    repo.pulls[new_pull.number] = new_pull
+    repo.listed = []
+
+    # A new run from the same cache only lists back to the last merged pull
+    # request and only fetches the files of the newly merged one
+    history = GitHubHistory(repo, cache_dir=str(tmp_path))
+    pulls = history.harvest(incremental=True)
+
+    assert sorted(pulls) == [101, 103, 104]
+    assert repo.listed == [104, 103, 102]
+    assert repo.file_requests() == {101: 1, 103: 1, 104: 1}
+
+    # A full run lists everything, but the files are still read from the cache
+    history.harvest(incremental=False)
+    assert repo.listed[3:] == [104, 103, 102, 101]
+    assert repo.file_requests() == {101: 1, 103: 1, 104: 1}
+
+
+def test_change_table(repo, tmp_path):
+    GitHubHistory(repo, cache_dir=str(tmp_path)).harvest()
+
+    # The change table is built from the cached files, without any requests
+    history = GitHubHistory(repo, cache_dir=str(tmp_path))
+    gitHub_df = history.change_table()
+    assert repo.file_requests() == {101: 1, 103: 1}
+
+    assert list(gitHub_df.columns) == ["file", "URL", "changeType", "gitHub changeDate"]
+    assert gitHub_df[["file", "changeType", "gitHub changeDate"]].values.tolist() == [
+        ["CGINS-CTDBPC-50001__20190601.csv", "Calibration coefficients were modified ", "2020-01-10"],
+        ["CGINS-CTDBPC-50002__20190705.csv", "Missing file added ", "2020-01-10"],
+        ["CGINS-OPTAAD-00242__20190901.csv", "File renamed with correct date ", "2020-03-15"],
+        ["CGINS-OPTAAD-00243__20190902.csv",
+         "File renamed with correct date Calibration coefficients were modified ", "2020-03-15"],
+    ]
+    assert gitHub_df["URL"].iloc[0].endswith("/blob/a1b2c3/calibration/CTDBPC/CGINS-CTDBPC-50001__20190601.csv")
+
+    assert len(history.change_table(include=None)) == 5
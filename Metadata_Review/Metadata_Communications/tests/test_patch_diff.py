@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+from patch_diff import classify_patch, diff_patch, is_data_affecting, parse_patch
+
+
+PATCHES = os.path.join(os.path.dirname(__file__), "fixtures", "patches")
+
+with open(os.path.join(PATCHES, "expected.json")) as file:
+    EXPECTED = json.load(file)
+
+
+def load_patch(name):
+    with open(os.path.join(PATCHES, name)) as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("name", sorted(EXPECTED))
+def test_classify_patch(name):
+    assert classify_patch(load_patch(name)) == EXPECTED[name]
+
+
+def test_notes_only_is_not_data_affecting():
+    assert not is_data_affecting(load_patch("notes_only.patch"))
+    assert is_data_affecting(load_patch("array_value.patch"))
+    assert is_data_affecting(load_patch("rename.patch"))
+
+
+def test_rename_keeps_the_old_name():
+    changes = diff_patch(load_patch("rename.patch"))
+    assert changes[["name", "old_name", "change"]].values.tolist() == \
+        [["CC_scale_factor2", "CC_scale_factor_2", "rename"]]
+
+
+def test_added_and_removed_rows():
+    changes = diff_patch(load_patch("added_removed.patch")).set_index("name")["change"]
+    assert changes.to_dict() == {"CC_angular_resolution": "added", "CC_depolarization_ratio": "removed"}
+
+
+def test_no_newline_marker_is_not_a_row():
+    old_rows, new_rows = parse_patch(load_patch("no_newline.patch"))
+    assert sorted(old_rows) == sorted(new_rows) == ["CC_csv", "CC_cwo"]
+    assert old_rows["CC_cwo"] == new_rows["CC_cwo"]
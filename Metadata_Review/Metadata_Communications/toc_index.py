@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import pandas as pd
+
+
+def load_toc(fetch, cache_dir=None, max_age=None, refresh=False):
+    """
+    Load the M2M table of contents, using the local cache if available.
+
+    Args:
+        fetch - the function which downloads the table of contents, e.g. m2m.toc
+        cache_dir - directory to cache the table of contents. Defaults to
+            temp/toc in the current working directory
+        max_age - the maximum age of the cached table of contents in seconds
+            before it is fetched again. Defaults to None, which uses the cached
+            table of contents regardless of age
+        refresh - if True, always fetch the table of contents and update the cache
+    Returns:
+        toc - the table of contents dictionary
+    """
+    if cache_dir is None:
+        cache_dir = '/'.join((os.getcwd(), 'temp', 'toc'))
+    cache_file = '/'.join((cache_dir, 'toc.json'))
+
+    if not refresh and os.path.exists(cache_file):
+        age = time.time() - os.stat(cache_file).st_mtime
+        if max_age is None or age <= max_age:
+            with open(cache_file) as file:
+                return json.load(file)
+
+    toc = fetch()
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    with open(cache_file, 'w') as file:
+        json.dump(toc, file)
+    return toc
+
+
+class TOCIndex():
+    """
+    Index of the instrument streams in the M2M table of contents. The
+    instruments are flattened once into a table of (subsite, node, refdes,
+    stream), from which the (subsite, node) to instruments and stream to
+    refdes maps are built, so the affected instruments of any number of
+    changes are found with joins rather than by scanning the table of
+    contents for each change.
+
+    Args:
+        toc - the table of contents dictionary from m2m.toc() or load_toc
+    """
+
+    def __init__(self, toc):
+        rows = []
+        for each in toc['instruments']:
+            for stream in each['streams']:
+                rows.append((each['platform_code'], each['mooring_code'],
+                             each['reference_designator'], stream['stream']))
+        self.streams = pd.DataFrame(rows, columns=['subsite', 'node', 'refdes', 'stream']).drop_duplicates()
+        self.node_instruments = self.streams.groupby(['subsite', 'node'])['refdes'].unique().to_dict()
+        self.stream_refdes = self.streams.groupby('stream')['refdes'].unique().to_dict()
+
+    def find_affected(self, changes, affects_graph, pdids, subsite='Platform', node='Node'):
+        """
+        Find the instrument streams and parameters affected by a batch of changes.
+        An instrument is affected by a change if it is on the same subsite and
+        node and has a stream with a parameter downstream of the changed parameters.
+
+        Args:
+            changes - DataFrame of the changes, with the subsite and node of each
+            affects_graph - the AffectsGraph of the preload parameters
+            pdids - list of the integer ids of the changed parameters, e.g. the
+                CTD conductivity, temperature, and pressure
+            subsite - the column of the changes with the subsite. Defaults to 'Platform'
+            node - the column of the changes with the node. Defaults to 'Node'
+        Returns:
+            affected - DataFrame with the position of the 'change' in the changes,
+                and the 'subsite', 'node', 'refdes', 'stream', upstream 'pdId',
+                and affected 'parameterId' and 'parameter' of each affected
+                stream parameter
+        """
+        params = []
+        for pdid in pdids:
+            for stream, parameters in affects_graph.parameter_affects(pdid).items():
+                for parameter in parameters:
+                    params.append((pdid, stream, parameter.id, parameter.name))
+        params = pd.DataFrame(params, columns=['pdId', 'stream', 'parameterId', 'parameter'])
+
+        nodes = pd.DataFrame({
+            'change': range(len(changes)),
+            'subsite': changes[subsite].values,
+            'node': changes[node].values
+        })
+        affected = nodes.merge(self.streams, on=['subsite', 'node']).merge(params, on='stream')
+        affected = affected.sort_values(by=['change', 'refdes', 'stream', 'pdId', 'parameterId'])
+        return affected.reset_index(drop=True)
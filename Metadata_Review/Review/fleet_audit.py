@@ -0,0 +1,358 @@
+import os
+import sys
+import ast
+import json
+import pickle
+import hashlib
+import importlib
+import importlib.util
+import functools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import *
+
+# The calibration parser classes live in the Calibration Parsers package
+PARSERS_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Calibration', 'Parsers', 'Parsers'))
+if PARSERS_DIRECTORY not in sys.path:
+    sys.path.append(PARSERS_DIRECTORY)
+
+
+# Bump when the parsed results change, so that the cached results are re-parsed
+CACHE_VERSION = 2
+
+
+# For each instrument class, the parser class to use and, for each of the
+# calibration sources, the parser method to call and the file endings it reads
+PARSERS = {
+    'CTDBP': {
+        'class': 'CTDBPCalibration',
+        'CAL': ('load_cal', ['.zip', '.cal']),
+        'XML': ('load_xml', ['.zip', '.xmlcon']),
+        'QCT': ('load_qct', ['.cap', '.txt', '.log']),
+    },
+    'CTDMO': {
+        'class': 'CTDMOCalibration',
+        'CAL': ('mo_parse_cal', ['.cal']),
+        'PDF': ('mo_parse_pdf', ['.pdf']),
+        'QCT': ('mo_parse_qct', ['.cap', '.txt', '.log']),
+    },
+    'NUTNR': {
+        'class': 'NUTNRCalibration',
+        'CAL': ('load_cal', ['.zip', '.cal']),
+    },
+    'OPTAA': {
+        'class': 'OPTAACalibration',
+        'CAL': ('load_cal', ['.zip', '.dev']),
+        'QCT': ('load_qct', ['.cap', '.txt', '.log']),
+    },
+    'SPKIR': {
+        'class': 'SPKIRCalibration',
+        'CAL': ('load_cal', ['.zip', '.cal']),
+    },
+    'DOSTA': {
+        'class': 'DOSTACalibration',
+        'QCT': ('load_qct', ['.cap', '.txt', '.log']),
+    },
+}
+
+
+def file_hash(filepath):
+    """Return the sha256 hash of the contents of a file"""
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def flatten_coefficients(coefficients):
+    """
+    Flatten array-valued calibration coefficients (e.g. the NUTNR and OPTAA
+    wavelength arrays) into individual name[i] entries so that every source
+    can be compared value by value.
+
+    Args:
+        coefficients - dictionary of coefficient names and values
+    Returns:
+        flat - dictionary of coefficient names and scalar values
+    """
+    flat = {}
+    for name, value in coefficients.items():
+        if isinstance(value, str) and value.strip().startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                try:
+                    value = ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    pass
+        if isinstance(value, (list, tuple, np.ndarray)):
+            for i, v in enumerate(np.ravel(value)):
+                flat.update({f'{name}[{i}]': v})
+        elif value is not None:
+            flat.update({name: value})
+    return flat
+
+
+@functools.lru_cache(maxsize=None)
+def parser_version(parser_class):
+    """
+    Return the version of a parser for the cache key: the hash of the source
+    of the parser module, so any change to the parser re-parses the files.
+    """
+    spec = importlib.util.find_spec(parser_class)
+    if spec is None or spec.origin is None:
+        return 'unknown'
+    return file_hash(spec.origin)
+
+
+def parsed_dates(date):
+    """
+    Return all of the calibration dates (YYYYMMDD) stored by a parser object,
+    e.g. the separate temperature, conductivity, and pressure calibration
+    dates (TCAL, CCAL, PCAL) of a CTD, sorted and without repeats.
+    """
+    if isinstance(date, dict):
+        date = list(date.values())
+    if not isinstance(date, (list, tuple)):
+        date = [date]
+    return sorted(set(str(x) for x in date if x is not None))
+
+
+def match_cal_date(dates, csv_dates):
+    """
+    Choose the calibration date to compare a parsed source under. A source
+    with several calibration dates (e.g. TCAL, CCAL, PCAL) is compared with
+    the asset management csv of the latest of its dates which has a csv, so
+    that the sources of one calibration stay in a single (UID, CAL DATE) row.
+    Sources which match none of the csvs fall back to their latest date.
+
+    Args:
+        dates - sorted list of the calibration dates (YYYYMMDD) of the source
+        csv_dates - the calibration dates (YYYYMMDD) of the csvs of the instrument
+    Returns:
+        date - the calibration date (YYYYMMDD) to compare the source under
+    """
+    matches = [date for date in dates if date in csv_dates]
+    return matches[-1] if len(matches) > 0 else dates[-1]
+
+
+def parse_source(instrument_class, uid, source, filepath, cache_dir):
+    """
+    Parse a single calibration source file with the instrument class parser,
+    reusing the cached result if the same file (by content hash) has already
+    been parsed for the same instrument and source by the same version of the
+    parser. Only successful parses are cached, so files which failed to parse
+    (e.g. because of a missing optional dependency) are parsed again.
+
+    Args:
+        instrument_class - the instrument class (e.g. CTDBP) of the parser
+        uid - the instrument UID
+        source - the calibration source (e.g. CAL, XML, QCT)
+        filepath - full path to the source file
+        cache_dir - directory where the parsed results are cached
+    Returns:
+        result - dictionary with the calibration dates and the coefficients,
+            or with the error raised when the file could not be parsed
+    """
+    method, ext = PARSERS[instrument_class][source]
+    parser_class = PARSERS[instrument_class]['class']
+    key = '|'.join((file_hash(filepath), instrument_class, uid, method,
+                    str(CACHE_VERSION), parser_version(parser_class)))
+    key = hashlib.sha1(key.encode()).hexdigest()
+    cache_file = '/'.join((cache_dir, key + '.pkl'))
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as file:
+            return pickle.load(file)
+
+    try:
+        module = importlib.import_module(parser_class)
+        parser = getattr(module, parser_class)(uid)
+        getattr(parser, method)(filepath)
+        result = {'dates': parsed_dates(parser.date),
+                  'coefficients': flatten_coefficients(parser.coefficients)}
+    except Exception as error:
+        return {'error': f'{type(error).__name__}: {error}'}
+
+    with open(cache_file, 'wb') as file:
+        pickle.dump(result, file)
+
+    return result
+
+
+def audit_uid(task):
+    """
+    Load and parse all of the calibration sources for a single instrument.
+    Run in a worker process by fleet_audit.
+
+    Args:
+        task - dictionary with the instrument_class, uid, the csv_files from
+            asset management, the vendor cal_files, the qct_files, and the
+            cache_dir
+    Returns:
+        uid - the instrument UID
+        sources - dictionary of the calibration sources and dataframes of the
+            coefficients, indexed by calibration date
+        errors - list of dictionaries describing the files which could not be parsed
+        mismatches - list of dictionaries describing the sources whose
+            calibration dates don't match the date they are compared under
+    """
+    uid = task['uid']
+    instrument_class = task['instrument_class']
+    records = {}
+    errors = []
+    mismatches = []
+
+    # Asset management csvs
+    for filepath in task['csv_files']:
+        data = pd.read_csv(filepath)
+        date = os.path.basename(filepath).split('__')[1].split('.')[0]
+        coefficients = flatten_coefficients(dict(zip(data['name'], data['value'])))
+        records.setdefault('CSV', {}).update({date: coefficients})
+
+    # Vendor documents and QCT check-ins
+    files = []
+    for source in PARSERS[instrument_class]:
+        if source == 'class':
+            continue
+        elif source == 'QCT':
+            files.extend([(source, filepath) for filepath in task['qct_files']])
+        else:
+            files.extend([(source, filepath) for filepath in task['cal_files']])
+    csv_dates = set(records.get('CSV', {}).keys())
+    for source, filepath in files:
+        method, ext = PARSERS[instrument_class][source]
+        if not any(filepath.lower().endswith(x) for x in ext):
+            continue
+        result = parse_source(instrument_class, uid, source, filepath, task['cache_dir'])
+        if 'error' in result:
+            errors.append({'UID': uid, 'source': source, 'file': filepath, 'error': result['error']})
+        elif len(result['dates']) > 0 and len(result['coefficients']) > 0:
+            date = match_cal_date(result['dates'], csv_dates)
+            records.setdefault(source, {}).update({date: result['coefficients']})
+            # Report the dates which disagree with the csv as their own discrepancy
+            if len(csv_dates) > 0 and (date not in csv_dates or result['dates'][-1] != date):
+                mismatches.append({'UID': uid, 'CAL DATE': date, 'source': source, 'file': filepath,
+                                   'dates': result['dates'], 'csv': date if date in csv_dates else None})
+
+    sources = {}
+    for source, cals in records.items():
+        df = pd.DataFrame.from_dict(cals, orient='index')
+        df.index = pd.to_datetime(df.index)
+        sources.update({source: df.sort_index()})
+
+    return uid, sources, errors, mismatches
+
+
+def date_discrepancies(mismatches):
+    """
+    Tabulate the sources whose calibration dates don't match the date of the
+    asset management csv they were compared against.
+
+    Args:
+        mismatches - list of the date mismatches from audit_uid
+    Returns:
+        dates - dataframe with the 'UID', the 'CAL DATE' the source was
+            compared under, the 'source' and 'file', all of the calibration
+            'dates' of the source, its latest date ('source date'), and the
+            date of the matching asset management csv ('csv date', NaT if none)
+    """
+    columns = ['UID', 'CAL DATE', 'source', 'file', 'dates', 'source date', 'csv date']
+    if len(mismatches) == 0:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame(mismatches)
+    dates = pd.DataFrame({
+        'UID': df['UID'],
+        'CAL DATE': pd.to_datetime(df['CAL DATE']),
+        'source': df['source'],
+        'file': df['file'],
+        'dates': df['dates'].apply(', '.join),
+        'source date': pd.to_datetime(df['dates'].str[-1]),
+        'csv date': pd.to_datetime(df['csv']),
+    })
+    return dates[columns].sort_values(by=['UID', 'CAL DATE', 'source']).reset_index(drop=True)
+
+
+def fleet_audit(spreadsheet, sheet_name, instrument_class, asset_management_directory,
+                cal_directory, qct_directory, series=None, cache_dir=None, max_workers=None):
+    """
+    Audits the calibration csvs in asset management for every instrument of
+    an instrument class listed in the WHOI asset tracking spreadsheet. The
+    csvs, vendor documents, and QCT check-ins of each instrument are parsed
+    in parallel across a process pool, with the parsed results cached by the
+    hash of the source file so that repeat audits only re-parse changed
+    files. All of the sources are then compared at once.
+
+    Args:
+        spreadsheet - directory path and name of the WHOI asset tracking spreadsheet
+        sheet_name - name of the sheet in the spreadsheet to load
+        instrument_class - the instrument class to audit (e.g. CTDBP, CTDMO)
+        asset_management_directory - path to the asset management calibration
+            csvs for the instrument class
+        cal_directory - path to the directory containing the vendor documents
+        qct_directory - path to the directory containing the QCT check-ins
+        series - a specified series of the instrument class to audit. Defaults
+            to None, which audits all of the series
+        cache_dir - directory to cache the parsed source files. Defaults to
+            temp/fleet_audit in the current working directory
+        max_workers - number of worker processes. Defaults to the number of CPUs
+    Returns:
+        report - dataframe of the calibration coefficients which disagree
+            between the sources (see compare_coefficients)
+        errors - dataframe of the source files which could not be parsed
+        dates - dataframe of the sources whose calibration dates don't match
+            the asset management csv (see date_discrepancies)
+    """
+    if instrument_class not in PARSERS:
+        raise ValueError(f'No calibration parser available for instrument class {instrument_class}')
+
+    if cache_dir is None:
+        cache_dir = '/'.join((os.getcwd(), 'temp', 'fleet_audit'))
+    ensure_dir(cache_dir)
+
+    instrument = whoi_asset_tracking(spreadsheet, sheet_name, instrument_class=instrument_class,
+                                     whoi=True, series=series)
+    instrument = instrument.dropna(subset=['UID'])
+    uids = sorted(list(set(instrument['UID'])))
+
+    # Locate all of the source files for every instrument up front
+    csv_dict = AssetManagementIndex(asset_management_directory).csv_dict(uids)
+    serial_nums = get_serial_nums(instrument, uids)
+    cal_dict = get_calibration_files(serial_nums, cal_directory)
+    qct_dict = get_qct_files(instrument.dropna(subset=['QCT Testing']), qct_directory)
+    qct_locator = FileLocator(qct_directory)
+
+    tasks = []
+    for uid in uids:
+        qct_files = []
+        if 'QCT' in PARSERS[instrument_class]:
+            ext = PARSERS[instrument_class]['QCT'][1]
+            for qct in qct_dict.get(uid, []):
+                if len(qct.strip()) > 0:
+                    qct_files.extend(qct_locator.find([qct.strip() + '*' + x for x in ext]))
+        tasks.append({
+            'instrument_class': instrument_class,
+            'uid': uid,
+            'csv_files': [os.path.join(asset_management_directory, file) for file in csv_dict.get(uid, [])],
+            'cal_files': [os.path.join(cal_directory, file) for file in cal_dict.get(uid, [])],
+            'qct_files': qct_files,
+            'cache_dir': cache_dir,
+        })
+
+    sources = {}
+    errors = []
+    mismatches = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for uid, uid_sources, uid_errors, uid_mismatches in executor.map(audit_uid, tasks):
+            for source, df in uid_sources.items():
+                sources.setdefault(source, {}).update({uid: df})
+            errors.extend(uid_errors)
+            mismatches.extend(uid_mismatches)
+
+    report = compare_coefficients(sources)
+    errors = pd.DataFrame(errors, columns=['UID', 'source', 'file', 'error'])
+    dates = date_discrepancies(mismatches)
+
+    return report, errors, dates
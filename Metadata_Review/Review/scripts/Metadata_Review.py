@@ -601,170 +601,14 @@ cal
 
 xml
 
-# First, I need to reindex all of the different dataframes such that they all have two indices:
-# A dataset index and a datetime index, and set them to uniform name (for concatenation)
-for uid in uids:
-    try:
-        CSV[uid]['Dataset'] = 'CSV'
-        CSV[uid].set_index(['Dataset',CSV[uid].index],inplace=True)
-        CSV[uid].index.set_names(['Dataset','Cal Date'],inplace=True)
-    except:
-        pass
-CSV
-
-qct
-
-for uid in uids:
-    qct[uid]['Dataset'] = 'QCT'
-    qct[uid].set_index(['Dataset',qct[uid].index],inplace=True)
-    qct[uid].index.set_names(['Dataset','Cal Date'],inplace=True)
-qct
-
-for uid in uids:
-    cal[uid]['Dataset'] = 'CAL'
-    cal[uid].set_index(['Dataset',cal[uid].index],inplace=True)
-    cal[uid].index.set_names(['Dataset','Cal Date'],inplace=True)
-cal
-
-for uid in uids:
-    xml[uid]['Dataset'] = 'XML'
-    xml[uid].set_index(['Dataset',xml[uid].index],inplace=True)
-    xml[uid].index.set_names(['Dataset','Cal Date'],inplace=True)
-xml
-
 # All four possible sources of calibration coefficients available for an instrument - the calibration **CSV** loaded into asset management, the calibration coefficients loaded onto the instrument during check-in (**QCT**), the **.cal** file provided by the vendor, and the **XML** file provided by the vendor. 
 #
-# The next step is to concatenate the different instruments into a single dataframe and to sort by calibration date. This will allow for comparison based on the date of the calibration.
-
-comparison = {}
-for uid in uids:
-    comparison.update({uid:pd.concat([CSV.get(uid), cal.get(uid), xml.get(uid), qct.get(uid)])})
-    comparison[uid].reset_index(level='Cal Date',inplace=True)
-    comparison[uid].sort_values(by='Cal Date',inplace=True)
-comparison
-
-
-def convert_type(x):
-    if type(x) is str:
-        return float(x)
-    else:
-        return x
-
-
-for uid in uids:
-    comparison[uid] = comparison[uid].applymap(convert_type)
-comparison
-
-
-def all_the_same(elements):
-    """
-    This function checks which values in an array are all the same.
-    
-    Args:
-        elements - an array of values
-    Returns:
-        error - an array of length (m-1) which checks if
-    
-    """
-    if len(elements) < 1:
-        return True
-    el = iter(elements)
-    first = next(el, None)
-    #check = [element == first for element in el]
-    error = [np.isclose(element,first) for element in el]
-    return error
-
-
-def locate_cal_error(array):
-    """
-    This function locates which source file (e.g. xmlcon vs csv vs cal)
-    have calibration values that are different from the others. It does
-    NOT identify which is correct, only which is different.
-    
-    Args:
-        array - A numpy array which contains the values for a specific
-                calibration coefficient for a specific date from all of
-                the calibration source files
-    Returns:
-        dataset - a list containing which calibration sources are different
-                from the other files
-        True - if all of the calibration values are the same
-        False - if the first calibration value is different
-    """
-    # Call the function to check if there are any differences between each of
-    # calibration values from the different sheets
-    error = all_the_same(array)
-    # If they are all the same, return True
-    if all(error):
-        return True
-    # If there is a mixture of True/False, find the false and return them
-    elif any(error) == True:
-        indices = [i+1 for i, j in enumerate(error) if j == False]
-        dataset = list(array.index[indices])
-        return dataset
-    # Last, if all are false, that means the first value 
-    else:
-        return False
-
-
-# With all the functions set up, now go through all of the data
-def search_for_errors(df):
-    """
-    This function is designed to search through a pandas dataframe
-    which contains all of the calibration coefficients from all of
-    the files, and check for differences.
-    
-    Args: 
-        df - A dataframe which contains all fo the calibration coefficients
-        from the asset management csv, qct checkout, and the vendor
-        files (.cal and .xmlcon)
-    Returns:
-        cal_errors - A nested dictionary containing the calibration timestamp, the
-        relevant calibration coefficient, and which file(s) have the
-        erroneous calibration file.
-    """
-    
-    cal_errors = {}
-    for date in np.unique(df['Cal Date']):
-        df2 = df[df['Cal Date'] == date]
-        wrong_cals = {}
-        for column in df2.columns.values:
-            array = df2[column]
-            array.sort_index()
-            if array.dtype == 'datetime64[ns]':
-                pass
-            else:
-                error = locate_cal_error(array)
-                if error == False:
-                    wrong_cals.update({column:array.index[0]})
-                elif error == True:
-                    pass
-                else:
-                    wrong_cals.update({column:error})
-        
-        if len(wrong_cals) < 1:
-            cal_errors.update({str(date).split('T')[0]:'No Errors'})
-        else:
-            cal_errors.update({str(date).split('T')[0]:wrong_cals})
-    
-    return cal_errors
-
-
-cal_errors = {}
-for uid in uids:
-    ce = search_for_errors(comparison[uid])
-    cal_errors.update({uid:ce})
-
+# The next step is to stack the different sources for all of the instruments into a single (source x calibration date x coefficient) array and compare them in one pass. For each coefficient, the source(s) which disagree with the other sources are returned as a tidy table, along with the consensus value from the other sources.
 
+cal_errors = compare_coefficients({'CSV': CSV, 'CAL': cal, 'XML': xml, 'QCT': qct})
 cal_errors
 
-pd.DataFrame.from_dict(cal_errors)
-
-df2=pd.DataFrame.from_dict({i: cal_errors[i] for i in cal_errors.keys()}, orient='index')
-
-df2
-
-df2.to_csv('CTDBPP_Errors.csv')
+cal_errors.to_csv('CTDBPP_Errors.csv', index=False)
 
 # Generate a dataframe of the missing files
 df_missing = pd.DataFrame(index=uids)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Review modules are imported from the parent directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
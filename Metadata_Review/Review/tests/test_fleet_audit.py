@@ -0,0 +1,148 @@
+import os
+import sys
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("wcmatch")
+import fleet_audit
+from fleet_audit import date_discrepancies, match_cal_date, parse_source
+
+
+PARSER = '''
+import os
+
+
+class FAKECalibration():
+    """Stand-in calibration parser, which records each parse in the calls file"""
+
+    def __init__(self, uid):
+        self.uid = uid
+        self.coefficients = {}
+        self.date = {}
+
+    def load_cal(self, filepath):
+        with open(os.environ["FAKE_CALLS"], "a") as file:
+            file.write(filepath + "\\n")
+        if os.environ.get("FAKE_FAIL"):
+            raise ImportError("optional dependency missing")
+        self.coefficients = {"CC_a0": 1.5e-03, "CC_array": "[1.0, 2.0]"}
+        self.date = {"TCAL": "20190501", "CCAL": "20190501", "PCAL": "20190510"}
+'''
+
+
+@pytest.fixture
+def parser(tmp_path, monkeypatch):
+    """Register a stand-in parser for the FAKE instrument class"""
+    parser_dir = tmp_path / "parsers"
+    parser_dir.mkdir()
+    (parser_dir / "FAKECalibration.py").write_text(textwrap.dedent(PARSER))
+    monkeypatch.syspath_prepend(str(parser_dir))
+    monkeypatch.delitem(sys.modules, "FAKECalibration", raising=False)
+    monkeypatch.setitem(fleet_audit.PARSERS, "FAKE", {"class": "FAKECalibration", "CAL": ("load_cal", [".cal"])})
+    monkeypatch.setenv("FAKE_CALLS", str(tmp_path / "calls.txt"))
+    fleet_audit.parser_version.cache_clear()
+    yield parser_dir
+    fleet_audit.parser_version.cache_clear()
+
+
+def calls(tmp_path):
+    path = tmp_path / "calls.txt"
+    return len(path.read_text().splitlines()) if path.exists() else 0
+
+
+@pytest.fixture
+def cal_file(tmp_path):
+    path = tmp_path / "FAKE-00001.cal"
+    path.write_text("calibration")
+    return str(path)
+
+
+def test_parse_source_caches_the_parsed_result(parser, cal_file, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    result = parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+    assert result == {"dates": ["20190501", "20190510"],
+                      "coefficients": {"CC_a0": 1.5e-03, "CC_array[0]": 1.0, "CC_array[1]": 2.0}}
+    assert calls(tmp_path) == 1 and len(os.listdir(cache_dir)) == 1
+
+    assert parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir) == result
+    assert calls(tmp_path) == 1
+
+
+def test_parse_source_does_not_cache_errors(parser, cal_file, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    monkeypatch.setenv("FAKE_FAIL", "1")
+    result = parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+    assert result == {"error": "ImportError: optional dependency missing"}
+    assert os.listdir(cache_dir) == []
+
+    monkeypatch.delenv("FAKE_FAIL")
+    assert "coefficients" in parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+    assert calls(tmp_path) == 2
+
+
+def test_parse_source_cache_key_versions(parser, cal_file, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+
+    # A new cache version re-parses the file
+    monkeypatch.setattr(fleet_audit, "CACHE_VERSION", fleet_audit.CACHE_VERSION + 1)
+    parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+    assert calls(tmp_path) == 2
+
+    # So does a change to the parser source
+    (parser / "FAKECalibration.py").write_text(textwrap.dedent(PARSER) + "\n# Changed\n")
+    fleet_audit.parser_version.cache_clear()
+    parse_source("FAKE", "CGINS-FAKE-00001", "CAL", cal_file, cache_dir)
+    assert calls(tmp_path) == 3
+    assert len(os.listdir(cache_dir)) == 3
+
+
+def test_match_cal_date():
+    dates = ["20190501", "20190510"]
+    # The latest date with a csv
+    assert match_cal_date(dates, {"20190501"}) == "20190501"
+    assert match_cal_date(dates, {"20190501", "20190510"}) == "20190510"
+    # Otherwise the latest date
+    assert match_cal_date(dates, {"20180101"}) == "20190510"
+    assert match_cal_date(dates, set()) == "20190510"
+
+
+def test_date_discrepancies():
+    empty = date_discrepancies([])
+    assert len(empty) == 0 and "csv date" in empty.columns
+
+    dates = date_discrepancies([
+        {"UID": "CGINS-FAKE-00002", "CAL DATE": "20190510", "source": "CAL", "file": "b.cal",
+         "dates": ["20190510"], "csv": None},
+        {"UID": "CGINS-FAKE-00001", "CAL DATE": "20190501", "source": "CAL", "file": "a.cal",
+         "dates": ["20190501", "20190510"], "csv": "20190501"},
+    ])
+    assert dates["UID"].tolist() == ["CGINS-FAKE-00001", "CGINS-FAKE-00002"]
+    assert dates["dates"].tolist() == ["20190501, 20190510", "20190510"]
+    assert dates["source date"].tolist() == [pd.Timestamp("2019-05-10")] * 2
+    assert dates["csv date"].iloc[0] == pd.Timestamp("2019-05-01") and pd.isnull(dates["csv date"].iloc[1])
+
+
+def test_audit_uid_compares_the_sources_in_one_row(parser, cal_file, tmp_path):
+    csv_file = tmp_path / "CGINS-FAKE-00001__20190501.csv"
+    pd.DataFrame({"serial": "00001", "name": ["CC_a0", "CC_array"], "value": [1.5e-03, "[1.0, 2.5]"],
+                  "notes": ""}).to_csv(csv_file, index=False)
+    os.makedirs(tmp_path / "cache")
+    task = {"instrument_class": "FAKE", "uid": "CGINS-FAKE-00001", "csv_files": [str(csv_file)],
+            "cal_files": [cal_file], "qct_files": [], "cache_dir": str(tmp_path / "cache")}
+
+    uid, sources, errors, mismatches = fleet_audit.audit_uid(task)
+    assert errors == []
+    assert sources["CSV"].index.tolist() == sources["CAL"].index.tolist() == [pd.Timestamp("2019-05-01")]
+    assert [(x["source"], x["dates"], x["csv"]) for x in mismatches] == \
+        [("CAL", ["20190501", "20190510"], "20190501")]
+
+    report = fleet_audit.compare_coefficients({source: {uid: df} for source, df in sources.items()})
+    assert report["name"].tolist() == ["CC_array[1]", "CC_array[1]"]
+    assert np.issubdtype(report["value"].dtype, np.floating)
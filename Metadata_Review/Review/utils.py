@@ -5,7 +5,11 @@ import re
 import numpy as np
 import pandas as pd
 import shutil
+import bisect
+import pickle
+import hashlib
 import PyPDF2
+from concurrent.futures import ThreadPoolExecutor
 from wcmatch import fnmatch
 
 
@@ -45,6 +49,138 @@ def whoi_asset_tracking(spreadsheet, sheet_name, instrument_class='All', whoi=Tr
     return instrument
 
 
+class AssetManagementIndex():
+    """
+    Index of the calibration csvs stored in a local asset management
+    repository. The directory is listed once and the csv names, which
+    follow the UID__YYYYMMDD.csv convention, are parsed into a dictionary
+    of UIDs and their sorted calibration dates. Loaded csvs are cached and
+    the index is updated incrementally when files are added, changed, or
+    removed.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.files = {}
+        self.uids = {}
+        self._data = {}
+        self.refresh()
+
+    @staticmethod
+    def parse_filename(filename):
+        """Split a UID__YYYYMMDD.csv filename into (uid, date), or None"""
+        if not filename.endswith('.csv') or '__' not in filename:
+            return None
+        uid, date = filename[:-4].split('__', 1)
+        return uid, date
+
+    def refresh(self):
+        """
+        Re-list the asset management directory and update the index for any
+        files which have been added, modified, or removed since the last
+        listing.
+
+        Returns:
+            changed - the set of filenames which were added, modified, or removed
+        """
+        files = {}
+        with os.scandir(self.filepath) as entries:
+            for entry in entries:
+                if entry.is_file() and self.parse_filename(entry.name) is not None:
+                    files.update({entry.name: entry.stat().st_mtime})
+
+        changed = {name for name in files if self.files.get(name) != files[name]}
+        changed.update(set(self.files) - set(files))
+        for name in changed:
+            self._data.pop(name, None)
+
+        if len(changed) > 0 or len(self.uids) == 0:
+            uids = {}
+            for name in files:
+                uid, date = self.parse_filename(name)
+                uids.setdefault(uid, []).append(date)
+            self.uids = {uid: sorted(dates) for uid, dates in uids.items()}
+        self.files = files
+
+        return changed
+
+    def get_files(self, uid):
+        """Return the calibration csv filenames for a UID, sorted by date"""
+        return [f'{uid}__{date}.csv' for date in self.uids.get(uid, [])]
+
+    def csv_dict(self, uids):
+        """
+        Args:
+            uids - list of instrument UIDs
+        Returns:
+            csv_dict - a dictionary of the UIDs which have calibration csvs
+                in asset management and lists of their csv filenames
+        """
+        return {uid: self.get_files(uid) for uid in uids if uid in self.uids}
+
+    def read_csv(self, filename):
+        """Load a calibration csv, reusing the cached copy if unchanged"""
+        if filename not in self._data:
+            data = pd.read_csv(os.path.join(self.filepath, filename))
+            uid, date = self.parse_filename(filename)
+            data['UID'] = uid
+            data['CAL DATE'] = pd.to_datetime(date)
+            self._data.update({filename: data})
+        return self._data[filename]
+
+    def load(self, uids=None):
+        """
+        Loads and pivots the calibration coefficients of the given UIDs.
+
+        Args:
+            uids - list of instrument UIDs to load. Defaults to None, which
+                loads every UID in the index.
+        Returns:
+            csv_cals - a dictionary which associates an instrument UID to a pandas
+                dataframe which contains the calibration coefficients. The dataframes
+                are indexed by the date of calibration
+        """
+        if uids is None:
+            uids = sorted(self.uids)
+        files = [name for uid in uids for name in self.get_files(uid)]
+        if len(files) == 0:
+            return {}
+
+        cals = pd.concat([self.read_csv(name) for name in files], ignore_index=True)
+        csv_cals = {}
+        for uid, data in cals.groupby('UID', sort=False):
+            csv_cals.update({uid: data.pivot(index='CAL DATE', columns='name', values='value')})
+
+        return csv_cals
+
+
+def match_uids(df, uids):
+    """
+    Match each of the uids to the rows of the dataframe with that UID. Exact
+    matches are resolved with a single index lookup; uids without an exact
+    match fall back to matching rows whose UID contains the uid.
+
+    Args:
+        df - dataframe with a UID column
+        uids - list of the uids to match
+    Returns:
+        matches - a dictionary of uids (key) matched to the row positions
+            of the dataframe with that uid
+    """
+    positions = pd.Series(np.arange(len(df)), index=df['UID'].astype(str).values)
+    groups = positions.groupby(level=0).apply(list).to_dict()
+
+    matches = {}
+    for uid in uids:
+        if uid in groups:
+            matches.update({uid: groups[uid]})
+        else:
+            mask = df['UID'].astype(str).str.contains(uid, regex=False).values
+            matches.update({uid: list(np.flatnonzero(mask))})
+
+    return matches
+
+
 def load_asset_management(instrument, filepath):
     """
     Loads the calibration csv files from a local repository containing
@@ -69,27 +205,7 @@ def load_asset_management(instrument, filepath):
 
     uids = sorted(list(set(instrument['UID'])))
 
-    csv_dict = {}
-    for uid in uids:
-        # Get a specified uid from the instrument dataframe
-        instrument['UID_match'] = instrument['UID'].apply(lambda x: True if uid in x else False)
-        instrument[instrument['UID_match'] == True]
-
-        # Now, get all the csvs from asset management for a particular UID
-        csv_files = []
-        for file in os.listdir(filepath):
-            if fnmatch.fnmatch(file, '*'+uid+'*'):
-                csv_files.append(file)
-            else:
-                pass
-
-        # Update the dictionary storing the asset management files for each UID
-        if len(csv_files) > 0:
-            csv_dict.update({uid: csv_files})
-        else:
-            pass
-
-    return csv_dict
+    return AssetManagementIndex(filepath).csv_dict(uids)
 
 
 def get_serial_nums(df, uids):
@@ -106,9 +222,9 @@ def get_serial_nums(df, uids):
     """
     serial_nums = {}
 
-    for uid in uids:
-        df['UID_match'] = df['UID'].apply(lambda x: True if uid in x else False)
-        serial_num = list(df[df['UID_match'] == True]['Supplier\nSerial Number'])
+    column = df['Supplier\nSerial Number'].values
+    for uid, rows in match_uids(df, uids).items():
+        serial_num = list(column[rows])
         if 'CTD' in uid:
             serial_num = serial_num[0].split('-')[1]
         serial_nums.update({uid: serial_num})
@@ -131,10 +247,9 @@ def get_qct_files(df, qct_directory):
 
     qct_dict = {}
     uids = list(set(df['UID']))
-    for uid in uids:
-        df['UID_match'] = df['UID'].apply(lambda x: True if uid in x else False)
-        qct_series = df[df['UID_match'] == True]['QCT Testing']
-        qct_series = list(qct_series.iloc[0].split('\n'))
+    column = df['QCT Testing'].values
+    for uid, rows in match_uids(df, uids).items():
+        qct_series = list(column[rows[0]].split('\n'))
         qct_dict.update({uid: qct_series})
 
     return qct_dict
@@ -152,16 +267,15 @@ def get_calibration_files(serial_nums, dirpath):
         calibration_files - a dictionary of instrument uids with associated
             calibration files
     """
+    # List the directory once, keeping only the calibration files
+    cal_files = [file for file in os.listdir(dirpath) if 'calibration_file' in file.lower()]
+
     calibration_files = {}
     for uid in serial_nums.keys():
         sn = serial_nums.get(uid)
         if type(sn) is list:
             sn = str(sn[0])
-        files = []
-        for file in os.listdir(dirpath):
-            if 'calibration_file' in file.lower():
-                if sn in file:
-                    files.append(file)
+        files = [file for file in cal_files if sn in file]
         calibration_files.update({uid: files})
 
     return calibration_files
@@ -191,22 +305,24 @@ def load_csv_info(csv_dict, filepath):
             are indexed by the date of calibration
     """
 
-    # Load the calibration data into pandas dataframes, which are then placed into
-    # a dictionary by the UID
-    csv_cals = {}
+    # Load the calibration data into a single pandas dataframe, which is then
+    # split into a dictionary by the UID
+    frames = []
     for uid in csv_dict:
-        cals = pd.DataFrame()
         for file in csv_dict[uid]:
-            data = pd.read_csv(filepath+file)
+            data = pd.read_csv(os.path.join(filepath, file))
             date = file.split('__')[1].split('.')[0]
+            data['UID'] = uid
             data['CAL DATE'] = pd.to_datetime(date)
-            cals = cals.append(data)
-        csv_cals.update({uid: cals})
+            frames.append(data)
+    if len(frames) == 0:
+        return {}
+    cals = pd.concat(frames, ignore_index=True)
 
     # Pivot the dataframe to be sorted based on calibration date
-    for uid in csv_cals:
-        csv_cals[uid] = csv_cals[uid].pivot(
-            index=csv_cals[uid]['CAL DATE'], columns='name')['value']
+    csv_cals = {}
+    for uid, data in cals.groupby('UID', sort=False):
+        csv_cals.update({uid: data.pivot(index='CAL DATE', columns='name', values='value')})
 
     return csv_cals
 
@@ -263,10 +379,153 @@ def split_multipage_pdfs(directory, pdfname):
             output.write(outputStream)
 
 
+class FileLocator():
+    """
+    Index of the files stored under a parent directory. The directory tree
+    is walked once, in parallel by top-level directory, and the basenames of
+    the files are mapped to their full paths. The index is pickled to disk
+    along with the modification times of every directory walked, so that on
+    later loads only the top-level directories which have changed are
+    re-walked.
+    """
+
+    wildcards = '*?['
+
+    def __init__(self, dirpath, exclude=['_V', '_Data_Workshop'], cache_file=None, max_workers=8):
+        self.dirpath = os.path.abspath(dirpath)
+        self.exclude = list(exclude)
+        self.max_workers = max_workers
+        if cache_file is None:
+            key = hashlib.sha1('|'.join([self.dirpath] + self.exclude).encode()).hexdigest()
+            cache_file = '/'.join((os.getcwd(), 'temp', 'file_locator', key + '.pkl'))
+        self.cache_file = cache_file
+        self.trees = {}
+        self.files = {}
+        self.names = []
+        self.mtime = None
+
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, 'rb') as file:
+                cache = pickle.load(file)
+            if cache.get('exclude') == self.exclude:
+                self.trees = cache.get('trees', {})
+        self.refresh()
+
+    def walk(self, top):
+        """
+        Walk a single top-level directory.
+
+        Args:
+            top - the directory to walk
+        Returns:
+            tree - dictionary with the mtimes of the walked directories and
+                the basenames of the files mapped to their full paths
+        """
+        mtimes = {}
+        files = {}
+        for root, dirs, fnames in os.walk(top):
+            dirs[:] = [d for d in dirs if d not in self.exclude]
+            mtimes.update({root: os.stat(root).st_mtime})
+            for fname in fnames:
+                files.setdefault(fname, []).append(os.path.join(root, fname))
+        return {'mtimes': mtimes, 'files': files}
+
+    def is_stale(self, tree):
+        """Check if any of the directories of a walked tree have been modified"""
+        for root, mtime in tree['mtimes'].items():
+            try:
+                if os.stat(root).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def refresh(self):
+        """
+        Re-walk any top-level directories which are new or have been modified
+        since they were last indexed, and save the index to disk.
+
+        Returns:
+            stale - list of the top-level directories which were re-walked
+        """
+        tops = []
+        root_files = {}
+        self.mtime = os.stat(self.dirpath).st_mtime
+        with os.scandir(self.dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name not in self.exclude:
+                    tops.append(entry.path)
+                elif entry.is_file():
+                    root_files.setdefault(entry.name, []).append(entry.path)
+
+        stale = [top for top in tops if top not in self.trees or self.is_stale(self.trees[top])]
+        removed = [top for top in self.trees if top not in tops]
+        for top in removed:
+            self.trees.pop(top)
+
+        if len(stale) > 0:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for top, tree in zip(stale, executor.map(self.walk, stale)):
+                    self.trees.update({top: tree})
+
+        files = {}
+        for fname, paths in root_files.items():
+            files.setdefault(fname, []).extend(paths)
+        for top in sorted(self.trees):
+            for fname, paths in self.trees[top]['files'].items():
+                files.setdefault(fname, []).extend(paths)
+        self.files = {fname: sorted(paths) for fname, paths in files.items()}
+        self.names = sorted(self.files)
+
+        if len(stale) > 0 or len(removed) > 0:
+            ensure_dir(os.path.dirname(self.cache_file))
+            with open(self.cache_file, 'wb') as file:
+                pickle.dump({'exclude': self.exclude, 'trees': self.trees}, file)
+
+        return stale
+
+    def find(self, patterns):
+        """
+        Find the files whose basenames match any of the glob-style patterns.
+
+        Args:
+            patterns - a glob pattern or list of glob patterns (e.g. 'QCT*.txt')
+        Returns:
+            fpaths - sorted list of the full paths of the matching files
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        fpaths = []
+        for pattern in patterns:
+            # Exact names are a direct lookup into the index
+            if not any(char in pattern for char in self.wildcards):
+                fpaths.extend(self.files.get(pattern, []))
+                continue
+            # Otherwise, only the names sharing the literal prefix need to be matched
+            prefix = pattern
+            for char in self.wildcards:
+                prefix = prefix.split(char)[0]
+            i = bisect.bisect_left(self.names, prefix)
+            while i < len(self.names) and self.names[i].startswith(prefix):
+                if fnmatch.fnmatch(self.names[i], pattern):
+                    fpaths.extend(self.files[self.names[i]])
+                i = i + 1
+
+        return sorted(set(fpaths))
+
+
+_file_locators = {}
+
+
 def generate_file_path(dirpath, filename, ext=['.cap', '.txt', '.log'], exclude=['_V', '_Data_Workshop']):
     """
     Function which searches for the location of the given file and returns
-    the full path to the file.
+    the full path to the file. The directory tree under dirpath is indexed
+    once per session (see FileLocator) and subsequent searches are answered
+    from the index. The index is refreshed when the parent directory has
+    been modified, or when the file is not found, and the search retried, so
+    that files added during the session are found.
 
     Args:
         dirpath - parent directory path under which to search
@@ -285,12 +544,19 @@ def generate_file_path(dirpath, filename, ext=['.cap', '.txt', '.log'], exclude=
         filename = check[0]
         ext = ['.'+check[1]]
 
-    for root, dirs, files in os.walk(dirpath):
-        dirs[:] = [d for d in dirs if d not in exclude]
-        for fname in files:
-            if fnmatch.fnmatch(fname, [filename+'*'+x for x in ext]):
-                fpath = os.path.join(root, fname)
-                return fpath
+    key = (os.path.abspath(dirpath), tuple(exclude))
+    locator = _file_locators.get(key)
+    if locator is None:
+        locator = _file_locators[key] = FileLocator(dirpath, exclude=exclude)
+    elif os.stat(locator.dirpath).st_mtime != locator.mtime:
+        locator.refresh()
+
+    patterns = [filename+'*'+x for x in ext]
+    fpaths = locator.find(patterns)
+    if len(fpaths) == 0 and len(locator.refresh()) > 0:
+        fpaths = locator.find(patterns)
+    if len(fpaths) > 0:
+        return fpaths[0]
 
 
 def get_file_date(x):
@@ -300,6 +566,19 @@ def get_file_date(x):
     return x[ind1+2:ind2]
 
 
+def stack_source_values(coeffs_dict):
+    """
+    Stack the 'value' columns of the calibration sources which have the same
+    number of coefficients as the first source into a (source x coefficient)
+    array.
+    """
+    keys = list(coeffs_dict.keys())
+    first = coeffs_dict.get(keys[0])['value']
+    values = [np.asarray(coeffs_dict.get(key)['value'], dtype=float) for key in keys
+              if len(coeffs_dict.get(key)['value']) == len(first)]
+    return first.index, np.vstack(values)
+
+
 def check_exact_coeffs(coeffs_dict):
     """
     Function to check if the calibration coefficients match exactly. The
@@ -312,31 +591,9 @@ def check_exact_coeffs(coeffs_dict):
     Returns:
         mask - a True/False mask of the calibration coefficient values if they match
     """
-
-    # Part 1: coeff by coeff comparison between each source of coefficients
-    keys = list(coeffs_dict.keys())
-    comparison = {}
-    for i in range(len(keys)):
-        names = (keys[i], keys[i - (len(keys)-1)])
-        check = len(coeffs_dict.get(keys[i])['value']) == len(
-            coeffs_dict.get(keys[i - (len(keys)-1)])['value'])
-        if check:
-            compare = np.equal(coeffs_dict.get(keys[i])['value'], coeffs_dict.get(
-                keys[i - (len(keys)-1)])['value'])
-            comparison.update({names: compare})
-        else:
-            pass
-
-    # Part 2: now do a logical_and comparison between the results from part 1
-    keys = list(comparison.keys())
-    i = 0
-    mask = comparison.get(keys[i])
-    while i < len(keys)-1:
-        i = i + 1
-        mask = np.logical_and(mask, comparison.get(keys[i]))
-        print(i)
-
-    return mask
+    index, values = stack_source_values(coeffs_dict)
+    mask = np.all(values == values[0], axis=0)
+    return pd.Series(mask, index=index)
 
 
 def check_relative_coeffs(coeffs_dict):
@@ -352,31 +609,133 @@ def check_relative_coeffs(coeffs_dict):
         mask - a True/False mask of the calibration coefficient values if they match
             to within a tolerance of 0.001%.
     """
+    index, values = stack_source_values(coeffs_dict)
+    # Compare each source against the next one around the ring of sources
+    mask = np.all(np.isclose(values, np.roll(values, -1, axis=0), rtol=1e-5), axis=0)
+    return pd.Series(mask, index=index)
 
-    # Part 1: coeff by coeff comparison between each source of coefficients
-    keys = list(coeffs_dict.keys())
-    comparison = {}
-    for i in range(len(keys)):
-        names = (keys[i], keys[i - (len(keys)-1)])
-        check = len(coeffs_dict.get(keys[i])['value']) == len(
-            coeffs_dict.get(keys[i - (len(keys)-1)])['value'])
-        if check:
-            compare = np.isclose(coeffs_dict.get(keys[i])['value'], coeffs_dict.get(
-                keys[i - (len(keys)-1)])['value'], rtol=1e-5)
-            comparison.update({names: compare})
-        else:
-            pass
-
-    # Part 2: now do a logical_and comparison between the results from part 1
-    keys = list(comparison.keys())
-    i = 0
-    mask = comparison.get(keys[i])
-    while i < len(keys)-1:
-        i = i + 1
-        mask = np.logical_and(mask, comparison.get(keys[i]))
-        print(i)
-
-    return mask
+
+def stack_coefficients(sources):
+    """
+    Stacks the calibration coefficients from multiple sources into a single
+    (source x calibration x coefficient) array of floats.
+
+    Args:
+        sources - a dictionary with the calibration source names (e.g. CSV,
+            CAL, XML, QCT) as keys and dictionaries of the instrument UIDs and
+            dataframes of calibration coefficients (indexed by calibration
+            date, with the coefficient names as columns) as items
+    Returns:
+        names - list of the source names (first axis)
+        index - pandas MultiIndex of the (UID, CAL DATE) pairs (second axis)
+        columns - pandas Index of the coefficient names (third axis)
+        values - numpy array of the coefficient values, with NaNs where a
+            source does not have a value
+    """
+    frames = []
+    for source, cals in sources.items():
+        for uid, df in cals.items():
+            if df is None or len(df) == 0:
+                continue
+            long = df.copy()
+            long.index = pd.to_datetime(long.index)
+            long.index.name = 'CAL DATE'
+            long.columns.name = 'name'
+            long = long.stack().rename('value').reset_index()
+            long['source'] = source
+            long['UID'] = uid
+            frames.append(long)
+
+    names = list(sources.keys())
+    if len(frames) == 0:
+        index = pd.MultiIndex.from_tuples([], names=['UID', 'CAL DATE'])
+        return names, index, pd.Index([], name='name'), np.empty((len(names), 0, 0))
+
+    data = pd.concat(frames, ignore_index=True)
+    data['value'] = pd.to_numeric(data['value'], errors='coerce')
+
+    rows = pd.MultiIndex.from_frame(data[['UID', 'CAL DATE']])
+    index = rows.unique().sort_values()
+    columns = pd.Index(sorted(data['name'].unique()), name='name')
+
+    values = np.full((len(names), len(index), len(columns)), np.nan)
+    values[pd.Index(names).get_indexer(data['source']),
+           index.get_indexer(rows),
+           columns.get_indexer(data['name'])] = data['value'].values
+
+    return names, index, columns, values
+
+
+def compare_coefficients(sources, rtol=1e-5):
+    """
+    Compares the calibration coefficients from all of the sources for all
+    of the instruments and calibration dates at once. For each coefficient,
+    every source is compared against every other source, and the sources
+    which agree with fewer of the other sources than the majority are
+    flagged as the odd-one-out.
+
+    Args:
+        sources - a dictionary of calibration sources, see stack_coefficients
+        rtol - relative tolerance for the relative comparison. Defaults to
+            1e-5 (0.001%)
+    Returns:
+        discrepancies - a dataframe with a row for each (UID, CAL DATE, name,
+            source) which disagrees with the other sources, along with the
+            value, the consensus value of the other sources, the number of
+            sources with a value, and whether the values agree exactly or
+            within the relative tolerance
+    """
+    names, index, columns, values = stack_coefficients(sources)
+    present = ~np.isnan(values)
+    n_sources = present.sum(axis=0)
+
+    with np.errstate(invalid='ignore'):
+        exact = (np.nanmax(np.where(present, values, -np.inf), axis=0) ==
+                 np.nanmin(np.where(present, values, np.inf), axis=0))
+
+    # Pairwise (source x source) agreement within the relative tolerance
+    agree = np.isclose(values[:, None], values[None, :], rtol=rtol)
+    agree = agree & present[:, None] & present[None, :]
+    counts = agree.sum(axis=1)
+    relative = (counts.max(axis=0) == n_sources)
+
+    # The odd-one-out sources agree with fewer sources than the best-supported value.
+    # If there is no majority (e.g. two vs. two), all of the sources are flagged
+    odd = present & (counts < counts.max(axis=0)) & ~relative
+    tied = ~relative & ~odd.any(axis=0) & (n_sources > 0)
+    odd = odd | (present & tied)
+    consensus_source = np.argmax(counts, axis=0)
+    consensus = np.take_along_axis(values, consensus_source[None], axis=0)[0]
+
+    s, r, c = np.nonzero(odd)
+    discrepancies = pd.DataFrame({
+        'UID': index.get_level_values('UID')[r],
+        'CAL DATE': index.get_level_values('CAL DATE')[r],
+        'name': columns[c],
+        'source': np.asarray(names)[s],
+        'value': values[s, r, c],
+        'consensus': consensus[r, c],
+        'n_sources': n_sources[r, c],
+        'exact': exact[r, c],
+        'relative': relative[r, c],
+    })
+
+    # Coefficients which are missing from a source that has the calibration
+    s, r, c = np.nonzero(~present & present.any(axis=2)[:, :, None] & (n_sources > 0)[None])
+    missing = pd.DataFrame({
+        'UID': index.get_level_values('UID')[r],
+        'CAL DATE': index.get_level_values('CAL DATE')[r],
+        'name': columns[c],
+        'source': np.asarray(names)[s],
+        'value': np.nan,
+        'consensus': consensus[r, c],
+        'n_sources': n_sources[r, c],
+        'exact': exact[r, c],
+        'relative': relative[r, c],
+    })
+
+    discrepancies = pd.concat([discrepancies, missing], ignore_index=True)
+    return discrepancies.sort_values(by=['UID', 'CAL DATE', 'name', 'source']).reset_index(drop=True)
 
 
 def copy_to_local(cal_path):
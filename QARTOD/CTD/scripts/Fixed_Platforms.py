@@ -45,6 +45,12 @@ from m2m import M2M
 # Import QARTOD utils
 sys.path.append("../../")
 from utils import *
+# The Gross_Range and Climatology fits of the QARTOD modules replace those in utils
+from climatology import Climatology, fit_climatologies
+from gross_range import Gross_Range
+from masking import MaskedDataset
+from annotations import load_annotations, add_annotation_flags
+from robust_stats import iqr_fences, fence_mask
 
 import matplotlib.pyplot as plt
 # %matplotlib inline
@@ -224,18 +230,19 @@ data = data.sortby("time")
 # #### Annotations
 # The annotations associated with a specific reference designator may contain relevant information on the performance or reliability of the data for a given dataset. The annotations are downloaded from OOINet as a json and processed into a pandas dataframe. Each annotation may apply to the entire dataset, to a specific stream, or to a specific variable. With the downloaed annotations, we can use the information contained in the ```qcFlag``` column to translate the annotations into QC flags, which can then be used to filter out bad data. 
 
-annotations = OOINet.get_annotations(refdes)
+annotations = load_annotations(refdes, OOINet.get_annotations)
 annotations
 
 # Pass in the annotations and the dataset to add the annotation ```qcFlag``` values to the dataset
 
-data = OOINet.add_annotation_qc_flag(data, annotations)
+data = add_annotation_flags(data, annotations)
 data
 
-# Use the added ```qcFlag``` values to filter out bad (```qcFlag``` value of 9) data from the dataset
+# Use the added ```qcFlag``` values to mask out bad (```qcFlag``` value of 9) data. The fits skip the masked data, so only the plots need a filtered copy of the dataset
 
-data = data.where(data.rollup_annotations_qc_results != 9, drop=True)
-data
+data = MaskedDataset(data).exclude(data.rollup_annotations_qc_results == 9, "annotations")
+plot_data = data.export()
+plot_data
 
 # ### Plot the data
 # The code below allows for quickly plotting the key CTD data parameters. The data range plotted can also be adjusted using tstart/tend.
@@ -253,23 +260,23 @@ fig, (ax0, ax1, ax2) = plt.subplots(nrows=3, ncols=1, figsize=(15,12))
 tstart, tend = "2010-01-01", "2021-01-01"
 #tstart, tend = "2015-05-01", "2016-01-01"
 
-ax0.plot(data.time.loc[dict(time=slice(tstart, tend))],
-         data[temp].loc[dict(time=slice(tstart, tend))],
+ax0.plot(plot_data.time.loc[dict(time=slice(tstart, tend))],
+         plot_data[temp].loc[dict(time=slice(tstart, tend))],
          marker=".", linestyle="", color="tab:red")
-ax0.set_ylabel(data[temp].attrs["long_name"])
-ax0.set_title(data.attrs["id"])
+ax0.set_ylabel(plot_data[temp].attrs["long_name"])
+ax0.set_title(plot_data.attrs["id"])
 ax0.grid()
 
-ax1.plot(data.time.loc[dict(time=slice(tstart, tend))],
-         data[cond].loc[dict(time=slice(tstart, tend))],
+ax1.plot(plot_data.time.loc[dict(time=slice(tstart, tend))],
+         plot_data[cond].loc[dict(time=slice(tstart, tend))],
          marker=".", linestyle="", color="tab:blue")
-ax1.set_ylabel(data[cond].attrs["long_name"])
+ax1.set_ylabel(plot_data[cond].attrs["long_name"])
 ax1.grid()
 
-ax2.plot(data.time.loc[dict(time=slice(tstart, tend))],
-         data[pres].loc[dict(time=slice(tstart, tend))],
+ax2.plot(plot_data.time.loc[dict(time=slice(tstart, tend))],
+         plot_data[pres].loc[dict(time=slice(tstart, tend))],
          marker=".", linestyle="", color="black")
-ax2.set_ylabel(data[pres].attrs["long_name"])
+ax2.set_ylabel(plot_data[pres].attrs["long_name"])
 ax2.grid()
 ax2.invert_yaxis()
 
@@ -387,12 +394,12 @@ for ind in refdes_metadata.index:
         # Plot the results for checking
         fig, ax = plt.subplots(figsize=(12, 8))
         # Plot the instrument_recovered data
-        s = ax.scatter(data.time, data[param], c="tab:blue")
+        s = ax.scatter(plot_data.time, plot_data[param], c="tab:blue")
         ax.plot(climatology.fitted_data, c="tab:red")
         ax.fill_between(climatology.fitted_data.index, climatology.fitted_data + 3*climatology.sigma,
                         climatology.fitted_data - 3*climatology.sigma, color="tab:red", alpha=0.3)
-        ax.set_ylabel(data[param].attrs['long_name'])
-        ax.set_title(data.attrs["id"])
+        ax.set_ylabel(plot_data[param].attrs['long_name'])
+        ax.set_title(plot_data.attrs["id"])
         ax.grid()
         fig.autofmt_xdate()
 
@@ -453,11 +460,12 @@ for refdes in sorted(fixed_platforms):
     
     # ----------------------------------------
     # Download and add the annotation qc flags
+    data = MaskedDataset(data)
     try:
-        annotations = OOINet.get_annotations(refdes)
-        data = OOINet.add_annotation_qc_flag(data, annotations)
-        # Drop the bad qc flags
-        data = data.where(data.rollup_annotations_qc_results != 9, drop=True)
+        annotations = load_annotations(refdes, OOINet.get_annotations)
+        add_annotation_flags(data.ds, annotations)
+        # Mask the bad qc flags
+        data.exclude(data["rollup_annotations_qc_results"] == 9, "annotations")
     except:
         pass
     
@@ -468,58 +476,64 @@ for refdes in sorted(fixed_platforms):
     
     subsite, node, sensor = refdes.split("-",2)
 
+    # Match each stream's particleKeys to the dataset parameters. The stream variants
+    # share the same data, so each parameter only needs to be fit once
+    entries = []
     for ind in refdes_metadata.index:
         stream, particleKeys = refdes_metadata[["stream", "particleKey"]].loc[ind]
-
         for pKey in particleKeys:
             if pKey == "depth":
                 continue
+            entries.append((stream, pKey, process.extractOne(pKey, params)[0]))
 
-            # Get the appropriate parameter
-            param = process.extractOne(pKey, params)[0]
+    gross_ranges = {}
+    for stream, pKey, param in entries:
+        if param in gross_ranges:
+            continue
 
-            # Get the correct fail ranges based on the values
-            if "temp" in pKey:
-                fail_min, fail_max = (-5, 35)
-            elif "cond" in pKey:
-                fail_min, fail_max = (0, 9)
-            else:
-                fail_min, fail_max = (0, 5000)
-
-            # Calculate the gross_range
-            gross_range = Gross_Range(fail_min, fail_max)
-            gross_range.fit(data, param, sigma=3)
-            gross_range.make_qcConfig()
-
-            # Append the results
-            gross_range_table = gross_range_table.append({
-                "subsite": subsite,
-                "node": node,
-                "sensor": sensor,
-                "stream": stream,
-                "parameter": pKey,
-                "qcConfig": gross_range.qcConfig
-            }, ignore_index=True)
-            
-            # Filter out the "suspect" values from the data
-            data = data.where((data[param] <= gross_range.suspect_max) &
-                              (data[param] >= gross_range.suspect_min), 
-                               drop=True)
-            
-            # Calculate the climatology
-            climatology = Climatology()
-            climatology.fit(data, param)
-            climatology.make_qcConfig()
-
-            # Append the results
-            climatology_table = climatology_table.append({
-                "subsite": subsite,
-                "node": node,
-                "sensor": sensor,
-                "stream": stream,
-                "parameters": {"inp":pKey, "tinp":"time", "zinp": None},
-                "qcConfig": climatology.qcConfig
-            }, ignore_index=True)
+        # Get the correct fail ranges based on the values
+        if "temp" in pKey:
+            fail_min, fail_max = (-5, 35)
+        elif "cond" in pKey:
+            fail_min, fail_max = (0, 9)
+        else:
+            fail_min, fail_max = (0, 5000)
+
+        # Calculate the gross_range
+        gross_range = Gross_Range(fail_min, fail_max)
+        gross_range.fit(data, param, sigma=3)
+        gross_range.make_qcConfig()
+        gross_ranges[param] = gross_range
+
+    # Mask out the "suspect" values of each parameter and fit the climatology of
+    # all of the parameters at once
+    suspect_masks = {
+        param: ((data[param] <= gross_range.suspect_max) & (data[param] >= gross_range.suspect_min)).values
+        for param, gross_range in gross_ranges.items()
+    }
+    climatologies = fit_climatologies(data, list(gross_ranges), masks=suspect_masks)
+    for climatology in climatologies.values():
+        climatology.make_qcConfig()
+
+    # Append the results
+    for stream, pKey, param in entries:
+        gross_range_table = gross_range_table.append({
+            "subsite": subsite,
+            "node": node,
+            "sensor": sensor,
+            "stream": stream,
+            "parameter": pKey,
+            "qcConfig": gross_ranges[param].qcConfig
+        }, ignore_index=True)
+
+        climatology_table = climatology_table.append({
+            "subsite": subsite,
+            "node": node,
+            "sensor": sensor,
+            "stream": stream,
+            "parameters": {"inp":pKey, "tinp":"time", "zinp": None},
+            "qcConfig": climatologies[param].qcConfig
+        }, ignore_index=True)
         
     # -------------------------------------------
     # Save the gross range and climatology tables
@@ -538,34 +552,20 @@ for refdes in sorted(fixed_platforms):
 # As a check on the results, compare the QARTOD Tables on an array or two as a check on the results
 
 # +
-import json
+from qc_config import decode_column
+from climatology import expand_climatology
 
 def parse_qcConfig(x):
-    x = x.replace("None",'"None"')
-    x = x.replace("'",'"')
-    x = json.loads(x)
-    return x
+    return decode_column([x])[0]
 
 def create_qc_timeseries(ds, qcConfig):
     
-    # Parse the qcConfig object
-    qcdf = pd.DataFrame(qcConfig["qartod"]["climatology"]["config"])
-    qcdf = qcdf.drop(columns="period")
-    qcdf["tstart"] = qcdf["tspan"].apply(lambda x: int(x[0]))
-    qcdf["tend"] = qcdf["tspan"].apply(lambda x: int(x[1]))
-    qcdf["vmin"] = qcdf["vspan"].apply(lambda x: float(x[0]))
-    qcdf["vmax"] = qcdf["vspan"].apply(lambda x: float(x[1]))
-    
     tmin = pd.to_datetime(np.min(ds.time).values)
     tmax = pd.to_datetime(np.max(ds.time).values)
     
+    # Look up the climatology of each month directly from the month numbers
     dates = pd.date_range(start=tmin, end=tmax, freq="M", normalize=True)
-    vmin = []
-    vmax = []
-    for t in dates:
-        # Get the month value
-        vmin.append(qcdf[qcdf["tend"] == t.month]["vmin"].iloc[0])
-        vmax.append(qcdf[qcdf["tend"] == t.month]["vmax"].iloc[0]) 
+    vmin, vmax = expand_climatology(dates.values, qcConfig)
         
     df = pd.DataFrame(data=np.array([vmin, vmax]).T, index=dates, columns=["vmin","vmax"])
     
@@ -633,9 +633,11 @@ catalog
 ga01sumo_data = OOINet.load_netCDF_datasets(sorted(catalog))
 ga01sumo_data
 
-annotations = OOINet.get_annotations(refdes)
-ga01sumo_data = OOINet.add_annotation_qc_flag(ga01sumo_data, annotations)
-ga01sumo_data = ga01sumo_data.where(ga01sumo_data.rollup_annotations_qc_results != 9, drop=True)
+annotations = load_annotations(refdes, OOINet.get_annotations)
+ga01sumo_masked = MaskedDataset(add_annotation_flags(ga01sumo_data, annotations))
+ga01sumo_masked.exclude(ga01sumo_masked["rollup_annotations_qc_results"] == 9, "annotations")
+# The fits use the masks, the comparison plots an explicit copy of the data which is kept
+ga01sumo_data = ga01sumo_masked.export()
 
 # +
 # Load the gross_range and climatology
@@ -649,9 +651,9 @@ for file in os.listdir("../results/climatology/"):
         ga01sumo_climatology = pd.read_csv("../results/climatology/" + file)
         
 # Clean up the qartod table to be parseable
-ga01sumo_gross_range["qcConfig"] = ga01sumo_gross_range["qcConfig"].apply(lambda x: parse_qcConfig(x))
-ga01sumo_climatology["parameters"] = ga01sumo_climatology["parameters"].apply(lambda x: parse_qcConfig(x))
-ga01sumo_climatology["qcConfig"] = ga01sumo_climatology["qcConfig"].apply(lambda x: parse_qcConfig(x))
+ga01sumo_gross_range["qcConfig"] = decode_column(ga01sumo_gross_range["qcConfig"])
+ga01sumo_climatology["parameters"] = decode_column(ga01sumo_climatology["parameters"])
+ga01sumo_climatology["qcConfig"] = decode_column(ga01sumo_climatology["qcConfig"])
 # -
 
 ga01sumo_climatology_ts = {}
@@ -711,9 +713,11 @@ catalog
 ga03flma_data = OOINet.load_netCDF_datasets(sorted(catalog))
 ga03flma_data
 
-annotations = OOINet.get_annotations(refdes)
-ga03flma_data = OOINet.add_annotation_qc_flag(ga03flma_data, annotations)
-ga03flma_data = ga03flma_data.where(ga03flma_data.rollup_annotations_qc_results != 9, drop=True)
+annotations = load_annotations(refdes, OOINet.get_annotations)
+ga03flma_masked = MaskedDataset(add_annotation_flags(ga03flma_data, annotations))
+ga03flma_masked.exclude(ga03flma_masked["rollup_annotations_qc_results"] == 9, "annotations")
+# The fits use the masks, the comparison plots an explicit copy of the data which is kept
+ga03flma_data = ga03flma_masked.export()
 
 # +
 # Load the gross_range and climatology
@@ -727,9 +731,9 @@ for file in os.listdir("../results/climatology/"):
         ga03flma_climatology = pd.read_csv("../results/climatology/" + file)
         
 # Clean up the qartod table to be parseable
-ga03flma_gross_range["qcConfig"] = ga03flma_gross_range["qcConfig"].apply(lambda x: parse_qcConfig(x))
-ga03flma_climatology["parameters"] = ga03flma_climatology["parameters"].apply(lambda x: parse_qcConfig(x))
-ga03flma_climatology["qcConfig"] = ga03flma_climatology["qcConfig"].apply(lambda x: parse_qcConfig(x))
+ga03flma_gross_range["qcConfig"] = decode_column(ga03flma_gross_range["qcConfig"])
+ga03flma_climatology["parameters"] = decode_column(ga03flma_climatology["parameters"])
+ga03flma_climatology["qcConfig"] = decode_column(ga03flma_climatology["qcConfig"])
 # -
 
 ga03flma_climatology_ts = {}
@@ -787,9 +791,11 @@ ga03flmb_data = OOINet.load_netCDF_datasets(sorted(catalog))
 ga03flmb_data
 
 # Get annotations and filter
-annotations = OOINet.get_annotations(refdes)
-ga03flmb_data = OOINet.add_annotation_qc_flag(ga03flmb_data, annotations)
-ga03flmb_data = ga03flmb_data.where(ga03flmb_data.rollup_annotations_qc_results != 9, drop=True)
+annotations = load_annotations(refdes, OOINet.get_annotations)
+ga03flmb_masked = MaskedDataset(add_annotation_flags(ga03flmb_data, annotations))
+ga03flmb_masked.exclude(ga03flmb_masked["rollup_annotations_qc_results"] == 9, "annotations")
+# The fits use the masks, the comparison plots an explicit copy of the data which is kept
+ga03flmb_data = ga03flmb_masked.export()
 
 # +
 # Load the gross_range and climatology
@@ -803,9 +809,9 @@ for file in os.listdir("../results/climatology/"):
         ga03flmb_climatology = pd.read_csv("../results/climatology/" + file)
         
 # Clean up the qartod table to be parseable
-ga03flmb_gross_range["qcConfig"] = ga03flmb_gross_range["qcConfig"].apply(lambda x: parse_qcConfig(x))
-ga03flmb_climatology["parameters"] = ga03flmb_climatology["parameters"].apply(lambda x: parse_qcConfig(x))
-ga03flmb_climatology["qcConfig"] = ga03flmb_climatology["qcConfig"].apply(lambda x: parse_qcConfig(x))
+ga03flmb_gross_range["qcConfig"] = decode_column(ga03flmb_gross_range["qcConfig"])
+ga03flmb_climatology["parameters"] = decode_column(ga03flmb_climatology["parameters"])
+ga03flmb_climatology["qcConfig"] = decode_column(ga03flmb_climatology["qcConfig"])
 # -
 
 ga03flmb_climatology_ts = {}
@@ -1174,53 +1180,31 @@ ga01sumo_gross_range.loc[4]["qcConfig"]
 #
 # Next, I'm going to test the effect on the climatological fits and the time-series correlations based on removing data using the range test of (Q1 - 1.5 * IQR, Q3 + 1.5 * IQR). This should be less susceptible to outlier events, and should hopefully help synchronize the seasonal fits.
 
-def calc_interquartile_stats(ds, param):
-    
-    Q1 = np.percentile(ds[param], 25)
-    Q3 = np.percentile(ds[param], 75)
-    IQR = Q3 - Q1
-    Qmin = Q1 - 1.5*IQR
-    Qmax = Q3 + 1.5*IQR
-    
-    return {
-        "Q1": Q1,
-        "Q3": Q3,
-        "IQR": IQR,
-        "Qmin": Qmin,
-        "Qmax": Qmax
-    }
+# +
+# Calculate the IQR fences of temperature and conductivity in one scan of each dataset
+ga01sumo_iqr = iqr_fences(ga01sumo_masked, ["ctdmo_seawater_temperature", "ctdmo_seawater_conductivity"])
+ga03flma_iqr = iqr_fences(ga03flma_masked, ["ctdmo_seawater_temperature", "ctdmo_seawater_conductivity"])
+ga03flmb_iqr = iqr_fences(ga03flmb_masked, ["ctdmo_seawater_temperature", "ctdmo_seawater_conductivity"])
 
 
-ga01sumo_iqr = {
-    "ctdmo_seawater_temperature": calc_interquartile_stats(ga01sumo_data, "ctdmo_seawater_temperature"),
-    "ctdmo_seawater_conductivity": calc_interquartile_stats(ga01sumo_data, "ctdmo_seawater_conductivity")
-}
-ga03flma_iqr = {
-    "ctdmo_seawater_temperature": calc_interquartile_stats(ga03flma_data, "ctdmo_seawater_temperature"),
-    "ctdmo_seawater_conductivity": calc_interquartile_stats(ga03flma_data, "ctdmo_seawater_conductivity")
-}
-ga03flmb_iqr = {
-    "ctdmo_seawater_temperature": calc_interquartile_stats(ga03flmb_data, "ctdmo_seawater_temperature"),
-    "ctdmo_seawater_conductivity": calc_interquartile_stats(ga03flmb_data, "ctdmo_seawater_conductivity")
-}
+def masked_copy(data, param, mask):
+    """Copy only the param observations kept by the mask (and the annotations) for plotting"""
+    return data.ds[[param]].isel(time=np.flatnonzero(mask & data.mask()))
+# -
 
-# Filter the data
+# Mask the data
 # Temperature
-ga01sumo_temp = ga01sumo_data
-ga01sumo_temp = ga01sumo_temp.where((ga01sumo_temp.ctdmo_seawater_temperature >= ga01sumo_iqr["ctdmo_seawater_temperature"]["Qmin"])
-                                    & (ga01sumo_temp.ctdmo_seawater_temperature <= ga01sumo_iqr["ctdmo_seawater_temperature"]["Qmax"]),
-                                    drop=True)
+ga01sumo_temp_mask = fence_mask(ga01sumo_masked["ctdmo_seawater_temperature"].data, ga01sumo_iqr["ctdmo_seawater_temperature"])
+ga01sumo_temp = masked_copy(ga01sumo_masked, "ctdmo_seawater_temperature", ga01sumo_temp_mask)
 # Conductivity
-ga01sumo_cond = ga01sumo_data
-ga01sumo_cond = ga01sumo_cond.where((ga01sumo_cond.ctdmo_seawater_conductivity >= ga01sumo_iqr["ctdmo_seawater_conductivity"]["Qmin"])
-                                    & (ga01sumo_cond.ctdmo_seawater_conductivity <= ga01sumo_iqr["ctdmo_seawater_conductivity"]["Qmax"]),
-                                    drop=True)
+ga01sumo_cond_mask = fence_mask(ga01sumo_masked["ctdmo_seawater_conductivity"].data, ga01sumo_iqr["ctdmo_seawater_conductivity"])
+ga01sumo_cond = masked_copy(ga01sumo_masked, "ctdmo_seawater_conductivity", ga01sumo_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga01sumo_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga01sumo_masked, "ctdmo_seawater_temperature", mask=ga01sumo_temp_mask)
 ga01sumo_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga01sumo_temp_clim["sigma"] = climatology.sigma
 ga01sumo_temp_clim["vmin"] = np.floor((ga01sumo_temp_clim["mean"] - 3*ga01sumo_temp_clim["sigma"])*100)/100
@@ -1228,30 +1212,26 @@ ga01sumo_temp_clim["vmax"] = np.ceil((ga01sumo_temp_clim["mean"] + 3*ga01sumo_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga01sumo_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga01sumo_masked, "ctdmo_seawater_conductivity", mask=ga01sumo_cond_mask)
 ga01sumo_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga01sumo_cond_clim["sigma"] = climatology.sigma
 ga01sumo_cond_clim["vmin"] = np.floor((ga01sumo_cond_clim["mean"] - 3*ga01sumo_cond_clim["sigma"])*100)/100
 ga01sumo_cond_clim["vmax"] = np.ceil((ga01sumo_cond_clim["mean"] + 3*ga01sumo_cond_clim["sigma"])*100)/100
 # -
 
-# Filter the data
+# Mask the data
 # Temperature
-ga03flma_temp = ga03flma_data
-ga03flma_temp = ga03flma_temp.where((ga03flma_temp.ctdmo_seawater_temperature >= ga03flma_iqr["ctdmo_seawater_temperature"]["Qmin"])
-                                    & (ga03flma_temp.ctdmo_seawater_temperature <= ga03flma_iqr["ctdmo_seawater_temperature"]["Qmax"]),
-                                    drop=True)
+ga03flma_temp_mask = fence_mask(ga03flma_masked["ctdmo_seawater_temperature"].data, ga03flma_iqr["ctdmo_seawater_temperature"])
+ga03flma_temp = masked_copy(ga03flma_masked, "ctdmo_seawater_temperature", ga03flma_temp_mask)
 # Conductivity
-ga03flma_cond = ga03flma_data
-ga03flma_cond = ga03flma_cond.where((ga03flma_cond.ctdmo_seawater_conductivity >= ga03flma_iqr["ctdmo_seawater_conductivity"]["Qmin"])
-                                    & (ga03flma_cond.ctdmo_seawater_conductivity <= ga03flma_iqr["ctdmo_seawater_conductivity"]["Qmax"]),
-                                    drop=True)
+ga03flma_cond_mask = fence_mask(ga03flma_masked["ctdmo_seawater_conductivity"].data, ga03flma_iqr["ctdmo_seawater_conductivity"])
+ga03flma_cond = masked_copy(ga03flma_masked, "ctdmo_seawater_conductivity", ga03flma_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga03flma_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga03flma_masked, "ctdmo_seawater_temperature", mask=ga03flma_temp_mask)
 ga03flma_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flma_temp_clim["sigma"] = climatology.sigma
 ga03flma_temp_clim["vmin"] = np.floor((ga03flma_temp_clim["mean"] - 3*ga03flma_temp_clim["sigma"])*100)/100
@@ -1259,30 +1239,26 @@ ga03flma_temp_clim["vmax"] = np.ceil((ga03flma_temp_clim["mean"] + 3*ga03flma_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga03flma_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga03flma_masked, "ctdmo_seawater_conductivity", mask=ga03flma_cond_mask)
 ga03flma_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flma_cond_clim["sigma"] = climatology.sigma
 ga03flma_cond_clim["vmin"] = np.floor((ga03flma_cond_clim["mean"] - 3*ga03flma_cond_clim["sigma"])*100)/100
 ga03flma_cond_clim["vmax"] = np.ceil((ga03flma_cond_clim["mean"] + 3*ga03flma_cond_clim["sigma"])*100)/100
 # -
 
-# Filter the data
+# Mask the data
 # Temperature
-ga03flmb_temp = ga03flmb_data
-ga03flmb_temp = ga03flmb_temp.where((ga03flmb_temp.ctdmo_seawater_temperature >= ga03flmb_iqr["ctdmo_seawater_temperature"]["Qmin"])
-                                    & (ga03flmb_temp.ctdmo_seawater_temperature <= ga03flmb_iqr["ctdmo_seawater_temperature"]["Qmax"]),
-                                    drop=True)
+ga03flmb_temp_mask = fence_mask(ga03flmb_masked["ctdmo_seawater_temperature"].data, ga03flmb_iqr["ctdmo_seawater_temperature"])
+ga03flmb_temp = masked_copy(ga03flmb_masked, "ctdmo_seawater_temperature", ga03flmb_temp_mask)
 # Conductivity
-ga03flmb_cond = ga03flmb_data
-ga03flmb_cond = ga03flmb_cond.where((ga03flmb_cond.ctdmo_seawater_conductivity >= ga03flmb_iqr["ctdmo_seawater_conductivity"]["Qmin"])
-                                    & (ga03flmb_cond.ctdmo_seawater_conductivity <= ga03flmb_iqr["ctdmo_seawater_conductivity"]["Qmax"]),
-                                    drop=True)
+ga03flmb_cond_mask = fence_mask(ga03flmb_masked["ctdmo_seawater_conductivity"].data, ga03flmb_iqr["ctdmo_seawater_conductivity"])
+ga03flmb_cond = masked_copy(ga03flmb_masked, "ctdmo_seawater_conductivity", ga03flmb_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga03flmb_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga03flmb_masked, "ctdmo_seawater_temperature", mask=ga03flmb_temp_mask)
 ga03flmb_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flmb_temp_clim["sigma"] = climatology.sigma
 ga03flmb_temp_clim["vmin"] = np.floor((ga03flmb_temp_clim["mean"] - 3*ga03flmb_temp_clim["sigma"])*100)/100
@@ -1290,7 +1266,7 @@ ga03flmb_temp_clim["vmax"] = np.ceil((ga03flmb_temp_clim["mean"] + 3*ga03flmb_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga03flmb_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga03flmb_masked, "ctdmo_seawater_conductivity", mask=ga03flmb_cond_mask)
 ga03flmb_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flmb_cond_clim["sigma"] = climatology.sigma
 ga03flmb_cond_clim["vmin"] = np.floor((ga03flmb_cond_clim["mean"] - 3*ga03flmb_cond_clim["sigma"])*100)/100
@@ -1403,23 +1379,21 @@ fig.autofmt_xdate()
 
 gross_range_temp
 
-# Filter the data
+# Mask the data
 # Temperature
-ga01sumo_temp = ga01sumo_data
-ga01sumo_temp = ga01sumo_temp.where((ga01sumo_temp.ctdmo_seawater_temperature >= gross_range_temp["ga01sumo"]["3-sigma"][0])
-                                    & (ga01sumo_temp.ctdmo_seawater_temperature <= gross_range_temp["ga01sumo"]["3-sigma"][1]),
-                                    drop=True)
+ga01sumo_temp_mask = ((ga01sumo_masked["ctdmo_seawater_temperature"] >= gross_range_temp["ga01sumo"]["3-sigma"][0])
+                       & (ga01sumo_masked["ctdmo_seawater_temperature"] <= gross_range_temp["ga01sumo"]["3-sigma"][1])).values
+ga01sumo_temp = masked_copy(ga01sumo_masked, "ctdmo_seawater_temperature", ga01sumo_temp_mask)
 # Conductivity
-ga01sumo_cond = ga01sumo_data
-ga01sumo_cond = ga01sumo_cond.where((ga01sumo_cond.ctdmo_seawater_conductivity >= gross_range_cond["ga01sumo"]["3-sigma"][0])
-                                    & (ga01sumo_cond.ctdmo_seawater_conductivity <= gross_range_cond["ga01sumo"]["3-sigma"][1]),
-                                    drop=True)
+ga01sumo_cond_mask = ((ga01sumo_masked["ctdmo_seawater_conductivity"] >= gross_range_cond["ga01sumo"]["3-sigma"][0])
+                       & (ga01sumo_masked["ctdmo_seawater_conductivity"] <= gross_range_cond["ga01sumo"]["3-sigma"][1])).values
+ga01sumo_cond = masked_copy(ga01sumo_masked, "ctdmo_seawater_conductivity", ga01sumo_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga01sumo_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga01sumo_masked, "ctdmo_seawater_temperature", mask=ga01sumo_temp_mask)
 ga01sumo_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga01sumo_temp_clim["sigma"] = climatology.sigma
 ga01sumo_temp_clim["vmin"] = np.floor((ga01sumo_temp_clim["mean"] - 3*ga01sumo_temp_clim["sigma"])*100)/100
@@ -1427,30 +1401,28 @@ ga01sumo_temp_clim["vmax"] = np.ceil((ga01sumo_temp_clim["mean"] + 3*ga01sumo_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga01sumo_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga01sumo_masked, "ctdmo_seawater_conductivity", mask=ga01sumo_cond_mask)
 ga01sumo_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga01sumo_cond_clim["sigma"] = climatology.sigma
 ga01sumo_cond_clim["vmin"] = np.floor((ga01sumo_cond_clim["mean"] - 3*ga01sumo_cond_clim["sigma"])*100)/100
 ga01sumo_cond_clim["vmax"] = np.ceil((ga01sumo_cond_clim["mean"] + 3*ga01sumo_cond_clim["sigma"])*100)/100
 # -
 
-# Filter the data
+# Mask the data
 # Temperature
-ga03flma_temp = ga03flma_data
-ga03flma_temp = ga03flma_temp.where((ga03flma_temp.ctdmo_seawater_temperature >= gross_range_temp["ga03flma"]["3-sigma"][0])
-                                    & (ga03flma_temp.ctdmo_seawater_temperature <= gross_range_temp["ga03flma"]["3-sigma"][1]),
-                                    drop=True)
+ga03flma_temp_mask = ((ga03flma_masked["ctdmo_seawater_temperature"] >= gross_range_temp["ga03flma"]["3-sigma"][0])
+                       & (ga03flma_masked["ctdmo_seawater_temperature"] <= gross_range_temp["ga03flma"]["3-sigma"][1])).values
+ga03flma_temp = masked_copy(ga03flma_masked, "ctdmo_seawater_temperature", ga03flma_temp_mask)
 # Conductivity
-ga03flma_cond = ga03flma_data
-ga03flma_cond = ga03flma_cond.where((ga03flma_cond.ctdmo_seawater_conductivity >= gross_range_cond["ga03flma"]["3-sigma"][0])
-                                    & (ga03flma_cond.ctdmo_seawater_conductivity <= gross_range_cond["ga03flma"]["3-sigma"][1]),
-                                    drop=True)
+ga03flma_cond_mask = ((ga03flma_masked["ctdmo_seawater_conductivity"] >= gross_range_cond["ga03flma"]["3-sigma"][0])
+                       & (ga03flma_masked["ctdmo_seawater_conductivity"] <= gross_range_cond["ga03flma"]["3-sigma"][1])).values
+ga03flma_cond = masked_copy(ga03flma_masked, "ctdmo_seawater_conductivity", ga03flma_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga03flma_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga03flma_masked, "ctdmo_seawater_temperature", mask=ga03flma_temp_mask)
 ga03flma_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flma_temp_clim["sigma"] = climatology.sigma
 ga03flma_temp_clim["vmin"] = np.floor((ga03flma_temp_clim["mean"] - 3*ga03flma_temp_clim["sigma"])*100)/100
@@ -1458,30 +1430,28 @@ ga03flma_temp_clim["vmax"] = np.ceil((ga03flma_temp_clim["mean"] + 3*ga03flma_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga03flma_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga03flma_masked, "ctdmo_seawater_conductivity", mask=ga03flma_cond_mask)
 ga03flma_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flma_cond_clim["sigma"] = climatology.sigma
 ga03flma_cond_clim["vmin"] = np.floor((ga03flma_cond_clim["mean"] - 3*ga03flma_cond_clim["sigma"])*100)/100
 ga03flma_cond_clim["vmax"] = np.ceil((ga03flma_cond_clim["mean"] + 3*ga03flma_cond_clim["sigma"])*100)/100
 # -
 
-# Filter the data
+# Mask the data
 # Temperature
-ga03flmb_temp = ga03flmb_data
-ga03flmb_temp = ga03flmb_temp.where((ga03flmb_temp.ctdmo_seawater_temperature >= gross_range_temp["ga03flmb"]["3-sigma"][0])
-                                    & (ga03flmb_temp.ctdmo_seawater_temperature <= gross_range_temp["ga03flmb"]["3-sigma"][1]),
-                                    drop=True)
+ga03flmb_temp_mask = ((ga03flmb_masked["ctdmo_seawater_temperature"] >= gross_range_temp["ga03flmb"]["3-sigma"][0])
+                       & (ga03flmb_masked["ctdmo_seawater_temperature"] <= gross_range_temp["ga03flmb"]["3-sigma"][1])).values
+ga03flmb_temp = masked_copy(ga03flmb_masked, "ctdmo_seawater_temperature", ga03flmb_temp_mask)
 # Conductivity
-ga03flmb_cond = ga03flmb_data
-ga03flmb_cond = ga03flmb_cond.where((ga03flmb_cond.ctdmo_seawater_conductivity >= gross_range_cond["ga03flmb"]["3-sigma"][0])
-                                    & (ga03flmb_cond.ctdmo_seawater_conductivity <= gross_range_cond["ga03flmb"]["3-sigma"][1]),
-                                    drop=True)
+ga03flmb_cond_mask = ((ga03flmb_masked["ctdmo_seawater_conductivity"] >= gross_range_cond["ga03flmb"]["3-sigma"][0])
+                       & (ga03flmb_masked["ctdmo_seawater_conductivity"] <= gross_range_cond["ga03flmb"]["3-sigma"][1])).values
+ga03flmb_cond = masked_copy(ga03flmb_masked, "ctdmo_seawater_conductivity", ga03flmb_cond_mask)
 
 # +
 # Calculate the climatologies for the filtered data
 # Temperature
 climatology = Climatology()
-climatology.fit(ga03flmb_temp, "ctdmo_seawater_temperature")
+climatology.fit(ga03flmb_masked, "ctdmo_seawater_temperature", mask=ga03flmb_temp_mask)
 ga03flmb_temp_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flmb_temp_clim["sigma"] = climatology.sigma
 ga03flmb_temp_clim["vmin"] = np.floor((ga03flmb_temp_clim["mean"] - 3*ga03flmb_temp_clim["sigma"])*100)/100
@@ -1489,7 +1459,7 @@ ga03flmb_temp_clim["vmax"] = np.ceil((ga03flmb_temp_clim["mean"] + 3*ga03flmb_te
 
 # Conductivity
 climatology = Climatology()
-climatology.fit(ga03flmb_cond, "ctdmo_seawater_conductivity")
+climatology.fit(ga03flmb_masked, "ctdmo_seawater_conductivity", mask=ga03flmb_cond_mask)
 ga03flmb_cond_clim = pd.DataFrame(climatology.fitted_data, columns=["mean"])
 ga03flmb_cond_clim["sigma"] = climatology.sigma
 ga03flmb_cond_clim["vmin"] = np.floor((ga03flmb_cond_clim["mean"] - 3*ga03flmb_cond_clim["sigma"])*100)/100
@@ -1614,70 +1584,70 @@ gross_range_cond = {
 
 ga01sumo_temp_gross_range = Gross_Range(-5, 35)
 # 5-sigma range
-ga01sumo_temp_gross_range.fit(ga01sumo_data, "ctdmo_seawater_temperature")
+ga01sumo_temp_gross_range.fit(ga01sumo_masked, "ctdmo_seawater_temperature", sigma=5)
 gross_range_temp["ga01sumo"]["5-sigma"] = ga01sumo_temp_gross_range.suspect_min, ga01sumo_temp_gross_range.suspect_max
 # 3-sigma range
-ga01sumo_temp_gross_range.fit(ga01sumo_data, "ctdmo_seawater_temperature", sigma=3)
+ga01sumo_temp_gross_range.fit(ga01sumo_masked, "ctdmo_seawater_temperature", sigma=3)
 gross_range_temp["ga01sumo"]["3-sigma"] = ga01sumo_temp_gross_range.suspect_min, ga01sumo_temp_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga01sumo_data, "ctdmo_seawater_temperature")
+IQR = ga01sumo_iqr["ctdmo_seawater_temperature"]
 gross_range_temp["ga01sumo"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 ga03flma_temp_gross_range = Gross_Range(-5, 35)
 # 5-sigma range
-ga03flma_temp_gross_range.fit(ga03flma_data, "ctdmo_seawater_temperature")
+ga03flma_temp_gross_range.fit(ga03flma_masked, "ctdmo_seawater_temperature", sigma=5)
 gross_range_temp["ga03flma"]["5-sigma"] = ga03flma_temp_gross_range.suspect_min, ga03flma_temp_gross_range.suspect_max
 # 3-sigma range
-ga03flma_temp_gross_range.fit(ga03flma_data, "ctdmo_seawater_temperature", sigma=3)
+ga03flma_temp_gross_range.fit(ga03flma_masked, "ctdmo_seawater_temperature", sigma=3)
 gross_range_temp["ga03flma"]["3-sigma"] = ga03flma_temp_gross_range.suspect_min, ga03flma_temp_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga03flma_data, "ctdmo_seawater_temperature")
+IQR = ga03flma_iqr["ctdmo_seawater_temperature"]
 gross_range_temp["ga03flma"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 ga03flmb_temp_gross_range = Gross_Range(-5, 35)
 # 5-sigma range
-ga03flmb_temp_gross_range.fit(ga03flmb_data, "ctdmo_seawater_temperature")
+ga03flmb_temp_gross_range.fit(ga03flmb_masked, "ctdmo_seawater_temperature", sigma=5)
 gross_range_temp["ga03flmb"]["5-sigma"] = ga03flmb_temp_gross_range.suspect_min, ga03flmb_temp_gross_range.suspect_max
 # 3-sigma range
-ga03flmb_temp_gross_range.fit(ga03flmb_data, "ctdmo_seawater_temperature", sigma=3)
+ga03flmb_temp_gross_range.fit(ga03flmb_masked, "ctdmo_seawater_temperature", sigma=3)
 gross_range_temp["ga03flmb"]["3-sigma"] = ga03flmb_temp_gross_range.suspect_min, ga03flmb_temp_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga03flmb_data, "ctdmo_seawater_temperature")
+IQR = ga03flmb_iqr["ctdmo_seawater_temperature"]
 gross_range_temp["ga03flmb"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 gross_range_temp
 
 ga01sumo_cond_gross_range = Gross_Range(0, 9)
 # 5-sigma range
-ga01sumo_cond_gross_range.fit(ga01sumo_data, "ctdmo_seawater_conductivity")
+ga01sumo_cond_gross_range.fit(ga01sumo_masked, "ctdmo_seawater_conductivity", sigma=5)
 gross_range_cond["ga01sumo"]["5-sigma"] = ga01sumo_cond_gross_range.suspect_min, ga01sumo_cond_gross_range.suspect_max
 # 3-sigma range
-ga01sumo_cond_gross_range.fit(ga01sumo_data, "ctdmo_seawater_conductivity", sigma=3)
+ga01sumo_cond_gross_range.fit(ga01sumo_masked, "ctdmo_seawater_conductivity", sigma=3)
 gross_range_cond["ga01sumo"]["3-sigma"] = ga01sumo_cond_gross_range.suspect_min, ga01sumo_cond_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga01sumo_data, "ctdmo_seawater_conductivity")
+IQR = ga01sumo_iqr["ctdmo_seawater_conductivity"]
 gross_range_cond["ga01sumo"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 ga03flma_cond_gross_range = Gross_Range(0, 9)
 # 5-sigma range
-ga03flma_cond_gross_range.fit(ga03flma_data, "ctdmo_seawater_conductivity")
+ga03flma_cond_gross_range.fit(ga03flma_masked, "ctdmo_seawater_conductivity", sigma=5)
 gross_range_cond["ga03flma"]["5-sigma"] = ga03flma_cond_gross_range.suspect_min, ga03flma_cond_gross_range.suspect_max
 # 3-sigma range
-ga03flma_cond_gross_range.fit(ga03flma_data, "ctdmo_seawater_conductivity", sigma=3)
+ga03flma_cond_gross_range.fit(ga03flma_masked, "ctdmo_seawater_conductivity", sigma=3)
 gross_range_cond["ga03flma"]["3-sigma"] = ga03flma_cond_gross_range.suspect_min, ga03flma_cond_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga03flma_data, "ctdmo_seawater_conductivity")
+IQR = ga03flma_iqr["ctdmo_seawater_conductivity"]
 gross_range_cond["ga03flma"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 ga03flmb_cond_gross_range = Gross_Range(0, 9)
 # 5-sigma range
-ga03flmb_cond_gross_range.fit(ga03flmb_data, "ctdmo_seawater_conductivity")
+ga03flmb_cond_gross_range.fit(ga03flmb_masked, "ctdmo_seawater_conductivity", sigma=5)
 gross_range_cond["ga03flmb"]["5-sigma"] = ga03flmb_cond_gross_range.suspect_min, ga03flmb_cond_gross_range.suspect_max
 # 3-sigma range
-ga03flmb_cond_gross_range.fit(ga03flmb_data, "ctdmo_seawater_conductivity", sigma=3)
+ga03flmb_cond_gross_range.fit(ga03flmb_masked, "ctdmo_seawater_conductivity", sigma=3)
 gross_range_cond["ga03flmb"]["3-sigma"] = ga03flmb_cond_gross_range.suspect_min, ga03flmb_cond_gross_range.suspect_max
 # Interquartile Range
-IQR = calc_interquartile_stats(ga03flmb_data, "ctdmo_seawater_conductivity")
+IQR = ga03flmb_iqr["ctdmo_seawater_conductivity"]
 gross_range_cond["ga03flmb"]["1.5*IQR"] = (np.round(IQR["Qmin"], 2), np.round(IQR["Qmax"], 2))
 
 gross_range_cond
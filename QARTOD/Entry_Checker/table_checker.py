@@ -13,10 +13,15 @@
 #     name: python3
 # ---
 
-import glob
-import ast
+import yaml
 import pandas as pd
 import os
+import sys
+import glob
+
+# Import the shared QARTOD qcConfig codec
+sys.path.append("../")
+from qc_config import decode_column, load_flat_table
 
 
 # +
@@ -34,15 +39,15 @@ def parse_gross_range_table(table):
          The gross range qc-lookup table with the entries parsed into functional entries.
     """
     
-    # Parse the table entries which are dictionaries
-    table["parameters"] = table["parameters"].apply(lambda x: ast.literal_eval(x))
-    table["qcConfig"] = table["qcConfig"].apply(lambda x: x.replace('nan','None'))
-    table["qcConfig"] = table["qcConfig"].apply(lambda x: ast.literal_eval(x))
+    # Parse the table entries which are dictionaries, decoding each column in one pass
+    table["parameters"] = decode_column(table["parameters"])
+    table["qcConfig"] = decode_column(table["qcConfig"])
 
     # Next, parse out the inputs, fail_span, and suspect_span into their own columns
-    table["inp"] = table["parameters"].apply(lambda x: x.get("inp"))
-    table["fail_span"] = table["qcConfig"].apply(lambda x: x.get("qartod").get("gross_range_test").get("fail_span"))
-    table["suspect_span"] = table["qcConfig"].apply(lambda x: x.get("qartod").get("gross_range_test").get("suspect_span"))
+    tests = [x["qartod"]["gross_range_test"] for x in table["qcConfig"]]
+    table["inp"] = [x.get("inp") for x in table["parameters"]]
+    table["fail_span"] = [x.get("fail_span") for x in tests]
+    table["suspect_span"] = [x.get("suspect_span") for x in tests]
 
     return table
 
@@ -60,11 +65,145 @@ def parse_climatology_table(table):
     table: (pd.DataFrame)
          The climatology qc-lookup table with the entries parsed into functional entries.
     """
-    table["parameters"] = table["parameters"].apply(lambda x: ast.literal_eval(x))
-    table["inp"] = table["parameters"].apply(lambda x: x.get("inp"))
+    table["parameters"] = decode_column(table["parameters"])
+    table["inp"] = [x.get("inp") for x in table["parameters"]]
     return table
 
 
+# +
+# Environment variable and config file used to locate the qc-lookup repository
+QARTOD_DIR_ENV = "QARTOD_DIR"
+QARTOD_CONFIG = os.path.expanduser("~/.qartod_lookup.yaml")
+
+# In-memory caches of the parsed qc-lookup tables and climatology table listings,
+# keyed on the path and invalidated when the file or directory mtime changes
+_table_cache = {}
+_listing_cache = {}
+
+
+def is_qartod_dir(path, inst_class=None):
+    """Check that a directory is the qartod directory of the qc-lookup repository.
+
+    Parameters
+    ----------
+    path: (str)
+        The candidate directory
+    inst_class: (str)
+        The instrument class, e.g. "ctdbp", whose gross range table must be in the
+        directory. Defaults to None, which accepts the table of any instrument class
+
+    Returns
+    -------
+    valid: (boolean)
+        True if the directory contains <inst_class>/<inst_class>_qartod_gross_range_test_values.csv
+    """
+    if path is None or not os.path.isdir(path):
+        return False
+    if inst_class is not None:
+        return os.path.isfile(f"{path}/{inst_class}/{inst_class}_qartod_gross_range_test_values.csv")
+    return len(glob.glob(f"{glob.escape(path)}/*/*_qartod_gross_range_test_values.csv")) > 0
+
+
+def find_qartod_dir(config=QARTOD_CONFIG, search_roots=["/home/"], max_depth=5, inst_class=None):
+    """Locate the qartod directory of the qc-lookup repository.
+
+    The location is resolved, in order, from the QARTOD_DIR environment variable,
+    the "qartod_dir" entry of the config file, and finally a single search of the
+    search_roots down to max_depth directories. Each location is only accepted if
+    it contains the qc-lookup tables (see is_qartod_dir), and a location found by
+    searching is saved to the config file so that the search only ever runs once.
+
+    Parameters
+    ----------
+    config: (str)
+        Path to the yaml config file which stores the qartod directory location
+    search_roots: (list -> str)
+        Directories to search under if the location is not configured
+    max_depth: (int)
+        The maximum number of directories below the search_roots to search
+    inst_class: (str)
+        The instrument class whose tables the directory must contain. Defaults to
+        None, which accepts the tables of any instrument class
+
+    Returns
+    -------
+    qartod_dir: (str)
+        The path to the qartod directory, which contains a directory of qc-lookup
+        tables for each instrument class
+    """
+    qartod_dir = os.environ.get(QARTOD_DIR_ENV)
+    if is_qartod_dir(qartod_dir, inst_class):
+        return qartod_dir
+
+    settings = {}
+    if config is not None and os.path.exists(config):
+        with open(config) as file:
+            settings = yaml.safe_load(file) or {}
+        qartod_dir = settings.get("qartod_dir")
+        if is_qartod_dir(qartod_dir, inst_class):
+            return qartod_dir
+
+    for root in search_roots:
+        root_depth = root.rstrip("/").count("/")
+        for dirpath, dirs, files in os.walk(root):
+            if os.path.basename(dirpath) == "qartod" and is_qartod_dir(dirpath, inst_class):
+                settings.update({"qartod_dir": dirpath})
+                if config is not None:
+                    with open(config, "w") as file:
+                        yaml.safe_dump(settings, file)
+                return dirpath
+            if dirpath.rstrip("/").count("/") - root_depth >= max_depth:
+                dirs[:] = []
+            else:
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+
+    raise FileNotFoundError(f"Unable to locate the qartod qc-lookup directory. Set {QARTOD_DIR_ENV} or {config}.")
+
+
+def load_table(path, kind, cache_dir=None):
+    """Load a flattened qc-lookup table, reusing the cached table if the file is unchanged.
+
+    The table is flattened with load_flat_table, so the parameters and qcConfig
+    strings are only decoded when the contents of the table change, and kept in
+    memory until the file mtime changes.
+
+    Parameters
+    ----------
+    path: (str)
+        The path to the qc-lookup table csv
+    kind: (str: "gross_range" or "climatology")
+        Which qartod test the table is for
+    cache_dir: (str)
+        Directory of the parquet cache of the flattened tables. Defaults to
+        temp/qc_config in the current working directory
+
+    Returns
+    -------
+    table: (pd.DataFrame)
+        The flattened qc-lookup table, with the inp parsed out of the parameters.
+        The table is shared between callers and should not be modified in place.
+    """
+    mtime = os.stat(path).st_mtime
+    cached = _table_cache.get((path, kind))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, load_flat_table(path, kind, cache_dir=cache_dir))
+        _table_cache[(path, kind)] = cached
+    return cached[1]
+
+
+def list_tables(table_dir):
+    """Return the set of files in the climatology tables directory, cached on its mtime."""
+    try:
+        mtime = os.stat(table_dir).st_mtime
+    except OSError:
+        return set()
+    cached = _listing_cache.get(table_dir)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, set(os.listdir(table_dir)))
+        _listing_cache[table_dir] = cached
+    return cached[1]
+
+
 # +
 def check_entry_gross_range(refdes, stream, variables, gross_range_test_values):
     """
@@ -185,10 +324,11 @@ def check_entry_climatology(refdes, stream, variables, climatology_test_values,
             results["tableKeyMatch"].append(False)
         else:
             # Now check that the table is there
+            tables = list_tables(f"{qartod_dir}/climatology_tables")
             for cind in match.index:
                 tablePath = match.loc[cind, "climatologyTable"]
                 # Check that the table exists
-                tableExists = os.path.exists(f"{qartod_dir}/{tablePath}")
+                tableExists = tablePath.split("/")[-1] in tables
                 if tableExists:
                     # Check that the tableKey matches the input key
                     tableName = tablePath.split("/")[1].split("-")[-1].split(".")[0]
@@ -222,7 +362,9 @@ def check_entries(refdes, stream, variables, qartod_dir=None, tests=["gross_rang
     variables: (str or list)
         The variable(s) for the reference designator-stream to check are in the qc-lookup table
     qartod_dir: (str)
-        The path to where qc-lookup tables for the qartod tests are located
+        The path to where qc-lookup tables for the qartod tests are located, i.e. the
+        directory of the instrument class, e.g. <qartod>/ctdbp. Defaults to None, which
+        locates the directory with find_qartod_dir
     tests: (list -> str: ["gross_range", "climatology"])
         A list of qartod tests which to check the qc-lookup value tables for the relevant 
         reference designator - stream - variable entries.
@@ -252,17 +394,16 @@ def check_entries(refdes, stream, variables, qartod_dir=None, tests=["gross_rang
 
     # Find the directory where the qartod tables are stored
     if qartod_dir is None:
-        qartod_dir = "/home/"
-        qartod_dir = glob.glob(qartod_dir + "**/" + "qartod/" + inst_class, recursive=True)[0]
+        qartod_dir = f"{find_qartod_dir(inst_class=inst_class)}/{inst_class}"
         
     # Load the test tables
     for test in tests:
         if "gross_range" in test:
-            gross_range_test_table = pd.read_csv(f"{qartod_dir}/{inst_class}_qartod_gross_range_test_values.csv")
-            gross_range_test_table = parse_gross_range_table(gross_range_test_table)
+            gross_range_test_table = load_table(f"{qartod_dir}/{inst_class}_qartod_gross_range_test_values.csv",
+                                                "gross_range")
         elif "climatology" in test:
-            climatology_test_table = pd.read_csv(f"{qartod_dir}/{inst_class}_qartod_climatology_test_values.csv")
-            climatology_test_table = parse_climatology_table(climatology_test_table)
+            climatology_test_table = load_table(f"{qartod_dir}/{inst_class}_qartod_climatology_test_values.csv",
+                                                "climatology")
         else:
             raise FileExistsError(f"{test} not yet available.")
     
@@ -278,3 +419,110 @@ def check_entries(refdes, stream, variables, qartod_dir=None, tests=["gross_rang
 
     # Return the results
     return gross_range_results, climatology_results
+
+
+# +
+def index_table(table):
+    """Index a flattened qc-lookup table on its (subsite, node, sensor, stream, inp) key.
+
+    Parameters
+    ----------
+    table: (pd.DataFrame)
+        A flattened gross range or climatology qc-lookup table, see load_table.
+
+    Returns
+    -------
+    index: (pd.DataFrame)
+        The qc-lookup table key columns indexed by (subsite, node, sensor, stream, inp),
+        with the climatologyTable column retained if the table has one.
+    """
+    keys = ["subsite", "node", "sensor", "stream", "inp"]
+    columns = keys + [col for col in ["climatologyTable"] if col in table.columns]
+    index = table[columns].copy()
+    index["inp"] = index["inp"].astype(str)
+    return index.set_index(keys).sort_index()
+
+
+def check_entries_batch(entries, lookup_dir=None, tests=["gross_range", "climatology"]):
+    """
+    Check if many reference designator - stream - variable entries are in the qc-lookup tables.
+
+    Each instrument class table is loaded and parsed once, indexed on
+    (subsite, node, sensor, stream, inp), and all of the entries for that class are checked
+    with a single join. The climatology_tables directory is listed once per instrument class.
+
+    Parameters
+    ----------
+    entries: (pd.DataFrame or list)
+        The entries to check, either a dataframe with "refdes", "stream", and "variable"
+        columns or a list of (refdes, stream, variable) tuples.
+    lookup_dir: (str)
+        The path to the qartod directory of the qc-lookup repository, which has a
+        directory of tables for each instrument class, i.e. the qc-lookup tables for
+        CTDBPs are in <lookup_dir>/ctdbp. Unlike the qartod_dir of check_entries, which
+        is the directory of a single instrument class. Defaults to None, which locates
+        the directory with find_qartod_dir
+    tests: (list -> str: ["gross_range", "climatology"])
+        A list of qartod tests which to check the qc-lookup value tables for.
+
+    Returns
+    -------
+    results: (pd.DataFrame)
+        A dataframe with the following columns:
+        * refdes: reference designator
+        * stream: stream
+        * variable: variable
+        * test: the qartod test
+        * missing: boolean value indicating if the refdes-stream-variable is in the qc-lookup table
+        * tableExists: for the climatology test, if "missing" is False, a boolean which checks if
+                       the climatologyTable for the variable exists
+        * tableKeyMatch: for the climatology test, if "tableExists" is True, a boolean which checks
+                         if the key in the name of the climatologyTable matches the variable
+    """
+    if not isinstance(entries, pd.DataFrame):
+        entries = pd.DataFrame(list(entries), columns=["refdes", "stream", "variable"])
+    # Check each entry once, however many times it is given
+    entries = entries[["refdes", "stream", "variable"]].drop_duplicates().reset_index(drop=True)
+    entries[["subsite", "node", "sensor"]] = entries["refdes"].str.split("-", n=2, expand=True)
+    entries["inp"] = entries["variable"].astype(str)
+    entries["inst_class"] = entries["sensor"].str.split("-").str[-1].str[0:5].str.lower()
+    keys = ["subsite", "node", "sensor", "stream", "inp"]
+
+    if lookup_dir is None:
+        lookup_dir = find_qartod_dir()
+
+    results = []
+    for inst_class, group in entries.groupby("inst_class", sort=False):
+        class_dir = f"{lookup_dir}/{inst_class}"
+        for test in tests:
+            if "gross_range" in test:
+                table = load_table(f"{class_dir}/{inst_class}_qartod_gross_range_test_values.csv",
+                                   "gross_range")
+                index = index_table(table)
+                matched = group.join(index.assign(found=True), on=keys, how="left")
+                result = matched[["refdes", "stream", "variable"]].copy()
+                result["test"] = "gross_range"
+                result["missing"] = matched["found"].isna().values
+            elif "climatology" in test:
+                table = load_table(f"{class_dir}/{inst_class}_qartod_climatology_test_values.csv",
+                                   "climatology")
+                index = index_table(table)
+                # List the climatology tables once rather than checking each path
+                tables = list_tables(f"{class_dir}/climatology_tables")
+                matched = group.join(index.assign(found=True), on=keys, how="left")
+                result = matched[["refdes", "stream", "variable"]].copy()
+                result["test"] = "climatology"
+                result["missing"] = matched["found"].isna().values
+                paths = matched["climatologyTable"].fillna("").astype(str)
+                names = paths.str.split("/").str[1].fillna("")
+                result["tableExists"] = (~result["missing"] & names.isin(tables)).values
+                result["tableKeyMatch"] = (result["tableExists"] &
+                                           (names.str.split("-").str[-1].str.split(".").str[0] == matched["inp"])).values
+            else:
+                raise FileExistsError(f"{test} not yet available.")
+            # Repeated table entries for the same key give the same result
+            results.append(result.drop_duplicates())
+
+    if len(results) == 0:
+        return pd.DataFrame(columns=["refdes", "stream", "variable", "test", "missing", "tableExists", "tableKeyMatch"])
+    return pd.concat(results, ignore_index=True)
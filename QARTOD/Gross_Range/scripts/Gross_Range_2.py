@@ -19,7 +19,7 @@
 # The purpose of this notebook is to identify the necessary UFrame data streams and data parameters from CGSN-controlled instruments for quality control by QARTOD algorithms. 
 
 # Import libraries that will be used
-import os, shutil, sys, time, re, requests, csv, datetime, pytz
+import os, shutil, sys, time, re, requests, csv, pytz
 import time
 import yaml
 import pandas as pd
@@ -65,19 +65,6 @@ def get_and_print_api(url):
     # Return the data
     return data
         
-# Specify some functions to convert timestamps
-ntp_epoch = datetime.datetime(1900, 1, 1)
-unix_epoch = datetime.datetime(1970, 1, 1)
-ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
-
-def ntp_seconds_to_datetime(ntp_seconds):
-    return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta).replace(microsecond=0)
-  
-def convert_time(ms):
-    if ms is None:
-        return None
-    else:
-        return datetime.datetime.utcfromtimestamp(ms/1000)
 
 
 # -
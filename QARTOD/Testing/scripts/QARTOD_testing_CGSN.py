@@ -14,7 +14,7 @@
 # ---
 
 # Import libraries
-import os, shutil, sys, time, re, requests, csv, datetime, pytz
+import os, shutil, sys, time, re, csv, datetime, pytz
 import yaml
 import pandas as pd
 import numpy as np
@@ -25,6 +25,11 @@ warnings.filterwarnings("ignore")
 
 from ooinet import M2M
 
+# Import the QARTOD tools
+sys.path.append("../../")
+from timestamps import swap_timestamps
+from dataset_diff import diff_datasets
+
 import dask
 from dask.diagnostics import ProgressBar
 
@@ -119,32 +124,6 @@ def preprocess_instrument(ds):
     gc.collect()
     return ds
 
-def swap_timestamps(ds):
-    """
-    Swaps the timestamps from the host to the instrument timestamp
-    for the CTDBPs
-    """
-    if "internal_timestamp" in ds.variables:
-        # Calculate the timestamp
-        inst_time = ds.internal_timestamp.to_pandas()
-        attrs = ds.internal_timestamp.attrs
-        # Convert the time
-        inst_time = inst_time.apply(lambda x: np.datetime64(int(x), 's'))
-        # Create a DataArary
-        da = xr.DataArray(inst_time, attrs=attrs)
-        ds['internal_timestamp'] = da
-    ds = ds.set_coords(["internal_timestamp"])
-    ds = ds.swap_dims({"time":"internal_timestamp"})
-    ds = ds.reset_coords("time")
-    ds = ds.rename_vars({"time":"host_time"})
-    ds["host_time"].attrs = {
-        "long_name": "DCL Timestamp",
-        "comment": ("The timestamp that the instrument data as recorded by the mooring data "
-                    "concentration logger (DCL)")
-    }
-    ds = ds.rename({"internal_timestamp":"time"})
-    return ds
-
 
 # -
 
@@ -294,17 +273,14 @@ tmax = dev01_data["time"].max()
 production_data = production_data.sel(time=slice(tmin, tmax))
 dev01_data = dev01_data.sel(time=slice(tmin, tmax))
 
-comparison = (production_data[f"{param}_qartod_results"] == dev01_data[f"{param}_qartod_results"])
-comparison
-
-(~comparison).sum().compute()
+# Compare the values and QARTOD flags of the matched observations chunk by chunk,
+# counting the mismatches and the time ranges of consecutive mismatches
+summary, mismatches = diff_datasets(production_data, dev01_data,
+                                    [param, f"{param}_qartod_results", f"{param}_qartod_executed"],
+                                    tolerance="1s")
+summary
 
-value_check = (production_data[param] == dev01_data[param])
-value_check
-
-production_data[f"{param}_qartod_results"][~comparison]
-
-dev01_data[f"{param}_qartod_results"][~comparison]
+mismatches
 
 # ### QARTOD values
 # Next, load the QARTOD tables from github and parse them into dictionaries.
@@ -314,59 +290,31 @@ dev01_data[f"{param}_qartod_results"][~comparison]
 inst = "CTDMO"
 #param = "ctdbp_seawater_temperature"
 
-import io
-import json
+# Import the qc-lookup mirror
+sys.path.append("../../")
+from qc_lookup import QCLookupMirror
+from qc_config import decode_column
+from climatology import expand_climatology
+
+# The qc-lookup tables are synced once into a local mirror and served from memory.
+# Set offline=True to work only from the tables which have already been mirrored.
+qc_lookup = QCLookupMirror()
+
 def loadQARTOD(refDes,param,sensorType):
     
-    (site,node,sensor1,sensor2) = refDes.split('-')
-    sensor = sensor1 + '-' + sensor2
-    
     ### Load climatology and gross range values
-    githubBaseURL = 'https://raw.githubusercontent.com/oceanobservatories/qc-lookup/master/qartod/'
     if 'ph_seawater' in param:
         ClimParam = 'seawater_ph'
     else:
         ClimParam = param
-    clim_URL = githubBaseURL + sensorType + '/climatology_tables/' + refDes + '-' + ClimParam + '.csv'
-    grossRange_URL = githubBaseURL + sensorType + '/' + sensorType + '_qartod_gross_range_test_values.csv'
-    download = requests.get(grossRange_URL)
-    if download.status_code == 200:
-        df_grossRange = pd.read_csv(io.StringIO(download.content.decode('utf-8')))
-        paramString = "{'inp': '" + param + "'}"
-        qcConfig = df_grossRange.qcConfig[(df_grossRange.subsite == site) 
-                                          & (df_grossRange.node == node) 
-                                          & (df_grossRange.sensor == sensor) 
-                                          & (df_grossRange.parameters == paramString)]
-        qcConfig_json = qcConfig.values[0].replace("'", "\"")
-        grossRange_dict = json.loads(qcConfig_json)
-    else:
+
+    grossRange_dict = qc_lookup.gross_range(refDes, param, inst_class=sensorType)
+    if len(grossRange_dict) == 0:
         print('error retriving gross range data')
-        grossRange_dict = {}
-
-    download = requests.get(clim_URL)
-    if download.status_code == 200:
-        df_clim = pd.read_csv(io.StringIO(download.content.decode('utf-8')))
-        climRename = {
-                'Unnamed: 0':'depth',
-                '[1, 1]':'1',
-                '[2, 2]':'2',
-                '[3, 3]':'3',
-                '[4, 4]':'4',
-                '[5, 5]':'5',
-                '[6, 6]':'6',
-                '[7, 7]':'7',
-                '[8, 8]':'8',
-                '[9, 9]':'9',
-                '[10, 10]':'10',
-                '[11, 11]':'11',
-                '[12, 12]':'12'           
-            } 
-        
-        df_clim.rename(columns=climRename, inplace=True)
-        clim_dict = df_clim.set_index('depth').to_dict()
-    else:
+
+    clim_dict = qc_lookup.climatology(refDes, ClimParam, inst_class=sensorType)
+    if len(clim_dict) == 0:
         print('error retriving climatology data')
-        clim_dict = {}
     
     return(grossRange_dict,clim_dict)
 
@@ -384,10 +332,7 @@ grossRange_dict, clim_dict
 # * Utilize direct assignment of the climatologyMin/Max values for each month on the dataset variable arrays. This again keeps the dataset out-of-memory.
 
 # +
-import dask.array as da
-import dask.dataframe as dd
 from dask.diagnostics import ProgressBar
-import ast
 
 def add_climatology_values(ds, param, clim_dict):
     """Adds climatology mins and maxes to the dataset timeseries
@@ -416,26 +361,21 @@ def add_climatology_values(ds, param, clim_dict):
     varNameMin = f"{param}_climatologyMin"
     varNameMax = f"{param}_climatologyMax"
     
-    # Next, pre-allocate an array with the data
-    ds[varNameMin] = ds[param].astype(float) * np.nan
-    ds[varNameMax] = ds[param].astype(float) * np.nan
-    
-    # Get the months
-    time = da.from_array(ds.time.dt.month)
-    months = np.unique(time).compute()
-    
-    # Add the climatology min and max based on the month of the measurement
-    for month in months:
-        climatology = ast.literal_eval(clim_dict[str(month)][str([0, 0])])
-        ds[varNameMin][(ds.time.dt.month == month)] = climatology[0]
-        ds[varNameMax][(ds.time.dt.month == month)] = climatology[1]
+    # Look up the climatology min and max from the month of each measurement
+    climatology = pd.DataFrame({
+        "tmax": np.arange(1, 13),
+        "zmin": 0,
+        "zmax": 0,
+    })
+    values = np.array(decode_column([clim_dict.get(str(month), {}).get(str([0, 0]), "[nan, nan]") for month in climatology["tmax"]]),
+                      dtype=float)
+    climatology["vmin"] = values[:, 0]
+    climatology["vmax"] = values[:, 1]
+    ds[varNameMin], ds[varNameMax] = expand_climatology(ds.time, climatology)
         
     return ds
 # +
-import dask.array as da
-import dask.dataframe as dd
 from dask.diagnostics import ProgressBar
-import ast
 
 def build_climatology_array(ds, clim_dict, press_param, param_name, platform):
     """Adds climatology mins and maxes to the dataset timeseries
@@ -462,43 +402,32 @@ def build_climatology_array(ds, clim_dict, press_param, param_name, platform):
         
     Note: Will need to add a pressure function to make this match the original functionality
     """
-    ds['climatologyMin'] = ds[param_name].astype('float') * np.nan
-    ds['climatologyMax'] = ds[param_name].astype('float') * np.nan
+    # Flatten the climatology table into (month, depth bracket) entries
+    entries = [(month, depth, value) for month, depths in clim_dict.items() for depth, value in depths.items()]
+    months, depths, values = zip(*entries)
+    depths = np.array(decode_column(depths), dtype=float)
+    values = np.array(decode_column(values), dtype=float)
+    climatology = pd.DataFrame({
+        "tmax": np.array(months, dtype=int),
+        "zmin": depths[:, 0],
+        "zmax": depths[:, 1],
+        "vmin": values[:, 0],
+        "vmax": values[:, 1],
+    })
     
-    # Get the months
-    time = da.from_array(ds.time.dt.month)
-    months = np.unique(time).compute()
+    # Look up the climatology min/max of every observation by its month (and
+    # pressure bracket for profilers) in one pass, lazily for dask-backed data
+    if platform == "profiler":
+        cmin, cmax = expand_climatology(ds.time, climatology, zvalues=ds[press_param])
+    elif platform == "fixed":
+        climatology = climatology[(climatology["zmin"] == 0) & (climatology["zmax"] == 0)]
+        cmin, cmax = expand_climatology(ds.time, climatology)
+    else:
+        cmin = ds[param_name].astype('float') * np.nan
+        cmax = ds[param_name].astype('float') * np.nan
+    ds['climatologyMin'] = cmin
+    ds['climatologyMax'] = cmax
     
-    # Iterate through the months
-    # This is the slow part - it takes 12*num_press_brackets*O(NlogN) time
-    for month in months:
-        # First, check if need to filter again by pressure
-        if platform == "profiler":
-            # Get the pressure dictionary for the given month
-            pres_dict = clim_dict.get(str(month))
-            for pressure_range in pres_dict.keys():
-                # Parse the pressure range
-                p = re.search(r'\[(.+),(.+)\]', pressure_range)
-                pmin, pmax = float(p.group(1)), float(p.group(2))
-                # Parse the climatology
-                climatology = pres_dict.get(pressure_range)
-                c = re.search(r'\[(.+),(.+)\]', climatology)
-                cmin, cmax = float(c.group(1)), float(c.group(2))
-                # Now assign the climatology min/max
-                ds["climatologyMin"][(ds.time.dt.month == month) &
-                                     (ds[press_param] >= pmin) & 
-                                     (ds[press_param] <= pmax)] = cmin
-                ds["climatologyMax"][(ds.time.dt.month == month) &
-                                     (ds[press_param] >= pmin)  &
-                                     (ds[press_param] <= pmax)] = cmax
-        elif platform == "fixed":
-            climatology = ast.literal_eval(clim_dict[str(month)][str([0, 0])])
-            cmin, cmax = climatology[0], climatology[1]
-            ds["climatologyMin"][(ds.time.dt.month == month)] = cmin
-            ds["climatologyMax"][(ds.time.dt.month == month)] = cmax
-        else:
-            pass
-        
     return ds
 
 
@@ -592,10 +521,9 @@ dev01_data = run_comparison(dev01_data, param)
 toy_data = run_comparison(toy_data, param)
 
 
-for x in production_data.practical_salinity_qartod_executed:
-    if x.values != '11' | x.values:
-        print(x.time.values)
-        print(x.values)
+summary, mismatches = diff_datasets(production_data, dev01_data, [f"{param}_qartod_executed"])
+for row in mismatches.itertuples():
+    print(f"{row.variable}: {row.count} mismatches from {row.start} to {row.end}")
 
 dev01_data.practical_salinity_qartod_executed.load()
 
@@ -606,7 +534,7 @@ production_data.practical_salinity_qartod_executed.where((production_data.practi
 
 production_data
 
-x.values.dtype == '<U2'
+production_data.practical_salinity_qartod_executed.dtype == '<U2'
 
 # ### Execute the comparison
 # So far, all the work we've done hasn't actually run any processing. Everything has been done as a set of dask instructions to execute when we call compute().
@@ -0,0 +1,194 @@
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+
+
+# QC flags of the OOINet annotation qcFlag values
+ANNOTATION_FLAGS = {
+    None: 0,
+    "pass": 1,
+    "not_evaluated": 2,
+    "suspect": 3,
+    "fail": 4,
+    "not_operational": 9,
+    "not_available": 9,
+    "pending_ingest": 9,
+}
+
+
+def load_annotations(refdes, fetch, cache_dir=None, max_age=None, refresh=False):
+    """Load the annotations of a reference designator, using the local cache if available.
+
+    Parameters
+    ----------
+    refdes: (str)
+        The reference designator, e.g. "GA01SUMO-RII11-02-CTDMOQ015"
+    fetch: (function)
+        The function which downloads the annotations for a reference designator,
+        e.g. OOINet.get_annotations
+    cache_dir: (str)
+        Directory to cache the annotations. Defaults to temp/annotations in the
+        current working directory
+    max_age: (float)
+        The maximum age of the cached annotations in seconds before they are fetched
+        again. Defaults to None, which uses the cached annotations regardless of age
+    refresh: (bool)
+        If True, always fetch the annotations and update the cache
+
+    Returns
+    -------
+    annotations: (pd.DataFrame)
+        The annotations of the reference designator
+    """
+    if cache_dir is None:
+        cache_dir = "/".join((os.getcwd(), "temp", "annotations"))
+    cache_file = "/".join((cache_dir, f"{refdes}.pkl"))
+
+    if not refresh and os.path.exists(cache_file):
+        age = time.time() - os.stat(cache_file).st_mtime
+        if max_age is None or age <= max_age:
+            with open(cache_file, "rb") as file:
+                return pickle.load(file)
+
+    annotations = fetch(refdes)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    with open(cache_file, "wb") as file:
+        pickle.dump(annotations, file)
+    return annotations
+
+
+def _to_ns(values, fill):
+    """Convert annotation times (epoch milliseconds or datetimes) to int64 nanoseconds"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values):
+        times = pd.to_datetime(values, unit="ms")
+    else:
+        times = pd.to_datetime(values)
+    ns = times.values.astype("datetime64[ns]").astype(np.int64)
+    return np.where(times.isna().values, fill, ns)
+
+
+class AnnotationIndex():
+    """An interval index of annotations for applying them to datasets.
+
+    The annotations are split by their (stream, parameter) scope, where a scope of
+    None applies to every stream or parameter. Within a scope, the annotation
+    intervals are stored as int64 arrays along with their QC flag, ordered from the
+    least to the most severe flag, so that writing each annotation's flag into its
+    searchsorted slice of the time index leaves the worst flag of any overlapping
+    annotations.
+
+    Parameters
+    ----------
+    annotations: (pd.DataFrame)
+        The annotations from OOINet, with beginDT, endDT, stream, parameters, and
+        qcFlag columns. Annotations without an endDT are open-ended
+    """
+
+    def __init__(self, annotations):
+        begin = _to_ns(annotations["beginDT"], np.iinfo(np.int64).min)
+        end = _to_ns(annotations["endDT"], np.iinfo(np.int64).max)
+        flags = [ANNOTATION_FLAGS.get(x if isinstance(x, str) else None, 0) for x in annotations["qcFlag"]]
+
+        scopes = {}
+        for b, e, flag, stream, parameters in zip(begin, end, flags, annotations["stream"], annotations["parameters"]):
+            stream = stream if isinstance(stream, str) and len(stream) > 0 else None
+            if parameters is None or (not isinstance(parameters, str) and len(parameters) == 0):
+                parameters = [None]
+            elif not isinstance(parameters, (list, tuple, np.ndarray)):
+                parameters = [parameters]
+            for parameter in parameters:
+                scopes.setdefault((stream, parameter), []).append((flag, b, e))
+
+        self.scopes = {}
+        for scope, intervals in scopes.items():
+            intervals = np.array(sorted(intervals), dtype=np.int64)
+            self.scopes[scope] = (intervals[:, 1], intervals[:, 2], intervals[:, 0].astype(np.uint8))
+
+    def _apply(self, scope, t, result):
+        """Write the flags of the annotations in a scope into the result"""
+        begin, end, flags = self.scopes[scope]
+        start = np.searchsorted(t, begin, side="left")
+        stop = np.searchsorted(t, end, side="right")
+        # The annotations are ordered by flag, so later (worse) flags overwrite earlier ones
+        scope_flags = np.zeros(len(t), dtype=np.uint8)
+        for i in np.flatnonzero(stop > start):
+            scope_flags[start[i]:stop[i]] = flags[i]
+        np.maximum(result, scope_flags, out=result)
+
+    def flags(self, time, stream=None, parameter=None):
+        """Return the worst annotation QC flag at each timestamp.
+
+        Parameters
+        ----------
+        time: (numpy.array)
+            The datetime64 timestamps of the dataset
+        stream: (str)
+            The stream of the dataset. Defaults to None, which only applies the
+            annotations which aren't stream-specific
+        parameter: (int or str)
+            The annotation parameter (PD number) to get the flags for. Defaults to
+            None, which applies the annotations of every parameter (the rollup)
+
+        Returns
+        -------
+        flags: (numpy.array)
+            The uint8 annotation QC flag of each timestamp, 0 where there are no annotations
+        """
+        t = np.asarray(time).astype("datetime64[ns]").astype(np.int64)
+        order = None
+        if len(t) > 1 and np.any(t[1:] < t[:-1]):
+            order = np.argsort(t, kind="stable")
+            t = t[order]
+
+        result = np.zeros(len(t), dtype=np.uint8)
+        for scope in self.scopes:
+            if scope[0] is not None and scope[0] != stream:
+                continue
+            if parameter is not None and scope[1] is not None and scope[1] != parameter:
+                continue
+            self._apply(scope, t, result)
+
+        if order is not None:
+            unsorted = np.empty_like(result)
+            unsorted[order] = result
+            result = unsorted
+        return result
+
+
+def add_annotation_flags(ds, annotations, stream=None, parameter_map={}):
+    """Add the annotation QC flags to a dataset.
+
+    Parameters
+    ----------
+    ds: (xarray.Dataset)
+        The dataset, with primary dimension "time"
+    annotations: (pd.DataFrame or AnnotationIndex)
+        The annotations of the dataset's reference designator
+    stream: (str)
+        The stream of the dataset. Defaults to the "stream" attribute of the dataset
+    parameter_map: (dict)
+        A mapping of the annotation parameters (PD numbers) to the dataset variable
+        names. A "{variable}_annotations_qc_results" flag is added for each variable
+
+    Returns
+    -------
+    ds: (xarray.Dataset)
+        The dataset with the "rollup_annotations_qc_results" of all of the annotations
+        and the flags of each mapped parameter
+    """
+    if not isinstance(annotations, AnnotationIndex):
+        annotations = AnnotationIndex(annotations)
+    if stream is None:
+        stream = ds.attrs.get("stream")
+
+    time = ds["time"].values
+    ds["rollup_annotations_qc_results"] = ("time", annotations.flags(time, stream=stream))
+    for parameter, variable in parameter_map.items():
+        if variable in ds.variables:
+            ds[f"{variable}_annotations_qc_results"] = ("time", annotations.flags(time, stream=stream,
+                                                                                  parameter=parameter))
+    return ds
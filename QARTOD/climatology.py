@@ -0,0 +1,524 @@
+import numpy as np
+import pandas as pd
+
+from qc_config import flatten_climatology
+from masking import resolve_mask
+from robust_stats import iqr_masks
+
+
+def harmonic_design(t, f=1/12):
+    """Build the two-cycle harmonic design matrix.
+
+    Parameters
+    ----------
+    t: (numpy.array)
+        The time steps (in months) to evaluate the harmonic at
+    f: (float)
+        The frequency of the annual cycle in cycles per time step
+
+    Returns
+    -------
+    X: (numpy.array)
+        The (len(t), 5) design matrix with columns for the constant and the
+        sin/cos terms of the one- and two-cycle harmonics
+    """
+    t = np.asarray(t, dtype=np.float64)
+    return np.column_stack([np.ones(t.shape), np.sin(2*np.pi*f*t), np.cos(2*np.pi*f*t),
+                            np.sin(4*np.pi*f*t), np.cos(4*np.pi*f*t)])
+
+
+def fit_harmonics(Y, months, f=1/12):
+    """Fit the two-cycle harmonic to many monthly-mean series which share a time axis.
+
+    The series are grouped by their pattern of missing (NaN) values, and every
+    group is solved with a single QR factorization of the design matrix, so
+    fitting hundreds of series costs about the same as fitting one.
+
+    Parameters
+    ----------
+    Y: (numpy.array)
+        The (time, series) array of monthly means, with NaNs where a series has
+        no data. A 1-d array is treated as a single series
+    months: (numpy.array)
+        The year-month of each time step, as datetime64
+    f: (float)
+        The frequency of the annual cycle in cycles per time step
+
+    Returns
+    -------
+    regression: (dict)
+        A dictionary containing the OLS-regression values for
+        * beta: the (series, 5) least-squares solutions
+        * residuals: the sum of the squared residuals of each series
+        * n: the number of monthly means fit for each series
+        * fitted: the (time, series) fitted values
+        * sigma: the (12, series) root-mean-square residual for each calendar month
+        Series with fewer monthly means than coefficients are NaN.
+    """
+    Y = np.asarray(Y, dtype=np.float64)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    X = harmonic_design(np.arange(Y.shape[0]), f=f)
+    mask = np.isfinite(Y)
+
+    beta = np.full((Y.shape[1], X.shape[1]), np.nan)
+    patterns, groups = np.unique(mask.T, axis=0, return_inverse=True)
+    for k, pattern in enumerate(patterns):
+        if pattern.sum() < X.shape[1]:
+            continue
+        cols = np.flatnonzero(np.ravel(groups) == k)
+        Q, R = np.linalg.qr(X[pattern])
+        beta[cols] = np.linalg.solve(R, Q.T @ Y[pattern][:, cols]).T
+
+    fitted = X @ beta.T
+    resid = np.where(mask, Y - fitted, 0)
+    calendar = np.asarray(months).astype("datetime64[M]").astype(np.int64) % 12
+    ss = np.zeros((12, Y.shape[1]))
+    n = np.zeros((12, Y.shape[1]))
+    np.add.at(ss, calendar, resid**2)
+    np.add.at(n, calendar, mask)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(ss / n)
+
+    return {
+        "beta": beta,
+        "residuals": np.where(np.isnan(beta[:, 0]), np.nan, (resid**2).sum(axis=0)),
+        "n": mask.sum(axis=0),
+        "fitted": fitted,
+        "sigma": sigma,
+    }
+
+
+def binned_moments(time, values, zvalues=None, zbins=None, mask=None, chunk_size=1000000):
+    """Bin observations by year-month and depth bracket and sum their moments.
+
+    The observations are read and binned chunk_size values at a time with
+    np.digitize and np.bincount, so memory is bounded by the chunk size and
+    the number of bins rather than the length of the record.
+
+    Parameters
+    ----------
+    time: (numpy.array or xarray.DataArray)
+        The datetime64 timestamps of the observations
+    values: (numpy.array or xarray.DataArray)
+        The observations
+    zvalues: (numpy.array or xarray.DataArray)
+        The depth or pressure of the observations. Defaults to None for a
+        fixed-depth record
+    zbins: (list)
+        The edges of the depth brackets, e.g. [0, 25, 50, 100]. Observations
+        outside of the brackets are dropped
+    mask: (numpy.array)
+        A boolean array of the observations to use. Defaults to None, to use all
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    months: (numpy.array)
+        The year-month of each time step as datetime64[M]
+    count: (numpy.array)
+        The (months, brackets) count of the observations
+    total: (numpy.array)
+        The (months, brackets) sum of the observations
+    squares: (numpy.array)
+        The (months, brackets) sum of the squared observations
+    """
+    tmin = np.asarray(time.min()).astype("datetime64[M]").astype(np.int64)
+    tmax = np.asarray(time.max()).astype("datetime64[M]").astype(np.int64)
+    nt = int(tmax - tmin) + 1
+    nz = 1 if zbins is None else len(zbins) - 1
+
+    count = np.zeros(nt*nz)
+    total = np.zeros(nt*nz)
+    squares = np.zeros(nt*nz)
+    for i in range(0, len(values), chunk_size):
+        x = np.asarray(values[i:i+chunk_size], dtype=np.float64)
+        t = np.asarray(time[i:i+chunk_size]).astype("datetime64[M]").astype(np.int64) - tmin
+        if zbins is None:
+            z = np.zeros(len(x), dtype=np.int64)
+        else:
+            z = np.digitize(np.asarray(zvalues[i:i+chunk_size], dtype=np.float64), zbins) - 1
+        good = np.isfinite(x) & (z >= 0) & (z < nz)
+        if mask is not None:
+            good &= mask[i:i+chunk_size]
+        bins = t[good]*nz + z[good]
+        x = x[good]
+        count += np.bincount(bins, minlength=nt*nz)
+        total += np.bincount(bins, weights=x, minlength=nt*nz)
+        squares += np.bincount(bins, weights=x**2, minlength=nt*nz)
+
+    months = np.arange(tmin, tmax + 1).astype("datetime64[M]")
+    return months, count.reshape(nt, nz), total.reshape(nt, nz), squares.reshape(nt, nz)
+
+
+def monthly_stats(months, fitted, count, total, squares):
+    """Calculate the calendar-month fit and standard deviation about the fit.
+
+    The standard deviation uses all of the observations of a calendar month with the
+    climatological fit as the expected value, expanding
+    sum((x - fit)^2) = sum(x^2) - 2*fit*sum(x) + n*fit^2 from the binned moments.
+
+    Parameters
+    ----------
+    months: (numpy.array)
+        The year-month of each time step, as datetime64[M]
+    fitted: (numpy.array)
+        The (months, series) fitted climatology
+    count, total, squares: (numpy.array)
+        The (months, series) binned moments from binned_moments
+
+    Returns
+    -------
+    monthly_fit: (numpy.array)
+        The (12, series) climatological expectation for each calendar month
+    monthly_std: (numpy.array)
+        The (12, series) standard deviation of the observations about the fit
+    """
+    deviations = np.where(count > 0, squares - 2*fitted*total + count*fitted**2, 0)
+    calendar = months.astype(np.int64) % 12
+    n = np.zeros((12, count.shape[1]))
+    ss = np.zeros((12, count.shape[1]))
+    fit = np.zeros((12, count.shape[1]))
+    nfit = np.zeros((12, 1))
+    np.add.at(n, calendar, count)
+    np.add.at(ss, calendar, deviations)
+    np.add.at(fit, calendar, fitted)
+    np.add.at(nfit, calendar, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return fit / nfit, np.sqrt(np.clip(ss, 0, None) / n)
+
+
+def make_config(monthly_fit, monthly_std, nstd, zspans=None):
+    """Build the climatology qcConfig from the calendar-month fit and standard deviations.
+
+    Parameters
+    ----------
+    monthly_fit: (pandas.Series or pandas.DataFrame)
+        The climatological expectation for each calendar month, with a column
+        for each depth bracket if zspans is given
+    monthly_std: (pandas.Series or pandas.DataFrame)
+        The standard deviation for each calendar month
+    nstd: (float)
+        The number of standard deviations for the climatology range
+    zspans: (list)
+        The [zmin, zmax] of each column. Defaults to None, for a fixed depth
+
+    Returns
+    -------
+    qcConfig: (dict)
+        The climatology qcConfig, with an entry for each calendar month (and
+        depth bracket) which has a fit
+    """
+    lower = np.atleast_2d(np.asarray(monthly_fit - nstd*monthly_std, dtype=np.float64).T)
+    upper = np.atleast_2d(np.asarray(monthly_fit + nstd*monthly_std, dtype=np.float64).T)
+    config = []
+    for k in range(lower.shape[0]):
+        for m in range(12):
+            if np.isnan(lower[k, m]) or np.isnan(upper[k, m]):
+                continue
+            entry = {"tspan": [m, m + 1]}
+            if zspans is not None:
+                entry["zspan"] = [float(zspans[k][0]), float(zspans[k][1])]
+            entry["vspan"] = [float(np.round(lower[k, m], 2)), float(np.round(upper[k, m], 2))]
+            entry["period"] = "month"
+            config.append(entry)
+    return {"qartod": {"climatology": {"config": config}}}
+
+
+class Climatology():
+    """Climatology for fixed-depth records.
+
+    The observations are binned by year-month, the two-cycle harmonic is fit to
+    the monthly means via OLS-regression, and the standard deviation for each
+    calendar month is calculated from the observations about the fitted
+    climatology. Use fit_climatologies to fit many parameters of a dataset at once.
+    """
+
+    def fit(self, ds, param, mask=None, iqr=None, chunk_size=1000000):
+        """Calculate the climatological fit and monthly standard deviations.
+
+        Parameters
+        ----------
+        ds: (xarray.DataSet or MaskedDataset)
+            DataSet of the original time series observations. Only the param
+            variable is read
+        param: (str)
+            A string corresponding to the variable in the DataSet to fit
+        mask: (numpy.array)
+            A boolean array of the observations to use, or an integer bitmask where
+            any set bit excludes the observation. Defaults to None, which uses all of
+            the observations (after the mask of a MaskedDataset)
+        iqr: (float)
+            If set, the outliers outside of (Q1 - iqr*IQR, Q3 + iqr*IQR) are removed
+            before fitting, e.g. 1.5. Defaults to None, which uses all of the observations
+        chunk_size: (int)
+            The number of observations to read at once
+
+        Attributes
+        ----------
+        fitted_data: (pandas.Series)
+            The climatological monthly expectation calculated from the
+            regression, indexed by the year-month
+        regression: (dict)
+            The OLS-regression values from fit_harmonics
+        monthly_fit: (pandas.Series)
+            The climatological expectation for each calendar month of a year
+        monthly_std: (pandas.Series)
+            The standard deviation of the observations about the fit for each
+            calendar month
+        sigma: (pandas.Series)
+            The monthly_std of each year-month, indexed like fitted_data
+        """
+        fit_climatologies(ds, [param], masks={param: mask}, iqr=iqr, chunk_size=chunk_size,
+                          climatologies={param: self})
+
+    def make_qcConfig(self, nstd=3):
+        """Build the climatology qcConfig from the fit +/- nstd standard deviations."""
+        self.qcConfig = make_config(self.monthly_fit, self.monthly_std, nstd)
+
+
+def fit_climatologies(ds, params, masks={}, iqr=None, chunk_size=1000000, climatologies=None):
+    """Fit the climatology of many parameters of a dataset at once.
+
+    Each parameter is binned by year-month in one pass over its observations, and
+    all of the parameters, which share the time axis of the dataset, are fit
+    with a single call to fit_harmonics.
+
+    Parameters
+    ----------
+    ds: (xarray.DataSet or MaskedDataset)
+        DataSet of the original time series observations
+    params: (list -> str)
+        The variables in the DataSet to fit
+    masks: (dict)
+        A boolean array (or integer bitmask) of the observations to use for each
+        parameter, combined with the mask of a MaskedDataset
+    iqr: (float)
+        If set, the outliers outside of (Q1 - iqr*IQR, Q3 + iqr*IQR) of each
+        parameter are removed before fitting. The fences of all of the parameters
+        are found in one scan of the dataset. Defaults to None
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    climatologies: (dict)
+        A Climatology object, fit and ready for make_qcConfig, for each parameter.
+        Empty if there are no parameters
+    """
+    if climatologies is None:
+        climatologies = {}
+    if len(params) == 0:
+        return climatologies
+    if iqr is not None:
+        masks = iqr_masks(ds, params, k=iqr, masks=masks, chunk_size=chunk_size)
+    moments = []
+    for param in params:
+        data, mask = resolve_mask(ds, masks.get(param))
+        moments.append(binned_moments(data["time"].data, data[param].data, mask=mask, chunk_size=chunk_size))
+    months = moments[0][0]
+    count = np.hstack([m[1] for m in moments])
+    total = np.hstack([m[2] for m in moments])
+    squares = np.hstack([m[3] for m in moments])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mu = total / count
+
+    regression = fit_harmonics(mu, months)
+    monthly_fit, monthly_std = monthly_stats(months, regression["fitted"], count, total, squares)
+
+    index = pd.DatetimeIndex(months.astype("datetime64[ns]"))
+    for k, param in enumerate(params):
+        climatology = climatologies.setdefault(param, Climatology())
+        climatology.param = param
+        climatology.regression = {
+            "beta": regression["beta"][k],
+            "residuals": regression["residuals"][k],
+            "n": regression["n"][k],
+            "sigma": regression["sigma"][:, k],
+        }
+        climatology.fitted_data = pd.Series(regression["fitted"][:, k], index=index)
+        climatology.monthly_fit = pd.Series(monthly_fit[:, k], index=np.arange(1, 13))
+        climatology.monthly_std = pd.Series(monthly_std[:, k], index=np.arange(1, 13))
+        climatology.sigma = pd.Series(climatology.monthly_std.loc[index.month].values, index=index)
+    return climatologies
+
+
+class DepthClimatology():
+    """Climatology for profilers, fit separately for each depth bracket.
+
+    The observations are binned by (year-month, depth bracket) in a single pass,
+    the two-cycle harmonic is fit to the monthly means of every bracket at once,
+    and the standard deviation for each calendar month and bracket is calculated
+    from the observations about the fitted climatology.
+
+    Parameters
+    ----------
+    zbins: (list)
+        The edges of the depth (pressure) brackets, e.g. [0, 25, 50, 100, 200]
+    """
+
+    def __init__(self, zbins):
+        self.zbins = np.asarray(zbins, dtype=np.float64)
+
+    def fit(self, ds, param, zinp, mask=None, chunk_size=1000000):
+        """Calculate the climatological fit and monthly standard deviations of each depth bracket.
+
+        Parameters
+        ----------
+        ds: (xarray.DataSet or MaskedDataset)
+            DataSet of the original time series observations
+        param: (str)
+            A string corresponding to the variable in the DataSet to fit
+        zinp: (str)
+            A string corresponding to the depth or pressure variable in the DataSet
+        mask: (numpy.array)
+            A boolean array of the observations to use, or an integer bitmask where
+            any set bit excludes the observation
+        chunk_size: (int)
+            The number of observations to read at once
+
+        Attributes
+        ----------
+        fitted_data: (pandas.DataFrame)
+            The climatological monthly expectation of each depth bracket,
+            indexed by the year-month
+        regression: (dict)
+            The OLS-regression values from fit_harmonics for each depth bracket
+        monthly_fit: (pandas.DataFrame)
+            The climatological expectation for each calendar month and depth bracket
+        monthly_std: (pandas.DataFrame)
+            The standard deviation of the observations about the climatological
+            fit for each calendar month and depth bracket
+        sigma: (pandas.DataFrame)
+            The monthly_std of each year-month, indexed like fitted_data
+        """
+        self.param = param
+        self.zinp = zinp
+
+        ds, mask = resolve_mask(ds, mask)
+        months, count, total, squares = binned_moments(ds["time"].data, ds[param].data, ds[zinp].data,
+                                                       zbins=self.zbins, mask=mask, chunk_size=chunk_size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mu = total / count
+
+        # Fit the harmonic to all of the depth brackets at once
+        self.regression = fit_harmonics(mu, months)
+        monthly_fit, monthly_std = monthly_stats(months, self.regression["fitted"], count, total, squares)
+
+        brackets = pd.IntervalIndex.from_breaks(self.zbins, closed="left")
+        index = pd.DatetimeIndex(months.astype("datetime64[ns]"))
+        self.fitted_data = pd.DataFrame(self.regression["fitted"], index=index, columns=brackets)
+        self.monthly_fit = pd.DataFrame(monthly_fit, index=np.arange(1, 13), columns=brackets)
+        self.monthly_std = pd.DataFrame(monthly_std, index=np.arange(1, 13), columns=brackets)
+        self.sigma = pd.DataFrame(self.monthly_std.loc[index.month].values, index=index, columns=brackets)
+
+    def make_qcConfig(self, nstd=3):
+        """Build the climatology qcConfig from the fit +/- nstd standard deviations of each depth bracket."""
+        zspans = [(bracket.left, bracket.right) for bracket in self.monthly_fit.columns]
+        self.qcConfig = make_config(self.monthly_fit, self.monthly_std, nstd, zspans=zspans)
+
+
+def climatology_lookup(climatology):
+    """Build the month (x depth bracket) lookup arrays of a climatology.
+
+    Parameters
+    ----------
+    climatology: (dict or pandas.DataFrame)
+        A climatology qcConfig, or a flattened climatology (see qc_config) with
+        tmax, zmin, zmax, vmin, and vmax columns. The month of each entry is the
+        end of its tspan, which covers both the [0, 1] and the [1, 1] conventions
+        for January
+
+    Returns
+    -------
+    vmin: (numpy.array)
+        The (12, brackets) lower climatology bound for each month and depth bracket
+    vmax: (numpy.array)
+        The (12, brackets) upper climatology bound for each month and depth bracket
+    zbins: (numpy.array)
+        The edges of the depth brackets, or None if the climatology doesn't vary with depth
+    """
+    if isinstance(climatology, dict):
+        climatology = flatten_climatology([climatology])
+    month = climatology["tmax"].values.astype(np.int64) - 1
+    zmin = climatology["zmin"].fillna(0).values
+    zmax = climatology["zmax"].fillna(0).values
+
+    if np.all(zmax <= zmin):
+        zbins = None
+        bracket = np.zeros(len(month), dtype=np.int64)
+        nz = 1
+    else:
+        zbins = np.unique(np.concatenate([zmin, zmax]))
+        bracket = np.searchsorted(zbins, zmin)
+        nz = len(zbins) - 1
+
+    vmin = np.full((12, nz), np.nan)
+    vmax = np.full((12, nz), np.nan)
+    vmin[month, bracket] = climatology["vmin"].values
+    vmax[month, bracket] = climatology["vmax"].values
+    return vmin, vmax, zbins
+
+
+def _lookup(time, zvalues, table, zbins):
+    """Index a (12, brackets) lookup table with the month and depth bracket of each observation"""
+    month = np.asarray(time).astype("datetime64[M]").astype(np.int64) % 12
+    if zbins is None:
+        return table[month, 0]
+    bracket = np.digitize(np.asarray(zvalues, dtype=np.float64), zbins) - 1
+    valid = (bracket >= 0) & (bracket < table.shape[1])
+    values = table[month, np.clip(bracket, 0, table.shape[1] - 1)]
+    return np.where(valid, values, np.nan)
+
+
+def expand_climatology(time, climatology, zvalues=None):
+    """Expand a climatology into the climatology bounds of each timestamp.
+
+    Builds the 12-month (or month x depth bracket) lookup arrays once and indexes
+    them directly with the month (and depth bracket) of every timestamp. Works for
+    any time index, from month ends to raw observation timestamps. Dask-backed
+    inputs are expanded lazily, chunk by chunk.
+
+    Parameters
+    ----------
+    time: (numpy.array, dask.array, or xarray.DataArray)
+        The datetime64 timestamps
+    climatology: (dict or pandas.DataFrame)
+        A climatology qcConfig or flattened climatology, see climatology_lookup
+    zvalues: (numpy.array, dask.array, or xarray.DataArray)
+        The depth or pressure at each timestamp, for a climatology with depth brackets
+
+    Returns
+    -------
+    vmin, vmax: (numpy.array, dask.array, or xarray.DataArray)
+        The lower and upper climatology bounds at each timestamp, NaN where the
+        climatology has no entry. Returned as the same type as the time (or zvalues)
+    """
+    vmin, vmax, zbins = climatology_lookup(climatology)
+
+    template = zvalues if zbins is not None and zvalues is not None else time
+    t = time.data if hasattr(time, "dims") else time
+    z = None
+    if zbins is not None:
+        z = zvalues.data if hasattr(zvalues, "dims") else zvalues
+
+    lazy = hasattr(t, "map_blocks") or hasattr(z, "map_blocks")
+    if lazy:
+        import dask.array as da
+        chunks = t.chunks if hasattr(t, "chunks") and hasattr(t, "map_blocks") else z.chunks
+        t = da.asarray(t).rechunk(chunks)
+        if z is not None:
+            z = da.asarray(z).rechunk(chunks)
+
+    results = []
+    for table in (vmin, vmax):
+        if lazy:
+            result = da.map_blocks(_lookup, t, z, table, zbins, dtype=np.float64)
+        else:
+            result = _lookup(t, z, table, zbins)
+        if hasattr(template, "dims"):
+            result = template.copy(data=result)
+            result.attrs = {}
+        results.append(result)
+    return results[0], results[1]
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+
+# The QARTOD flag for missing data, which missing flag values are compared as
+MISSING_FLAG = 9
+
+
+def is_flag(name):
+    """Return whether a variable holds QARTOD/QC flags, judged by its name"""
+    return "qartod" in name or "qc" in name or name.endswith("_flag")
+
+
+def align_times(a, b, tolerance="1s"):
+    """Match the times of two datasets to the nearest time within a tolerance.
+
+    Each time of a is matched to the nearest time of b. If several times of a
+    match the same time of b, only the closest is kept, so the matches are one
+    to one.
+
+    Parameters
+    ----------
+    a, b: (numpy.array)
+        The datetime64 times of the two datasets
+    tolerance: (str or numpy.timedelta64)
+        The largest time difference of a match, e.g. "1s"
+
+    Returns
+    -------
+    ia, ib: (numpy.array)
+        The indices of the matched times in a and b, in time order of a
+    """
+    a = np.asarray(a, dtype="datetime64[ns]").view(np.int64)
+    b = np.asarray(b, dtype="datetime64[ns]").view(np.int64)
+    tolerance = pd.Timedelta(tolerance).value
+    if len(a) == 0 or len(b) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    a_order = np.argsort(a, kind="stable")
+    b_order = np.argsort(b, kind="stable")
+    a, b = a[a_order], b[b_order]
+
+    # The nearest time of b on either side of each time of a
+    pos = np.searchsorted(b, a)
+    left = np.clip(pos - 1, 0, len(b) - 1)
+    right = np.clip(pos, 0, len(b) - 1)
+    dleft = np.abs(a - b[left])
+    dright = np.abs(b[right] - a)
+    ib = np.where(dright < dleft, right, left)
+    diff = np.minimum(dleft, dright)
+
+    ia = np.flatnonzero(diff <= tolerance)
+    ib, diff = ib[ia], diff[ia]
+
+    # Keep the closest time of a for each time of b
+    order = np.lexsort((diff, ib))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ib[order][1:] != ib[order][:-1]
+    keep = np.sort(order[first])
+    return a_order[ia[keep]], b_order[ib[keep]]
+
+
+def _normalize_flags(x):
+    """Return flags as comparable values: integers, with missing flags as MISSING_FLAG, or stripped strings"""
+    x = np.asarray(x)
+    if x.dtype.kind in "OSU":
+        x = np.array([v.decode() if isinstance(v, bytes) else ("" if v is None else str(v)) for v in x.ravel()],
+                     dtype=str).reshape(x.shape)
+        return np.char.strip(x)
+    if x.dtype.kind == "f":
+        x = np.where(np.isnan(x), MISSING_FLAG, x)
+    return x.astype(np.int64)
+
+
+def equal_values(x, y, flag=False, rtol=0, atol=0):
+    """Compare two arrays element by element, treating missing values as equal.
+
+    Parameters
+    ----------
+    x, y: (numpy.array)
+        The values to compare
+    flag: (boolean)
+        If True, the values are QARTOD flags. Numeric flags are compared as
+        integers, with missing (NaN) flags equal to the missing data flag (9),
+        and string flags (e.g. the tests executed) are compared after decoding
+        and stripping whitespace
+    rtol, atol: (float)
+        The relative and absolute tolerance of the comparison of float values
+
+    Returns
+    -------
+    equal: (numpy.array)
+        Boolean array, True where the values are the same
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    if flag:
+        x, y = _normalize_flags(x), _normalize_flags(y)
+        if x.dtype.kind != y.dtype.kind:
+            x, y = x.astype(str), y.astype(str)
+        return x == y
+    if x.dtype.kind in "fc" or y.dtype.kind in "fc":
+        return np.isclose(x, y, rtol=rtol, atol=atol, equal_nan=True)
+    if x.dtype.kind == "M" and y.dtype.kind == "M":
+        return (x == y) | (np.isnat(x) & np.isnat(y))
+    return x == y
+
+
+def _runs(mask):
+    """Return the start and end (inclusive) indices of the runs of True in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+def diff_datasets(a, b, variables=None, tolerance="1s", flags=None, rtol=0, atol=0, chunk_size=1000000):
+    """Compare the variables of two datasets, e.g. a production and a development
+    dataset, aligned on time.
+
+    The times of the datasets are matched within the tolerance, and the matched
+    observations are read and compared chunk by chunk, so a dask-backed dataset is
+    computed once per chunk rather than materialized whole. The mismatches of each
+    variable are run-length encoded into time ranges of consecutive mismatched
+    observations.
+
+    Parameters
+    ----------
+    a, b: (xarray.Dataset)
+        The datasets, with primary dimension "time"
+    variables: (list -> str)
+        The variables to compare. Defaults to all of the data variables along
+        time which are in both datasets
+    tolerance: (str or numpy.timedelta64)
+        The largest time difference of matched observations. Defaults to "1s"
+    flags: (list -> str)
+        The variables to compare as QARTOD flags. Defaults to the variables with
+        "qartod", "qc", or "_flag" in their name
+    rtol, atol: (float)
+        The relative and absolute tolerance of the comparison of float values
+    chunk_size: (int)
+        The number of matched observations to read at once
+
+    Returns
+    -------
+    summary: (pandas.DataFrame)
+        The number of observations "compared" and "mismatched" for each variable,
+        and the number of observations of each dataset without a match in the
+        other ("only_a", "only_b")
+    ranges: (pandas.DataFrame)
+        The "variable", "start" and "end" time (of dataset a), and "count" of each
+        run of mismatched observations
+    """
+    if variables is None:
+        variables = [var for var in a.data_vars if var in b.data_vars
+                     and "time" in a[var].dims and "time" in b[var].dims]
+    if flags is None:
+        flags = [var for var in variables if is_flag(var)]
+
+    a_time = a["time"].values
+    ia, ib = align_times(a_time, b["time"].values, tolerance=tolerance)
+    n = len(ia)
+
+    mismatched = dict.fromkeys(variables, 0)
+    runs = {var: [] for var in variables}
+    for i in range(0, n, chunk_size):
+        chunk_a = a[variables].isel(time=ia[i:i+chunk_size])
+        chunk_b = b[variables].isel(time=ib[i:i+chunk_size])
+        if chunk_a.chunks:
+            chunk_a = chunk_a.compute()
+        if chunk_b.chunks:
+            chunk_b = chunk_b.compute()
+        for var in variables:
+            x = chunk_a[var].transpose("time", ...).values
+            y = chunk_b[var].transpose("time", ...).values
+            equal = equal_values(x, y, flag=var in flags, rtol=rtol, atol=atol)
+            mismatch = ~equal.reshape(len(equal), -1).all(axis=1)
+            mismatched[var] += int(mismatch.sum())
+
+            # Join a run which continues across the chunk boundary
+            starts, ends = _runs(mismatch)
+            starts, ends = starts + i, ends + i
+            if len(starts) and runs[var] and runs[var][-1][1] == starts[0] - 1:
+                runs[var][-1][1] = ends[0]
+                starts, ends = starts[1:], ends[1:]
+            runs[var].extend([start, end] for start, end in zip(starts, ends))
+
+    summary = pd.DataFrame({
+        "compared": n,
+        "mismatched": pd.Series(mismatched),
+        "only_a": a.sizes["time"] - n,
+        "only_b": b.sizes["time"] - n
+    }, index=variables)
+    summary.index.name = "variable"
+
+    times = a_time[ia]
+    ranges = pd.DataFrame([(var, times[start], times[end], end - start + 1)
+                           for var in variables for start, end in runs[var]],
+                          columns=["variable", "start", "end", "count"])
+    return summary, ranges
@@ -0,0 +1,77 @@
+import numpy as np
+
+from masking import resolve_mask, masked_moments
+from robust_stats import iqr_masks
+
+
+class Gross_Range():
+    """Gross range test values for a parameter.
+
+    The fail span is set from the sensor limits, and the suspect span is calculated
+    from the historical data as the mean +/- sigma standard deviations, limited to
+    the fail span.
+
+    Parameters
+    ----------
+    fail_min: (float)
+        The minimum value the sensor can measure
+    fail_max: (float)
+        The maximum value the sensor can measure
+    """
+
+    def __init__(self, fail_min, fail_max):
+        self.fail_min = fail_min
+        self.fail_max = fail_max
+
+    def fit(self, ds, param, sigma=3, mask=None, iqr=None, chunk_size=1000000):
+        """Calculate the suspect span of a parameter.
+
+        Parameters
+        ----------
+        ds: (xarray.DataSet or MaskedDataset)
+            DataSet of the original time series observations. Only the param
+            variable is read
+        param: (str)
+            A string corresponding to the variable in the DataSet to fit
+        sigma: (float)
+            The number of standard deviations for the suspect span
+        mask: (numpy.array)
+            A boolean array of the observations to use, or an integer bitmask where
+            any set bit excludes the observation. Defaults to None, which uses all of
+            the observations (after the mask of a MaskedDataset)
+        iqr: (float)
+            If set, the outliers outside of (Q1 - iqr*IQR, Q3 + iqr*IQR) are removed
+            before fitting, e.g. 1.5. Defaults to None, which uses all of the observations
+        chunk_size: (int)
+            The number of observations to read at once
+
+        Attributes
+        ----------
+        mean, std: (float)
+            The mean and standard deviation of the observations
+        suspect_min, suspect_max: (float)
+            The suspect span of the parameter
+        """
+        if iqr is not None:
+            mask = iqr_masks(ds, [param], k=iqr, masks={param: mask}, chunk_size=chunk_size)[param]
+        ds, mask = resolve_mask(ds, mask)
+        n, self.mean, self.std = masked_moments(ds[param].data, mask=mask, chunk_size=chunk_size)
+        self.suspect_min = max(self.mean - sigma*self.std, self.fail_min)
+        self.suspect_max = min(self.mean + sigma*self.std, self.fail_max)
+
+    def make_qcConfig(self):
+        """Build the gross range qcConfig.
+
+        Attributes
+        ----------
+        qcConfig: (dict)
+            The gross range qcConfig with the suspect_span and fail_span
+        """
+        self.qcConfig = {
+            "qartod": {
+                "gross_range_test": {
+                    "suspect_span": [float(np.round(self.suspect_min, 2)), float(np.round(self.suspect_max, 2))],
+                    "fail_span": [self.fail_min, self.fail_max]
+                }
+            }
+        }
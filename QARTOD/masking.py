@@ -0,0 +1,142 @@
+import numpy as np
+
+
+class MaskedDataset():
+    """A view of a dataset with a mask of the observations to exclude.
+
+    Rather than dropping observations with ds.where(..., drop=True), which copies
+    every variable of the dataset for each filter, the excluded observations are
+    tracked in a uint32 bitmask along the time dimension, one bit for each reason
+    (e.g. "annotations", "suspect"). The fitting functions only read the variables
+    they need, chunk by chunk, and skip the masked observations. A filtered copy of
+    the dataset is only made on an explicit export.
+
+    Parameters
+    ----------
+    ds: (xarray.Dataset)
+        The dataset, with primary dimension "time"
+    """
+
+    def __init__(self, ds):
+        self.ds = ds
+        self.bitmask = np.zeros(ds.sizes["time"], dtype=np.uint32)
+        self.reasons = {}
+
+    def __getitem__(self, key):
+        return self.ds[key]
+
+    def bit(self, reason):
+        """Return the bit of the bitmask which records a reason"""
+        if reason not in self.reasons:
+            if len(self.reasons) == 32:
+                raise ValueError("No more than 32 reasons can be masked")
+            self.reasons[reason] = np.uint32(1 << len(self.reasons))
+        return self.reasons[reason]
+
+    def exclude(self, condition, reason):
+        """Mask the observations where the condition is True.
+
+        Parameters
+        ----------
+        condition: (numpy.array or xarray.DataArray)
+            A boolean array along the time dimension, True for the observations to exclude
+        reason: (str)
+            The name of the reason the observations are excluded, e.g. "annotations"
+        """
+        condition = np.asarray(condition, dtype=bool)
+        self.bitmask[condition] |= self.bit(reason)
+        return self
+
+    def mask(self, reasons=None, ignore=[]):
+        """Return the boolean mask of the observations to keep.
+
+        Parameters
+        ----------
+        reasons: (list)
+            The reasons to apply. Defaults to None, which applies all of the reasons
+        ignore: (list)
+            Reasons not to apply
+
+        Returns
+        -------
+        mask: (numpy.array)
+            A boolean array along the time dimension, True for the observations to keep
+        """
+        if reasons is None:
+            reasons = list(self.reasons)
+        bits = np.uint32(0)
+        for reason in reasons:
+            if reason in self.reasons and reason not in ignore:
+                bits |= self.reasons[reason]
+        return (self.bitmask & bits) == 0
+
+    def export(self, reasons=None):
+        """Return a copy of the dataset with the masked observations dropped"""
+        return self.ds.isel(time=np.flatnonzero(self.mask(reasons)))
+
+
+def resolve_mask(ds, mask=None):
+    """Resolve a dataset (or MaskedDataset) and mask into the dataset and a boolean mask.
+
+    Parameters
+    ----------
+    ds: (xarray.Dataset or MaskedDataset)
+        The dataset to fit
+    mask: (numpy.array)
+        A boolean array of the observations to keep, or an integer bitmask where any
+        set bit excludes the observation. Combined with the mask of a MaskedDataset
+
+    Returns
+    -------
+    ds: (xarray.Dataset)
+        The underlying dataset
+    mask: (numpy.array)
+        The boolean mask of the observations to keep, or None to keep all of them
+    """
+    if mask is not None:
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            mask = mask == 0
+    if isinstance(ds, MaskedDataset):
+        mask = ds.mask() if mask is None else mask & ds.mask()
+        ds = ds.ds
+    return ds, mask
+
+
+def masked_moments(values, mask=None, chunk_size=1000000):
+    """Return the count, mean, and standard deviation of the unmasked finite values.
+
+    Parameters
+    ----------
+    values: (numpy.array, dask.array, or xarray.DataArray)
+        The observations
+    mask: (numpy.array)
+        A boolean array of the observations to keep. Defaults to None, to keep all
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    n, mean, std: (float)
+        The number of observations, their mean, and their (population) standard deviation
+    """
+    n, total, shift, squares = 0, 0.0, None, 0.0
+    for i in range(0, len(values), chunk_size):
+        x = np.asarray(values[i:i+chunk_size], dtype=np.float64)
+        good = np.isfinite(x)
+        if mask is not None:
+            good &= mask[i:i+chunk_size]
+        x = x[good]
+        if len(x) == 0:
+            continue
+        # Shift by the first value to keep the sum of squares numerically stable
+        if shift is None:
+            shift = x[0]
+        x = x - shift
+        n += len(x)
+        total += x.sum()
+        squares += (x**2).sum()
+    if n == 0:
+        return 0, np.nan, np.nan
+    mean = total / n
+    return n, mean + shift, np.sqrt(max(squares / n - mean**2, 0))
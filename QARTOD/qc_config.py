@@ -0,0 +1,287 @@
+import os
+import re
+import ast
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+# Python-literal tokens in the qc-lookup tables and their json equivalents. The
+# string literals are matched first, so that the tokens are only replaced outside
+# of the strings
+_LITERALS = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|\b(None|nan|NaN|True|False)\b""")
+_JSON_LITERALS = {"None": "null", "nan": "NaN", "NaN": "NaN", "True": "true", "False": "false"}
+
+
+# Columns of the flattened qc-lookup tables
+KEY_COLUMNS = ["subsite", "node", "sensor", "stream"]
+GROSS_RANGE_COLUMNS = ["fail_min", "fail_max", "suspect_min", "suspect_max"]
+CLIMATOLOGY_COLUMNS = ["tmin", "tmax", "zmin", "zmax", "vmin", "vmax"]
+
+
+def _to_json(match):
+    """Rewrite a matched python string literal or token as json"""
+    token = match.group(0)
+    if match.group(1) is not None:
+        return _JSON_LITERALS[token]
+    if token[0] == '"':
+        return token
+    if '"' not in token and "\\" not in token:
+        return '"' + token[1:-1] + '"'
+    return json.dumps(ast.literal_eval(token))
+
+
+def _nan_to_none(match):
+    """Replace a matched nan token with None, leaving the string literals as they are"""
+    return "None" if match.group(0) == "nan" else match.group(0)
+
+
+def decode_column(values):
+    """Parse a column of qcConfig or parameters strings into dictionaries.
+
+    The whole column is rewritten from python-literal syntax to json and
+    decoded with a single json.loads call. Only the quotes of the strings and
+    the None, nan, True, and False tokens outside of the strings are rewritten,
+    so the contents of the strings are unchanged. If the column can't be
+    decoded in one pass (e.g. an entry uses a tuple), it falls back to parsing
+    the column row by row with ast.literal_eval.
+
+    Parameters
+    ----------
+    values: (list or pd.Series -> str)
+        The qcConfig or parameters strings loaded from a qc-lookup table
+
+    Returns
+    -------
+    decoded: (list -> dict)
+        The parsed entries, in the same order as the values. Empty or
+        missing entries are returned as None.
+    """
+    values = ["null" if not isinstance(x, str) or len(x.strip()) == 0 else x for x in values]
+    if len(values) == 0:
+        return []
+    text = "[" + ",".join(values) + "]"
+    text = _LITERALS.sub(_to_json, text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        decoded = []
+        for x in values:
+            x = _LITERALS.sub(_nan_to_none, x)
+            decoded.append(None if x == "null" else ast.literal_eval(x))
+        return decoded
+
+
+def _span(spans, i):
+    """Return the i-th bound of each [min, max] span as a float array"""
+    return np.array([float(x[i]) if x is not None and x[i] is not None else np.nan for x in spans],
+                    dtype=np.float64)
+
+
+def flatten_parameters(parameters):
+    """Flatten decoded parameters into inp, tinp, and zinp columns.
+
+    Parameters
+    ----------
+    parameters: (list -> dict)
+        The decoded parameters entries, e.g. {"inp": "practical_salinity", "tinp": "time", "zinp": None}
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        A dataframe with the inp, tinp, and zinp strings
+    """
+    parameters = [x if isinstance(x, dict) else {} for x in parameters]
+    return pd.DataFrame({
+        "inp": [x.get("inp") for x in parameters],
+        "tinp": [x.get("tinp") for x in parameters],
+        "zinp": [x.get("zinp") for x in parameters],
+    })
+
+
+def flatten_gross_range(qcConfigs):
+    """Flatten decoded gross range qcConfigs into numeric span columns.
+
+    Parameters
+    ----------
+    qcConfigs: (list -> dict)
+        The decoded gross range qcConfig entries, e.g.
+        {"qartod": {"gross_range_test": {"suspect_span": [1.21, 6.58], "fail_span": [0, 9]}}}
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        A dataframe with float columns fail_min, fail_max, suspect_min, and suspect_max
+    """
+    tests = [((x or {}).get("qartod") or {}).get("gross_range_test") or {} for x in qcConfigs]
+    fail = [x.get("fail_span") for x in tests]
+    suspect = [x.get("suspect_span") for x in tests]
+    return pd.DataFrame({
+        "fail_min": _span(fail, 0),
+        "fail_max": _span(fail, 1),
+        "suspect_min": _span(suspect, 0),
+        "suspect_max": _span(suspect, 1),
+    })
+
+
+def flatten_climatology(qcConfigs):
+    """Flatten decoded climatology qcConfigs into one row per config entry.
+
+    Parameters
+    ----------
+    qcConfigs: (list -> dict)
+        The decoded climatology qcConfig entries, e.g.
+        {"qartod": {"climatology": {"config": [{"tspan": [0, 1], "vspan": [2.97, 4.11], "period": "month"}, ...]}}}
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        A dataframe with the position of the source entry (row), the period, and
+        float columns tmin, tmax, zmin, zmax, vmin, and vmax. Entries without a
+        zspan have NaN depth bounds.
+    """
+    rows, period, tspan, zspan, vspan = [], [], [], [], []
+    for n, x in enumerate(qcConfigs):
+        config = (((x or {}).get("qartod") or {}).get("climatology") or {}).get("config") or []
+        for entry in config:
+            rows.append(n)
+            period.append(entry.get("period"))
+            tspan.append(entry.get("tspan"))
+            zspan.append(entry.get("zspan"))
+            vspan.append(entry.get("vspan"))
+    return pd.DataFrame({
+        "row": np.array(rows, dtype=np.int64),
+        "period": period,
+        "tmin": _span(tspan, 0),
+        "tmax": _span(tspan, 1),
+        "zmin": _span(zspan, 0),
+        "zmax": _span(zspan, 1),
+        "vmin": _span(vspan, 0),
+        "vmax": _span(vspan, 1),
+    })
+
+
+def flatten_climatology_table(table):
+    """Flatten a qc-lookup climatologyTable csv into one row per month and depth bracket.
+
+    The climatology tables are stored as a grid with the depth brackets ("[zmin, zmax]")
+    as the first column, the month spans ("[1, 1]", ..., "[12, 12]") as the remaining
+    column names, and the climatology "[vmin, vmax]" values as the entries.
+
+    Parameters
+    ----------
+    table: (pd.DataFrame)
+        The climatologyTable loaded into python as a pandas dataframe
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        A dataframe with float columns tmin, tmax, zmin, zmax, vmin, and vmax
+    """
+    depths = decode_column(table.iloc[:, 0].astype(str))
+    months = decode_column(list(table.columns[1:]))
+    values = decode_column(table.iloc[:, 1:].astype(str).values.ravel())
+    nz, nt = len(depths), len(months)
+    return pd.DataFrame({
+        "tmin": np.tile(_span(months, 0), nz),
+        "tmax": np.tile(_span(months, 1), nz),
+        "zmin": np.repeat(_span(depths, 0), nt),
+        "zmax": np.repeat(_span(depths, 1), nt),
+        "vmin": _span(values, 0),
+        "vmax": _span(values, 1),
+    })
+
+
+def flatten_table(table, kind):
+    """Flatten a gross range or climatology qc-lookup table into typed numeric columns.
+
+    Parameters
+    ----------
+    table: (pd.DataFrame)
+        The qc-lookup table with the raw parameters and qcConfig strings
+    kind: (str: "gross_range" or "climatology")
+        Which qartod test the table is for
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        The subsite, node, sensor, and stream key columns, the inp, tinp, and zinp
+        columns from the parameters, and the flattened qcConfig columns. A climatology
+        table has one row per config entry, and keeps the climatologyTable column
+        if the table references separate climatology tables.
+    """
+    keys = table[[col for col in KEY_COLUMNS if col in table.columns]].reset_index(drop=True)
+    if "parameters" in table.columns:
+        keys = pd.concat([keys, flatten_parameters(decode_column(table["parameters"]))], axis=1)
+    if "climatologyTable" in table.columns:
+        keys["climatologyTable"] = table["climatologyTable"].values
+
+    if "qcConfig" not in table.columns:
+        return keys
+
+    qcConfigs = decode_column(table["qcConfig"])
+    if kind == "gross_range":
+        return pd.concat([keys, flatten_gross_range(qcConfigs)], axis=1)
+    elif kind == "climatology":
+        config = flatten_climatology(qcConfigs)
+        df = keys.iloc[config["row"]].reset_index(drop=True)
+        return pd.concat([df, config.drop(columns="row")], axis=1)
+    else:
+        raise ValueError(f"Unknown qartod test {kind}")
+
+
+def file_hash(path):
+    """Return the sha256 hash of the contents of a file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_flat_table(path, kind, cache_dir=None):
+    """Load a flattened qc-lookup table, caching the result as parquet.
+
+    The flattened table is cached under the sha256 hash of the source csv, so a
+    table is only parsed again when its contents change.
+
+    Parameters
+    ----------
+    path: (str)
+        The path to the qc-lookup table csv (or climatologyTable csv)
+    kind: (str: "gross_range", "climatology", or "climatology_table")
+        Which type of qc-lookup table is being loaded
+    cache_dir: (str)
+        Directory to store the parquet files. Defaults to temp/qc_config in the
+        current working directory
+
+    Returns
+    -------
+    df: (pd.DataFrame)
+        The flattened qc-lookup table
+    """
+    if cache_dir is None:
+        cache_dir = "/".join((os.getcwd(), "temp", "qc_config"))
+    cache_file = "/".join((cache_dir, f"{file_hash(path)}_{kind}.parquet"))
+
+    try:
+        return pd.read_parquet(cache_file)
+    except (OSError, ImportError):
+        pass
+
+    table = pd.read_csv(path)
+    if kind == "climatology_table":
+        df = flatten_climatology_table(table)
+    else:
+        df = flatten_table(table, kind)
+
+    # The parquet cache is optional, it requires pyarrow or fastparquet
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        df.to_parquet(cache_file, index=False)
+    except (OSError, ImportError, ValueError):
+        pass
+
+    return df
@@ -0,0 +1,221 @@
+import os
+import json
+import requests
+import numpy as np
+import pandas as pd
+
+from qc_config import decode_column, load_flat_table
+
+
+# The qartod tables of the oceanobservatories qc-lookup repository
+QC_LOOKUP_URL = "https://raw.githubusercontent.com/oceanobservatories/qc-lookup/master/qartod/"
+
+
+class QCLookupMirror():
+    """A local mirror of the qc-lookup qartod tables.
+
+    Tables are synced from the qc-lookup repository into a local directory with
+    conditional requests (ETag/If-Modified-Since), so an unchanged table is
+    never downloaded twice. Each table is checked against the remote at most
+    once per session, and the gross range tables are flattened once per table
+    version (see load_flat_table) into an in-memory index. With offline=True, or when the remote can't
+    be reached, the tables are served from the local mirror.
+
+    Parameters
+    ----------
+    mirror_dir: (str)
+        Directory of the local mirror. Defaults to temp/qc_lookup in the current
+        working directory
+    base_url: (str)
+        The url of the qartod directory of the qc-lookup repository. Can point at
+        any server which serves the same directory layout, e.g. a local file server
+    offline: (bool)
+        If True, never make requests and only use the local mirror
+    session: (requests.Session)
+        The session to make requests with. Defaults to a new session
+    """
+
+    def __init__(self, mirror_dir=None, base_url=QC_LOOKUP_URL, offline=False, session=None):
+        if mirror_dir is None:
+            mirror_dir = "/".join((os.getcwd(), "temp", "qc_lookup"))
+        self.mirror_dir = mirror_dir
+        self.base_url = base_url.rstrip("/") + "/"
+        self.offline = offline
+        self.session = session if session is not None else requests.Session()
+        self.timeout = 30
+
+        # Sync validators (ETag/Last-Modified) for each mirrored table
+        self._validators_file = "/".join((self.mirror_dir, "validators.json"))
+        self._validators = {}
+        if os.path.exists(self._validators_file):
+            with open(self._validators_file) as file:
+                self._validators = json.load(file)
+
+        # Tables checked against the remote in this session, and the parsed tables
+        self._synced = set()
+        self._gross_range = {}
+        self._climatology = {}
+
+    def local_path(self, relpath):
+        """Return the path in the local mirror of a table in the qartod directory"""
+        return "/".join((self.mirror_dir, relpath))
+
+    def sync(self, relpath):
+        """Sync a single table into the local mirror.
+
+        Parameters
+        ----------
+        relpath: (str)
+            The path of the table relative to the qartod directory, e.g.
+            "ctdbp/ctdbp_qartod_gross_range_test_values.csv"
+
+        Returns
+        -------
+        path: (str)
+            The path of the table in the local mirror, or None if the table
+            doesn't exist in the qc-lookup repository or the local mirror
+        """
+        path = self.local_path(relpath)
+        if self.offline or relpath in self._synced:
+            return path if os.path.exists(path) else None
+
+        headers = {}
+        validators = self._validators.get(relpath, {})
+        if os.path.exists(path):
+            if validators.get("etag") is not None:
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified") is not None:
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        try:
+            response = self.session.get(self.base_url + relpath, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            # Remote not available, fall back to whatever has been mirrored
+            return path if os.path.exists(path) else None
+
+        self._synced.add(relpath)
+        if response.status_code == 304:
+            return path
+        elif response.status_code == 200:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(response.content)
+            self._validators[relpath] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            with open(self._validators_file, "w") as file:
+                json.dump(self._validators, file, indent=2)
+            return path
+        elif response.status_code == 404:
+            return None
+        else:
+            return path if os.path.exists(path) else None
+
+    def gross_range_index(self, inst_class):
+        """Load the gross range table for an instrument class into an index.
+
+        Parameters
+        ----------
+        inst_class: (str)
+            The instrument class, e.g. "ctdbp"
+
+        Returns
+        -------
+        index: (dict)
+            The gross range qcConfigs, rebuilt from the flattened suspect and fail
+            spans, keyed by (subsite, node, sensor, inp) and by (subsite, node,
+            sensor, stream, inp)
+        """
+        inst_class = inst_class.lower()
+        relpath = f"{inst_class}/{inst_class}_qartod_gross_range_test_values.csv"
+        path = self.sync(relpath)
+        if path is None:
+            return {}
+
+        mtime = os.stat(path).st_mtime
+        cached = self._gross_range.get(inst_class)
+        if cached is None or cached[0] != mtime:
+            table = load_flat_table(path, "gross_range", cache_dir="/".join((self.mirror_dir, "flat")))
+            index = {}
+            for row in table.itertuples(index=False):
+                qcConfig = {}
+                for span, lower, upper in (("suspect_span", row.suspect_min, row.suspect_max),
+                                           ("fail_span", row.fail_min, row.fail_max)):
+                    if not np.isnan(lower) or not np.isnan(upper):
+                        qcConfig[span] = [float(lower), float(upper)]
+                qcConfig = {"qartod": {"gross_range_test": qcConfig}}
+                # Keep the first entry for each key, as the tables are read top-down
+                index.setdefault((row.subsite, row.node, row.sensor, row.inp), qcConfig)
+                index.setdefault((row.subsite, row.node, row.sensor, row.stream, row.inp), qcConfig)
+            cached = (mtime, index)
+            self._gross_range[inst_class] = cached
+        return cached[1]
+
+    def gross_range(self, refdes, param, inst_class=None, stream=None):
+        """Return the gross range qcConfig for a reference designator and parameter.
+
+        Parameters
+        ----------
+        refdes: (str)
+            The reference designator, e.g. "CP01CNSM-RID27-03-CTDBPC000"
+        param: (str)
+            The parameter (inp) of the gross range test
+        inst_class: (str)
+            The instrument class. Defaults to the class parsed from the refdes
+        stream: (str)
+            The stream of the entry. Defaults to None, which matches any stream
+
+        Returns
+        -------
+        qcConfig: (dict)
+            The gross range qcConfig, or an empty dictionary if there is no entry
+        """
+        subsite, node, sensor = refdes.split("-", 2)
+        if inst_class is None:
+            inst_class = sensor.split("-")[-1][0:5]
+        index = self.gross_range_index(inst_class)
+        if stream is None:
+            key = (subsite, node, sensor, param)
+        else:
+            key = (subsite, node, sensor, stream, param)
+        return index.get(key, {})
+
+    def climatology(self, refdes, param, inst_class=None):
+        """Return the climatology table for a reference designator and parameter.
+
+        Parameters
+        ----------
+        refdes: (str)
+            The reference designator, e.g. "CP01CNSM-RID27-03-CTDBPC000"
+        param: (str)
+            The parameter name in the climatology table file name
+        inst_class: (str)
+            The instrument class. Defaults to the class parsed from the refdes
+
+        Returns
+        -------
+        clim_dict: (dict)
+            The climatology table as a dictionary of months ("1" - "12") with the
+            depth brackets (e.g. "[0, 0]") as keys and the "[vmin, vmax]" strings as
+            items, or an empty dictionary if there is no climatology table
+        """
+        if inst_class is None:
+            inst_class = refdes.split("-")[-1][0:5]
+        inst_class = inst_class.lower()
+        relpath = f"{inst_class}/climatology_tables/{refdes}-{param}.csv"
+        path = self.sync(relpath)
+        if path is None:
+            return {}
+
+        mtime = os.stat(path).st_mtime
+        cached = self._climatology.get(relpath)
+        if cached is None or cached[0] != mtime:
+            table = pd.read_csv(path)
+            table = table.rename(columns={table.columns[0]: "depth"})
+            # Rename the month spans "[1, 1]" ... "[12, 12]" to the month numbers
+            months = decode_column(list(table.columns[1:]))
+            table.columns = ["depth"] + [str(int(x[1])) for x in months]
+            cached = (mtime, table.set_index("depth").to_dict())
+            self._climatology[relpath] = cached
+        return cached[1]
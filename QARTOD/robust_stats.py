@@ -0,0 +1,178 @@
+import numpy as np
+
+from masking import resolve_mask
+
+
+def partition_quantiles(x, q):
+    """Return the quantiles of an array with a single partial sort.
+
+    The quantiles are linearly interpolated between the neighbouring order
+    statistics, the same as np.percentile(x, 100*q), but np.partition only has to
+    place the order statistics which are needed rather than sort the whole array.
+
+    Parameters
+    ----------
+    x: (numpy.array)
+        The finite values. The array is partitioned in place
+    q: (list -> float)
+        The quantiles to calculate, between 0 and 1
+
+    Returns
+    -------
+    quantiles: (numpy.array)
+        The value of each quantile, or NaN if there are no values
+    """
+    q = np.asarray(q, dtype=np.float64)
+    if len(x) == 0:
+        return np.full(q.shape, np.nan)
+    pos = q * (len(x) - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.ceil(pos).astype(int)
+    x.partition(np.unique(np.concatenate((lo, hi))))
+    return x[lo] + (pos - lo) * (x[hi] - x[lo])
+
+
+def collect_values(ds, params, masks={}, chunk_size=1000000):
+    """Collect the unmasked finite values of many parameters in one scan of a dataset.
+
+    The dataset is read chunk by chunk along the time dimension, loading all of
+    the parameters of a chunk together, so a dask-backed dataset is only computed
+    once per chunk.
+
+    Parameters
+    ----------
+    ds: (xarray.DataSet or MaskedDataset)
+        DataSet of the original time series observations
+    params: (list -> str)
+        The variables in the DataSet to collect
+    masks: (dict)
+        A boolean array (or integer bitmask) of the observations to use for each
+        parameter, combined with the mask of a MaskedDataset
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    values: (dict)
+        A float64 array of the values of each parameter
+    """
+    resolved = {param: resolve_mask(ds, masks.get(param))[1] for param in params}
+    ds, _ = resolve_mask(ds)
+
+    size = ds.sizes["time"]
+    buffers = {param: np.empty(size, dtype=np.float64) for param in params}
+    counts = dict.fromkeys(params, 0)
+    for i in range(0, size, chunk_size):
+        chunk = ds[params].isel(time=slice(i, i+chunk_size))
+        if chunk.chunks:
+            chunk = chunk.compute()
+        for param in params:
+            x = np.asarray(chunk[param].values, dtype=np.float64)
+            good = np.isfinite(x)
+            if resolved[param] is not None:
+                good &= resolved[param][i:i+chunk_size]
+            x = x[good]
+            buffers[param][counts[param]:counts[param]+len(x)] = x
+            counts[param] += len(x)
+    return {param: buffers[param][:counts[param]] for param in params}
+
+
+def iqr_fences(ds, params, k=1.5, masks={}, chunk_size=1000000):
+    """Calculate the interquartile range fences of many parameters of a dataset.
+
+    The values of all of the parameters are collected in one scan of the dataset,
+    and Q1 and Q3 of each parameter are found with a single np.partition.
+
+    Parameters
+    ----------
+    ds: (xarray.DataSet or MaskedDataset)
+        DataSet of the original time series observations
+    params: (list -> str)
+        The variables in the DataSet
+    k: (float)
+        The number of interquartile ranges beyond Q1 and Q3 for the fences
+    masks: (dict)
+        A boolean array (or integer bitmask) of the observations to use for each
+        parameter, combined with the mask of a MaskedDataset
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    fences: (dict)
+        The "Q1", "Q3", "IQR", "Qmin" (Q1 - k*IQR), and "Qmax" (Q3 + k*IQR) of
+        each parameter
+    """
+    fences = {}
+    for param, x in collect_values(ds, params, masks=masks, chunk_size=chunk_size).items():
+        Q1, Q3 = partition_quantiles(x, [0.25, 0.75])
+        IQR = Q3 - Q1
+        fences[param] = {
+            "Q1": Q1,
+            "Q3": Q3,
+            "IQR": IQR,
+            "Qmin": Q1 - k*IQR,
+            "Qmax": Q3 + k*IQR
+        }
+    return fences
+
+
+def fence_mask(values, fences, mask=None, chunk_size=1000000):
+    """Return the boolean mask of the observations within the IQR fences.
+
+    Parameters
+    ----------
+    values: (numpy.array, dask.array, or xarray.DataArray)
+        The observations
+    fences: (dict)
+        The fences of the parameter from iqr_fences
+    mask: (numpy.array)
+        A boolean array of the observations to keep, combined with the fences.
+        Defaults to None
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    mask: (numpy.array)
+        A boolean array, True for the observations to keep
+    """
+    keep = np.zeros(len(values), dtype=bool)
+    for i in range(0, len(values), chunk_size):
+        x = np.asarray(values[i:i+chunk_size], dtype=np.float64)
+        keep[i:i+chunk_size] = (x >= fences["Qmin"]) & (x <= fences["Qmax"])
+    if mask is not None:
+        keep &= mask
+    return keep
+
+
+def iqr_masks(ds, params, k=1.5, masks={}, chunk_size=1000000):
+    """Return the masks of many parameters with the IQR outliers removed.
+
+    Used by the gross range and climatology fits as an optional pre-filter.
+
+    Parameters
+    ----------
+    ds: (xarray.DataSet or MaskedDataset)
+        DataSet of the original time series observations
+    params: (list -> str)
+        The variables in the DataSet
+    k: (float)
+        The number of interquartile ranges beyond Q1 and Q3 for the fences
+    masks: (dict)
+        A boolean array (or integer bitmask) of the observations to use for each
+        parameter, combined with the mask of a MaskedDataset
+    chunk_size: (int)
+        The number of observations to read at once
+
+    Returns
+    -------
+    masks: (dict)
+        A boolean array of the observations to keep for each parameter
+    """
+    fences = iqr_fences(ds, params, k=k, masks=masks, chunk_size=chunk_size)
+    result = {}
+    for param in params:
+        data, mask = resolve_mask(ds, masks.get(param))
+        result[param] = fence_mask(data[param].data, fences[param], mask=mask, chunk_size=chunk_size)
+    return result
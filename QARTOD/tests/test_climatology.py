@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from climatology import Climatology, fit_climatologies
+from masking import MaskedDataset
+
+
+def seasonal_dataset(years=4, seed=0):
+    """Daily observations of an annual cycle with noise"""
+    time = pd.date_range("2015-01-01", periods=365*years, freq="D")
+    rng = np.random.default_rng(seed)
+    cycle = 10 + 5*np.sin(2*np.pi*time.dayofyear/365.25)
+    return xr.Dataset({
+        "sea_water_temperature": ("time", cycle + rng.normal(0, 0.5, len(time))),
+        "sea_water_conductivity": ("time", cycle/3 + rng.normal(0, 0.1, len(time))),
+    }, coords={"time": time})
+
+
+def test_fit_climatologies_without_parameters():
+    assert fit_climatologies(seasonal_dataset(), []) == {}
+
+
+def test_fit_climatologies_matches_single_fits():
+    ds = MaskedDataset(seasonal_dataset())
+    ds.exclude(ds["time"].dt.year == 2016, "annotations")
+    params = ["sea_water_temperature", "sea_water_conductivity"]
+
+    climatologies = fit_climatologies(ds, params, iqr=1.5)
+    for param in params:
+        single = Climatology()
+        single.fit(ds, param, iqr=1.5)
+        np.testing.assert_allclose(climatologies[param].monthly_fit, single.monthly_fit)
+        np.testing.assert_allclose(climatologies[param].monthly_std, single.monthly_std)
+
+    # The fit follows the annual cycle, peaking around April
+    monthly_fit = climatologies["sea_water_temperature"].monthly_fit
+    assert monthly_fit.idxmax() in (3, 4, 5)
+    assert (monthly_fit.max() - monthly_fit.min()) > 8
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import qc_config
+from qc_lookup import QCLookupMirror
+
+
+GROSS_RANGE = """subsite,node,sensor,stream,parameters,qcConfig,source,notes
+CP01CNSM,RID27,03-CTDBPC000,ctdbp_cdef_dcl_instrument,{'inp': 'practical_salinity'},"{'qartod': {'gross_range_test': {'suspect_span': [33.1, 36.2], 'fail_span': [0, 42]}}}",,
+CP01CNSM,RID27,03-CTDBPC000,ctdbp_cdef_dcl_instrument,{'inp': 'ctdbp_seawater_temperature'},"{'qartod': {'gross_range_test': {'suspect_span': [2.5, 25.1], 'fail_span': [-5, 35]}}}",,
+"""
+
+CLIMATOLOGY = ""","[1, 1]","[2, 2]"
+"[0, 10]","[33.2, 35.1]","[33.0, 35.3]"
+"""
+
+RELPATH = "ctdbp/ctdbp_qartod_gross_range_test_values.csv"
+
+
+class QCLookupHandler(SimpleHTTPRequestHandler):
+    """File server with ETag validators, which records the status of each request"""
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                etag = '"{}"'.format(hashlib.md5(file.read()).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return None
+            self.etag = etag
+        return super().send_head()
+
+    def end_headers(self):
+        if getattr(self, "etag", None) is not None:
+            self.send_header("ETag", self.etag)
+            self.etag = None
+        super().end_headers()
+
+    def send_response(self, code, message=None):
+        self.server.requests.append((self.path, code))
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Serve a qc-lookup qartod directory over http"""
+    root = tmp_path / "qartod"
+    (root / "ctdbp" / "climatology_tables").mkdir(parents=True)
+    (root / RELPATH).write_text(GROSS_RANGE)
+    (root / "ctdbp" / "climatology_tables" / "CP01CNSM-RID27-03-CTDBPC000-practical_salinity.csv").write_text(
+        CLIMATOLOGY)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QCLookupHandler, directory=str(root)))
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.root = root
+    server.url = "http://127.0.0.1:{}/".format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mirror(remote, tmp_path, **kwargs):
+    return QCLookupMirror(mirror_dir=str(tmp_path / "mirror"), base_url=remote.url, **kwargs)
+
+
+def test_sync_downloads_and_stores_validators(remote, tmp_path):
+    qc = mirror(remote, tmp_path)
+    path = qc.sync(RELPATH)
+
+    assert remote.requests == [("/" + RELPATH, 200)]
+    with open(path) as file:
+        assert file.read() == GROSS_RANGE
+    with open(qc._validators_file) as file:
+        validators = json.load(file)[RELPATH]
+    assert validators["etag"] is not None and validators["last_modified"] is not None
+
+    # Each table is only checked against the remote once per session
+    qc.sync(RELPATH)
+    assert len(remote.requests) == 1
+
+
+def test_unchanged_table_is_not_downloaded_again(remote, tmp_path):
+    mirror(remote, tmp_path).sync(RELPATH)
+
+    qc = mirror(remote, tmp_path)
+    path = qc.sync(RELPATH)
+    assert remote.requests[-1] == ("/" + RELPATH, 304)
+    with open(path) as file:
+        assert file.read() == GROSS_RANGE
+
+
+def test_changed_table_updates_the_mirror_and_validators(remote, tmp_path):
+    qc = mirror(remote, tmp_path)
+    qc.sync(RELPATH)
+    etag = qc._validators[RELPATH]["etag"]
+
+    updated = GROSS_RANGE.replace("[33.1, 36.2]", "[33.0, 36.5]")
+    (remote.root / RELPATH).write_text(updated)
+
+    qc = mirror(remote, tmp_path)
+    assert qc.gross_range("CP01CNSM-RID27-03-CTDBPC000", "practical_salinity") == \
+        {"qartod": {"gross_range_test": {"suspect_span": [33.0, 36.5], "fail_span": [0, 42]}}}
+    assert remote.requests[-1] == ("/" + RELPATH, 200)
+    with open(qc._validators_file) as file:
+        assert json.load(file)[RELPATH]["etag"] not in (None, etag)
+
+
+def test_offline_uses_the_mirror(remote, tmp_path):
+    mirror(remote, tmp_path).sync(RELPATH)
+    n = len(remote.requests)
+
+    qc = mirror(remote, tmp_path, offline=True)
+    assert qc.gross_range("CP01CNSM-RID27-03-CTDBPC000", "ctdbp_seawater_temperature",
+                          stream="ctdbp_cdef_dcl_instrument") == \
+        {"qartod": {"gross_range_test": {"suspect_span": [2.5, 25.1], "fail_span": [-5, 35]}}}
+    assert qc.climatology("CP01CNSM-RID27-03-CTDBPC000", "practical_salinity") == {}
+    assert len(remote.requests) == n
+
+
+def test_unreachable_remote_falls_back_to_the_mirror(remote, tmp_path):
+    qc = mirror(remote, tmp_path)
+    qc.sync(RELPATH)
+
+    remote.shutdown()
+    remote.server_close()
+    qc = mirror(remote, tmp_path)
+    assert qc.sync(RELPATH) == qc.local_path(RELPATH)
+    assert qc.sync("flort/flort_qartod_gross_range_test_values.csv") is None
+
+
+def test_climatology_and_missing_tables(remote, tmp_path):
+    qc = mirror(remote, tmp_path)
+    assert qc.climatology("CP01CNSM-RID27-03-CTDBPC000", "practical_salinity") == {
+        "1": {"[0, 10]": "[33.2, 35.1]"},
+        "2": {"[0, 10]": "[33.0, 35.3]"},
+    }
+    assert qc.gross_range("CP01CNSM-RID27-03-FLORTD000", "fluorometric_chlorophyll_a") == {}
+    assert remote.requests[-1] == ("/flort/flort_qartod_gross_range_test_values.csv", 404)
+
+
+def test_gross_range_table_is_flattened_once(remote, tmp_path, monkeypatch):
+    qc = mirror(remote, tmp_path)
+    qc.gross_range("CP01CNSM-RID27-03-CTDBPC000", "practical_salinity")
+    assert len(os.listdir(tmp_path / "mirror" / "flat")) == 1
+
+    # A new session reads the flattened table from the cache without decoding the strings
+    monkeypatch.setattr(qc_config, "flatten_table", lambda table, kind: pytest.fail("table decoded again"))
+    qc = mirror(remote, tmp_path, offline=True)
+    assert qc.gross_range("CP01CNSM-RID27-03-CTDBPC000", "practical_salinity") == \
+        {"qartod": {"gross_range_test": {"suspect_span": [33.1, 36.2], "fail_span": [0, 42]}}}
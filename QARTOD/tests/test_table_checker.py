@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "Entry_Checker")))
+import qc_config
+import table_checker
+from table_checker import check_entries_batch, load_table
+
+
+REFDES = "CP01CNSM-RID27-03-CTDBPC000"
+STREAM = "ctdbp_cdef_dcl_instrument"
+
+GROSS_RANGE = f"""subsite,node,sensor,stream,parameters,qcConfig,source,notes
+CP01CNSM,RID27,03-CTDBPC000,{STREAM},{{'inp': 'practical_salinity'}},"{{'qartod': {{'gross_range_test': {{'suspect_span': [33.1, 36.2], 'fail_span': [0, 42]}}}}}}",,
+CP01CNSM,RID27,03-CTDBPC000,{STREAM},{{'inp': 'practical_salinity'}},"{{'qartod': {{'gross_range_test': {{'suspect_span': [33.1, 36.2], 'fail_span': [0, 42]}}}}}}",,
+"""
+
+CLIMATOLOGY = f"""subsite,node,sensor,stream,parameters,climatologyTable,source,notes
+CP01CNSM,RID27,03-CTDBPC000,{STREAM},"{{'inp': 'practical_salinity', 'tinp': 'time', 'zinp': 'None'}}",climatology_tables/{REFDES}-practical_salinity.csv,,
+CP01CNSM,RID27,03-CTDBPC000,{STREAM},"{{'inp': 'ctdbp_seawater_temperature', 'tinp': 'time', 'zinp': 'None'}}",climatology_tables/{REFDES}-ctdbp_seawater_temperature.csv,,
+"""
+
+
+@pytest.fixture
+def lookup_dir(tmp_path, monkeypatch):
+    # The flattened tables are cached under temp/qc_config in the working directory
+    monkeypatch.chdir(tmp_path)
+    class_dir = tmp_path / "qartod" / "ctdbp"
+    (class_dir / "climatology_tables").mkdir(parents=True)
+    (class_dir / "ctdbp_qartod_gross_range_test_values.csv").write_text(GROSS_RANGE)
+    (class_dir / "ctdbp_qartod_climatology_test_values.csv").write_text(CLIMATOLOGY)
+    (class_dir / "climatology_tables" / f"{REFDES}-practical_salinity.csv").write_text("")
+    return str(tmp_path / "qartod")
+
+
+def test_check_entries_batch(lookup_dir):
+    entries = [(REFDES, STREAM, "practical_salinity"),
+               (REFDES, STREAM, "ctdbp_seawater_temperature"),
+               (REFDES, STREAM, "practical_salinity")]
+    results = check_entries_batch(entries, lookup_dir=lookup_dir).set_index(["test", "variable"])
+
+    # Each entry is checked once per test, however many times it is given
+    assert len(results) == 4 and results.index.is_unique
+    assert not results.loc[("gross_range", "practical_salinity"), "missing"]
+    assert results.loc[("gross_range", "ctdbp_seawater_temperature"), "missing"]
+    assert results.loc[("climatology", "practical_salinity"), ["missing", "tableExists", "tableKeyMatch"]].tolist() == \
+        [False, True, True]
+    assert results.loc[("climatology", "ctdbp_seawater_temperature"), ["missing", "tableExists"]].tolist() == \
+        [False, False]
+
+
+def test_load_table_flattens_the_table_once(lookup_dir, tmp_path, monkeypatch):
+    path = f"{lookup_dir}/ctdbp/ctdbp_qartod_gross_range_test_values.csv"
+    table = load_table(path, "gross_range")
+    assert table["inp"].tolist() == ["practical_salinity", "practical_salinity"]
+    assert table[["fail_min", "fail_max", "suspect_min", "suspect_max"]].values.tolist() == [[0, 42, 33.1, 36.2]] * 2
+    assert os.listdir(tmp_path / "temp" / "qc_config") == [f"{qc_config.file_hash(path)}_gross_range.parquet"]
+
+    # An unchanged table is read from the parquet cache without decoding the strings
+    monkeypatch.setattr(table_checker, "_table_cache", {})
+    monkeypatch.setattr(qc_config, "flatten_table", lambda table, kind: pytest.fail("table decoded again"))
+    assert load_table(path, "gross_range").equals(table)
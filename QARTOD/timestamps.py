@@ -0,0 +1,90 @@
+import numpy as np
+
+
+HOST_TIME_ATTRS = {
+    "long_name": "DCL Timestamp",
+    "comment": ("The timestamp that the instrument data as recorded by the mooring data "
+                "concentration logger (DCL)")
+}
+
+
+def to_datetime64(da, unit="s"):
+    """Convert a DataArray of integer timestamps to datetime64.
+
+    The whole array is cast with a single int64 -> datetime64 astype, which
+    stays lazy if the array is dask-backed. Fractional timestamps are
+    truncated to whole units and missing (NaN) timestamps become NaT.
+
+    Parameters
+    ----------
+    da: (xarray.DataArray)
+        The timestamps, as integer or float counts of the unit since 1970-01-01.
+        Timestamps which are already datetime64 are returned unchanged
+    unit: (str)
+        The numpy time unit of the timestamps. Defaults to "s"
+
+    Returns
+    -------
+    da: (xarray.DataArray)
+        The datetime64[ns] timestamps, with the attributes of the input
+    """
+    if np.issubdtype(da.dtype, np.datetime64):
+        return da
+    times = da.fillna(0).astype(np.int64).astype(f"datetime64[{unit}]").astype("datetime64[ns]")
+    if np.issubdtype(da.dtype, np.floating):
+        times = times.where(da.notnull())
+    times.attrs = da.attrs
+    return times
+
+
+def swap_timestamps(ds, timestamp="internal_timestamp", unit="s", host_name="host_time",
+                    host_attrs=HOST_TIME_ATTRS):
+    """Re-base a dataset from the host (DCL) timestamps to the instrument timestamps.
+
+    The instrument timestamps are converted in one cast, and become the time
+    dimension of the dataset, with the original time kept as a data variable.
+    Instrument clocks may step backwards or repeat samples, so if the new
+    times are not strictly increasing the dataset is sorted once by time, and
+    the duplicate and missing times are dropped, with a single index. The
+    function takes a single dataset, so it can be used as the preprocess of
+    xr.open_mfdataset.
+
+    Parameters
+    ----------
+    ds: (xarray.Dataset)
+        The dataset, with primary dimension "time"
+    timestamp: (str)
+        The name of the instrument timestamp variable. Defaults to "internal_timestamp"
+    unit: (str)
+        The numpy time unit of the instrument timestamps. Defaults to "s"
+    host_name: (str)
+        The name to keep the host timestamps under. Defaults to "host_time"
+    host_attrs: (dict)
+        The attributes of the host timestamps
+
+    Returns
+    -------
+    ds: (xarray.Dataset)
+        The dataset with the instrument timestamps as "time". Datasets without
+        the instrument timestamp variable are returned unchanged
+    """
+    if timestamp not in ds.variables:
+        return ds
+
+    ds = ds.assign({timestamp: to_datetime64(ds[timestamp], unit=unit)})
+    ds = ds.set_coords([timestamp])
+    ds = ds.swap_dims({"time": timestamp})
+    ds = ds.reset_coords("time")
+    ds = ds.rename_vars({"time": host_name})
+    ds[host_name].attrs = dict(host_attrs)
+    ds = ds.rename({timestamp: "time"})
+
+    # Sort once, dropping the repeated and missing timestamps, if necessary
+    times = ds["time"].values
+    if len(times) > 1 and not (times[1:] > times[:-1]).all():
+        order = np.argsort(times, kind="stable")
+        times = times[order]
+        keep = ~np.isnat(times)
+        keep[1:] &= times[1:] != times[:-1]
+        ds = ds.isel(time=order[keep])
+    return ds
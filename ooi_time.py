@@ -0,0 +1,158 @@
+"""
+Conversions between the OOI timestamps and numpy datetime64.
+
+OOINet reports the time of the data in seconds since the NTP epoch
+(1900-01-01) and the times of the asset management records (deployments,
+calibrations, annotations) in milliseconds since the unix epoch
+(1970-01-01). The conversions take and return whole arrays and are done
+with int64 nanoseconds, so they are exact for integer seconds and
+milliseconds, float timestamps keep microsecond resolution, and the
+times don't drift by the float rounding of the epoch offset.
+Missing values (None, NaN) are converted to NaT and back to NaN.
+"""
+import numpy as np
+
+
+# Seconds between the NTP epoch (1900-01-01) and the unix epoch (1970-01-01)
+NTP_DELTA = 2208988800
+
+NS_PER_SECOND = 1000000000
+NS_PER_MS = 1000000
+NS_PER_US = 1000
+
+
+def _to_ns(values, ns_per_unit, offset=0):
+    """
+    Convert numeric timestamps in some unit to int64 nanoseconds since the
+    unix epoch, with the mask of the missing values.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        ns = (values.astype(np.int64) - offset) * ns_per_unit
+        return ns, np.zeros(ns.shape, dtype=bool)
+
+    # Split floats into the whole units and the fraction, so that the whole
+    # units are scaled exactly and only the fraction is rounded. The fraction
+    # is rounded to microseconds, the resolution of a float64 NTP timestamp
+    values = values.astype(np.float64)
+    missing = np.isnan(values)
+    values = np.where(missing, 0, values)
+    whole = np.floor(values)
+    fraction = np.round((values - whole) * (ns_per_unit // NS_PER_US)).astype(np.int64) * NS_PER_US
+    ns = (whole.astype(np.int64) - offset) * ns_per_unit + fraction
+    return ns, missing
+
+
+def _from_ns(times, ns_per_unit, offset=0):
+    """
+    Convert datetime64 times to float timestamps in some unit, with NaN for NaT.
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    missing = np.isnat(times)
+    ns = times.view(np.int64)
+    whole, fraction = np.divmod(ns, ns_per_unit)
+    values = (whole + offset).astype(np.float64) + fraction / ns_per_unit
+    return np.where(missing, np.nan, values)[()]
+
+
+def _as_datetime64(ns, missing, floor=None):
+    if floor is not None:
+        step = np.timedelta64(1, floor).astype('timedelta64[ns]').view(np.int64)
+        ns = ns - ns % step
+    ns = np.where(missing, np.iinfo(np.int64).min, ns)
+    return ns.view('datetime64[ns]')[()]
+
+
+def ntp_to_datetime64(ntp_seconds, floor=None):
+    """
+    Convert OOI timestamps, in seconds since 1900-01-01, to datetime64.
+
+    Args:
+        ntp_seconds (array-like): the NTP timestamps
+        floor (str): optional numpy time unit to truncate the times to, e.g.
+            's' to drop the fractional seconds. Defaults to None, which keeps
+            the full nanosecond resolution.
+
+    Returns:
+        times (numpy.ndarray): the datetime64[ns] times, NaT where missing
+    """
+    ns, missing = _to_ns(ntp_seconds, NS_PER_SECOND, offset=NTP_DELTA)
+    return _as_datetime64(ns, missing, floor)
+
+
+def datetime64_to_ntp(times):
+    """
+    Convert datetime64 times to OOI timestamps in seconds since 1900-01-01.
+
+    Args:
+        times (array-like): the datetime64 times
+
+    Returns:
+        ntp_seconds (numpy.ndarray): the float NTP timestamps, NaN where missing
+    """
+    return _from_ns(times, NS_PER_SECOND, offset=NTP_DELTA)
+
+
+def ms_to_datetime64(ms, floor=None):
+    """
+    Convert OOINet asset management timestamps, in milliseconds since
+    1970-01-01, to datetime64.
+
+    Args:
+        ms (array-like): the millisecond timestamps, with None or NaN for
+            missing times, e.g. the eventStopTime of an active deployment
+        floor (str): optional numpy time unit to truncate the times to.
+            Defaults to None.
+
+    Returns:
+        times (numpy.ndarray): the datetime64[ns] times, NaT where missing
+    """
+    ns, missing = _to_ns(ms, NS_PER_MS)
+    return _as_datetime64(ns, missing, floor)
+
+
+def datetime64_to_ms(times):
+    """
+    Convert datetime64 times to OOINet asset management timestamps in
+    milliseconds since 1970-01-01.
+
+    Args:
+        times (array-like): the datetime64 times
+
+    Returns:
+        ms (numpy.ndarray): the int64 millisecond timestamps, or float with
+            NaN where missing if any of the times are NaT
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    if np.isnat(times).any():
+        return _from_ns(times, NS_PER_MS)
+    return (times.view(np.int64) // NS_PER_MS)[()]
+
+
+def ntp_to_ms(ntp_seconds):
+    """
+    Convert OOI timestamps in seconds since 1900-01-01 to milliseconds since
+    1970-01-01, e.g. for the beginDT and endDT of annotations.
+
+    Args:
+        ntp_seconds (array-like): the NTP timestamps
+
+    Returns:
+        ms (numpy.ndarray): the millisecond timestamps
+    """
+    return datetime64_to_ms(ntp_to_datetime64(ntp_seconds))
+
+
+def ms_to_ntp(ms):
+    """
+    Convert milliseconds since 1970-01-01 to OOI timestamps in seconds since
+    1900-01-01.
+
+    Args:
+        ms (array-like): the millisecond timestamps
+
+    Returns:
+        ntp_seconds (numpy.ndarray): the float NTP timestamps
+    """
+    return datetime64_to_ntp(ms_to_datetime64(ms))
+
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The shared modules at the root of the repository are imported from the root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from ooi_time import (NTP_DELTA, datetime64_to_ms, datetime64_to_ntp, ms_to_datetime64,
+                      ms_to_ntp, ntp_to_datetime64, ntp_to_ms)
+
+
+def random_ms(n=10000, seed=0):
+    """Random millisecond timestamps between 2000 and 2030"""
+    rng = np.random.default_rng(seed)
+    return rng.integers(946684800000, 1893456000000, size=n, dtype=np.int64)
+
+
+def test_ms_to_datetime64_matches_pandas():
+    ms = random_ms()
+    times = ms_to_datetime64(ms)
+    assert times.dtype == np.dtype("datetime64[ns]")
+    np.testing.assert_array_equal(times, pd.to_datetime(ms, unit="ms").values)
+
+
+def test_ms_round_trip():
+    ms = random_ms()
+    result = datetime64_to_ms(ms_to_datetime64(ms))
+    assert result.dtype == np.int64
+    np.testing.assert_array_equal(result, ms)
+
+
+def test_ntp_to_datetime64_integer_seconds():
+    seconds = random_ms() // 1000
+    times = ntp_to_datetime64(seconds + NTP_DELTA)
+    np.testing.assert_array_equal(times, pd.to_datetime(seconds, unit="s").values)
+    np.testing.assert_array_equal(datetime64_to_ntp(times), seconds + NTP_DELTA)
+
+
+def test_ntp_round_trip_float_seconds():
+    # NTP timestamps with millisecond fractions, as OOINet returns them
+    ntp = (random_ms() + NTP_DELTA * 1000) / 1000
+    times = ntp_to_datetime64(ntp)
+    np.testing.assert_array_equal(times, pd.to_datetime(random_ms(), unit="ms").values)
+    np.testing.assert_array_equal(datetime64_to_ntp(times), ntp)
+
+
+def test_ntp_floor_drops_fractional_seconds():
+    ntp = np.array([3688416000.75, 3688416001.25])
+    times = ntp_to_datetime64(ntp, floor="s")
+    expected = np.array(["2016-11-18T00:00:00", "2016-11-18T00:00:01"], dtype="datetime64[ns]")
+    np.testing.assert_array_equal(times, expected)
+
+
+def test_ntp_ms_round_trip():
+    ms = random_ms()
+    np.testing.assert_array_equal(ntp_to_ms(ms_to_ntp(ms)), ms)
+    np.testing.assert_allclose(ms_to_ntp(ms), ms / 1000 + NTP_DELTA, rtol=0, atol=1e-6)
+
+
+def test_missing_times():
+    ms = pd.Series([1479859200000, None, np.nan], dtype=object)
+    times = ms_to_datetime64(ms.astype(float))
+    assert times[0] == np.datetime64("2016-11-23T00:00:00")
+    assert np.isnat(times[1:]).all()
+
+    assert np.isnat(ntp_to_datetime64(np.array([np.nan]))).all()
+
+    result = datetime64_to_ms(times)
+    assert result[0] == 1479859200000
+    assert np.isnan(result[1:]).all()
+    assert np.isnan(datetime64_to_ntp(times)[1:]).all()
+
+
+def test_scalar_input():
+    time = ms_to_datetime64(1479859200000)
+    assert isinstance(time, np.datetime64)
+    assert time == np.datetime64("2016-11-23T00:00:00")
+
+    assert datetime64_to_ms(time) == 1479859200000
+    assert ntp_to_datetime64(1479859200 + NTP_DELTA) == time
+    assert datetime64_to_ntp(time) == 1479859200 + NTP_DELTA
+    assert ntp_to_ms(1479859200.5 + NTP_DELTA) == 1479859200500
+    assert np.isnat(ms_to_datetime64(np.nan))
+    assert np.isnan(datetime64_to_ms(np.datetime64("NaT")))